@@ -0,0 +1,66 @@
+from collections import OrderedDict
+from typing import Hashable, Optional
+import os
+
+from fastapi import Response
+
+# Сколько сериализованных ответов хранить в памяти процесса
+HATM_CACHE_SIZE = int(os.getenv("HATM_CACHE_SIZE", "2000"))
+
+
+class PayloadCache:
+    """
+    LRU-кэш сериализованных JSON-ответов.
+    Ключ содержит версию объекта, поэтому явная инвалидация не нужна:
+    после изменения запрашивается новый ключ, а старые записи вытесняются.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Hashable, bytes]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        payload = self._entries.get(key)
+        if payload is not None:
+            self._entries.move_to_end(key)
+        return payload
+
+    def set(self, key: Hashable, payload: bytes) -> None:
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = payload
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+hatm_payload_cache = PayloadCache(HATM_CACHE_SIZE)
+
+
+def make_etag(kind: str, object_id: int, version: int) -> str:
+    return f'"{kind}-{object_id}-{version}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Проверить заголовок If-None-Match (список ETag, допускаются W/ и *)"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def cached_json_response(payload: Optional[bytes], etag: str) -> Response:
+    """
+    Ответ с ETag: payload=None означает 304 Not Modified.
+    no-cache заставляет клиента каждый раз перепроверять версию.
+    """
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if payload is None:
+        return Response(status_code=304, headers=headers)
+    return Response(content=payload, media_type="application/json", headers=headers)
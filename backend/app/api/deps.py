@@ -1,18 +1,23 @@
 from fastapi import Depends, HTTPException, Header
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+from collections import OrderedDict
+from functools import lru_cache
 import hashlib
 import hmac
 import json
+import re
+import time
 from urllib.parse import parse_qsl
 import os
-from typing import Optional
+from typing import Optional, Tuple
 
-from app.database import get_db
+from app.database import after_commit, get_db
 from app.services import UserService, GroupService, HatmService, JuzService
 from app.models.models import User
 
 
-def get_user_service(db: Session = Depends(get_db)) -> UserService:
+def get_user_service(db: AsyncSession = Depends(get_db)) -> UserService:
     return UserService(db)
 
 
@@ -22,23 +27,78 @@ def get_notification_service():
     return get_ns()
 
 
-def get_group_service(db: Session = Depends(get_db)) -> GroupService:
+def get_group_service(db: AsyncSession = Depends(get_db)) -> GroupService:
     return GroupService(db)
 
 
-def get_hatm_service(db: Session = Depends(get_db)) -> HatmService:
+def get_hatm_service(db: AsyncSession = Depends(get_db)) -> HatmService:
     return HatmService(db)
 
 
-def get_juz_service(db: Session = Depends(get_db)) -> JuzService:
+def get_juz_service(db: AsyncSession = Depends(get_db)) -> JuzService:
     return JuzService(db)
 
 
-def validate_telegram_data(init_data: str) -> dict:
+# Кэш проверенных init data: повторные запросы с теми же данными
+# не пересчитывают HMAC и не ходят в базу за пользователем
+INIT_DATA_CACHE_SIZE = int(os.getenv("INIT_DATA_CACHE_SIZE", "10000"))
+INIT_DATA_CACHE_TTL = int(os.getenv("INIT_DATA_CACHE_TTL", "3600"))
+# Init data старше этого возраста (по auth_date) не кэшируется
+INIT_DATA_MAX_AGE = int(os.getenv("INIT_DATA_MAX_AGE", "86400"))
+
+_HASH_RE = re.compile(r"(?:^|&)hash=([0-9a-fA-F]+)(?:&|$)")
+
+
+class InitDataCache:
     """
-    Валидация данных от Telegram Mini App.
-    Возвращает словарь с данными пользователя если валидация успешна.
+    Ограниченный LRU-кэш с TTL: hash из init data -> снимок пользователя.
+    Вместе с hash хранится сама строка init data, поэтому запись
+    выдаётся только для точно такой же строки.
     """
+
+    def __init__(self, maxsize: int, ttl: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[str, float, dict]]" = OrderedDict()
+
+    def get(self, key: str, init_data: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        cached_init_data, expires_at, user_fields = entry
+        if expires_at <= time.time() or not hmac.compare_digest(cached_init_data, init_data):
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return user_fields
+
+    def set(self, key: str, init_data: str, user_fields: dict, auth_date: int) -> None:
+        expires_at = min(time.time() + self.ttl, auth_date + INIT_DATA_MAX_AGE)
+        if self.maxsize <= 0 or expires_at <= time.time():
+            return
+
+        self._entries[key] = (init_data, expires_at, user_fields)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+init_data_cache = InitDataCache(INIT_DATA_CACHE_SIZE, INIT_DATA_CACHE_TTL)
+
+
+@lru_cache(maxsize=4)
+def _get_secret_key(bot_token: str) -> bytes:
+    """Secret key зависит только от токена бота - считаем один раз"""
+    return hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+
+
+def _validate_init_data(init_data: str) -> Tuple[dict, int]:
+    """Проверить подпись init data. Возвращает (данные пользователя, auth_date)"""
     bot_token = os.getenv("BOT_TOKEN", "")
 
     # Парсим init_data
@@ -54,14 +114,9 @@ def validate_telegram_data(init_data: str) -> dict:
         f"{key}={value}" for key, value in sorted(parsed_data.items())
     )
 
-    # Создаем secret key
-    secret_key = hmac.new(
-        b"WebAppData", bot_token.encode(), hashlib.sha256
-    ).digest()
-
     # Вычисляем hash
     calculated_hash = hmac.new(
-        secret_key, data_check_string.encode(), hashlib.sha256
+        _get_secret_key(bot_token), data_check_string.encode(), hashlib.sha256
     ).hexdigest()
 
     # Сравниваем hash (в dev режиме можно пропустить проверку)
@@ -72,14 +127,37 @@ def validate_telegram_data(init_data: str) -> dict:
     # Парсим данные пользователя
     if "user" in parsed_data:
         user_data = json.loads(parsed_data["user"])
-        return user_data
+        try:
+            auth_date = int(parsed_data.get("auth_date", 0))
+        except ValueError:
+            auth_date = 0
+        return user_data, auth_date
 
     raise HTTPException(status_code=401, detail="Отсутствуют данные пользователя")
 
 
+def validate_telegram_data(init_data: str) -> dict:
+    """
+    Валидация данных от Telegram Mini App.
+    Возвращает словарь с данными пользователя если валидация успешна.
+    """
+    user_data, _ = _validate_init_data(init_data)
+    return user_data
+
+
+def _user_fields(user: User) -> dict:
+    return {
+        "id": user.id,
+        "telegram_id": user.telegram_id,
+        "username": user.username,
+        "first_name": user.first_name,
+        "created_at": user.created_at,
+    }
+
+
 async def get_current_user(
     x_telegram_init_data: str = Header(None, alias="X-Telegram-Init-Data"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> User:
     """
     Получить текущего пользователя из Telegram Init Data.
@@ -87,8 +165,18 @@ async def get_current_user(
     if not x_telegram_init_data:
         raise HTTPException(status_code=401, detail="Требуется авторизация через Telegram")
 
+    match = _HASH_RE.search(x_telegram_init_data)
+    cache_key = match.group(1) if match else None
+    if cache_key:
+        user_fields = init_data_cache.get(cache_key, x_telegram_init_data)
+        if user_fields is not None:
+            # Присоединяем снимок к сессии без SELECT (merge с load=False)
+            user = User(**user_fields)
+            make_transient_to_detached(user)
+            return await db.merge(user, load=False)
+
     try:
-        user_data = validate_telegram_data(x_telegram_init_data)
+        user_data, auth_date = _validate_init_data(x_telegram_init_data)
     except HTTPException:
         raise
     except Exception:
@@ -99,10 +187,16 @@ async def get_current_user(
         raise HTTPException(status_code=401, detail="Отсутствует ID пользователя")
 
     user_service = UserService(db)
-    user = user_service.get_or_create(
+    user = await user_service.get_or_create(
         telegram_id=telegram_id,
         username=user_data.get("username"),
         first_name=user_data.get("first_name")
     )
 
+    if cache_key:
+        # Снимок кэшируется после commit запроса: созданный в этом запросе
+        # пользователь при откате не должен остаться в кэше
+        user_fields = _user_fields(user)
+        after_commit(db, lambda: init_data_cache.set(cache_key, x_telegram_init_data, user_fields, auth_date))
+
     return user
@@ -0,0 +1,54 @@
+# Keyset-пагинация: непрозрачный курсор с ключом сортировки последней строки страницы
+import base64
+import json
+import os
+from datetime import datetime
+from typing import Callable, List, Optional, Sequence, Tuple, TypeVar
+
+from fastapi import HTTPException, Query
+
+# Размер страницы истории по умолчанию и максимальный
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "200"))
+
+# Заголовок с курсором следующей страницы для ответов-списков (тело остаётся списком)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+T = TypeVar("T")
+
+
+def encode_cursor(*values) -> str:
+    """Курсор из значений ключа (datetime, int, None)"""
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    """Разобрать курсор (datetime или None, id); 400 при подделанном или устаревшем курсоре"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        moment, row_id = json.loads(raw)
+        return (datetime.fromisoformat(moment) if moment is not None else None), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+
+
+class PageParams:
+    """Параметры ?limit=&cursor= для Depends"""
+
+    def __init__(
+        self,
+        limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = Query(None)
+    ):
+        self.limit = limit
+        self.after = decode_cursor(cursor) if cursor else None
+
+    def page(self, rows: Sequence[T], key: Callable[[T], tuple]) -> Tuple[List[T], Optional[str]]:
+        """
+        Сервис запрашивается с limit + 1: лишняя строка означает, что есть
+        следующая страница, и курсор строится по последней строке этой.
+        """
+        items = list(rows[:self.limit])
+        next_cursor = encode_cursor(*key(items[-1])) if len(rows) > self.limit else None
+        return items, next_cursor
@@ -0,0 +1,29 @@
+# Быстрая сериализация JSON: orjson вместо stdlib и ответы без повторной валидации
+from typing import Any
+
+from fastapi.responses import ORJSONResponse
+from pydantic_core import to_json
+
+__all__ = ["ORJSONResponse", "PrebuiltJSONResponse", "dump_json"]
+
+
+def dump_json(content: Any) -> bytes:
+    """
+    JSON из уже собранных схем ответа (моделей, списков и словарей с ними).
+    Сериализатор pydantic (Rust) по готовой модели быстрее, чем model_dump + orjson,
+    и даёт тот же формат, что и response_model.
+    """
+    return to_json(content)
+
+
+class PrebuiltJSONResponse(ORJSONResponse):
+    """
+    Ответ для горячих маршрутов: содержимое - уже собранные схемы ответа (или готовые байты).
+    FastAPI не обрабатывает response_model для возвращённого Response, поэтому второй
+    проход валидации и jsonable-сериализация пропускаются; response_model остаётся для OpenAPI.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dump_json(content)
@@ -1,23 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Header, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 
 from app.database import get_db
+from app.api.pagination import NEXT_CURSOR_HEADER, PageParams
+from app.api.responses import PrebuiltJSONResponse, dump_json
+from app.api.cache import hatm_payload_cache, make_etag, etag_matches, cached_json_response
+from app.realtime import event_stream, hatm_topic, group_topic
 from app.api.deps import (
     get_current_user,
     get_group_service,
     get_hatm_service,
-    get_juz_service,
-    get_user_service,
-    get_notification_service
+    get_juz_service
 )
-from app.models.models import User, HatmStatus, JuzAssignment
+from app.models.models import User, Hatm, HatmStatus
 from app.schemas.schemas import (
     GroupCreate, GroupResponse, GroupDetailResponse, GroupJoinRequest,
     HatmCreate, HatmResponse, HatmDetailResponse, HatmProgress,
     JuzResponse, UserJuzStats, UserDebtResponse, MemberResponse
 )
-from app.services import GroupService, HatmService, JuzService, UserService
+from app.services import GroupService, HatmService, JuzService
 
 router = APIRouter()
 
@@ -37,11 +40,14 @@ async def get_me(current_user: User = Depends(get_current_user)):
 
 @router.get("/users/me/juzs", response_model=UserJuzStats)
 async def get_my_juzs(
+    page: PageParams = Depends(),
     current_user: User = Depends(get_current_user),
     juz_service: JuzService = Depends(get_juz_service)
 ):
-    """Получить все джузы текущего пользователя"""
-    return juz_service.get_user_stats(current_user)
+    """Сводка по джузам текущего пользователя и страница истории (?limit=&cursor=)"""
+    stats = await juz_service.get_user_stats(current_user, limit=page.limit + 1, after=page.after)
+    stats.juzs, stats.next_cursor = page.page(stats.juzs, lambda juz: (juz.completed_at, juz.id))
+    return PrebuiltJSONResponse(stats)
 
 
 @router.get("/users/me/debts", response_model=UserDebtResponse)
@@ -50,7 +56,7 @@ async def get_my_debts(
     juz_service: JuzService = Depends(get_juz_service)
 ):
     """Получить долги текущего пользователя"""
-    return juz_service.get_user_debt_response(current_user)
+    return await juz_service.get_user_debt_response(current_user)
 
 
 # ============== Group Routes ==============
@@ -62,15 +68,16 @@ async def create_group(
     group_service: GroupService = Depends(get_group_service)
 ):
     """Создать новую группу"""
-    group = group_service.create(current_user, group_data)
+    group = await group_service.create(current_user, group_data)
     return GroupResponse(
         id=group.id,
         name=group.name,
         invite_code=group.invite_code,
         creator_id=group.creator_id,
         created_at=group.created_at,
-        members_count=group_service.get_members_count(group),
-        has_active_hatm=group_service.has_active_hatm(group)
+        # Новая группа: только создатель и ни одного хатма
+        members_count=1,
+        has_active_hatm=False
     )
 
 
@@ -81,8 +88,8 @@ async def get_my_groups(
 ):
     """Получить список групп пользователя - оптимизировано (1 запрос вместо N+1)"""
     # Используем оптимизированный метод с batch загрузкой stats
-    groups_with_stats = group_service.get_user_groups_with_stats(current_user)
-    return [
+    groups_with_stats = await group_service.get_user_groups_with_stats(current_user)
+    return PrebuiltJSONResponse([
         GroupResponse(
             id=g.id,
             name=g.name,
@@ -93,7 +100,7 @@ async def get_my_groups(
             has_active_hatm=has_active_hatm
         )
         for g, members_count, has_active_hatm in groups_with_stats
-    ]
+    ])
 
 
 @router.get("/groups/{group_id}", response_model=GroupDetailResponse)
@@ -102,17 +109,17 @@ async def get_group(
     current_user: User = Depends(get_current_user),
     group_service: GroupService = Depends(get_group_service),
     hatm_service: HatmService = Depends(get_hatm_service),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Получить информацию о группе"""
-    group = group_service.get_by_id(group_id)
+    group = await group_service.get_by_id(group_id)
     if not group:
         raise HTTPException(status_code=404, detail="Группа не найдена")
 
-    if not group_service.is_member(group, current_user):
+    if not await group_service.is_member(group, current_user):
         raise HTTPException(status_code=403, detail="Вы не являетесь участником группы")
 
-    members = group_service.get_members(group)
+    members = await group_service.get_members(group)
     member_responses = []
     for m in members:
         member_responses.append(MemberResponse(
@@ -123,18 +130,23 @@ async def get_group(
             joined_at=m.joined_at
         ))
 
-    active_hatm = group_service.get_active_hatm(group)
+    active_hatm = await group_service.get_active_hatm(group)
     active_hatm_response = None
     if active_hatm:
         active_hatm_response = HatmResponse(
             id=active_hatm.id,
             group_id=active_hatm.group_id,
+            sequence_number=active_hatm.sequence_number,
             duration_days=active_hatm.duration_days,
             participants_count=active_hatm.participants_count,
             status=active_hatm.status,
             started_at=active_hatm.started_at,
             ends_at=active_hatm.ends_at,
-            created_at=active_hatm.created_at
+            created_at=active_hatm.created_at,
+            completed_juzs=active_hatm.completed_juzs,
+            pending_juzs=active_hatm.pending_juzs,
+            debt_juzs=active_hatm.debt_juzs,
+            assigned_participants=active_hatm.assigned_participants
         )
 
     return GroupDetailResponse(
@@ -152,67 +164,22 @@ async def get_group(
 async def join_group(
     join_data: GroupJoinRequest,
     current_user: User = Depends(get_current_user),
-    group_service: GroupService = Depends(get_group_service),
-    hatm_service: HatmService = Depends(get_hatm_service)
+    group_service: GroupService = Depends(get_group_service)
 ):
-    """Вступить в группу по коду приглашения"""
-    import asyncio
-
-    group = group_service.get_by_invite_code(join_data.invite_code)
-    if not group:
+    """Вступить в группу по коду приглашения (одна транзакция, см. GroupService.join)"""
+    joined = await group_service.join(current_user, join_data.invite_code)
+    if joined is None:
         raise HTTPException(status_code=404, detail="Группа не найдена")
 
-    # Проверяем, не является ли уже участником
-    is_already_member = group_service.is_member(group, current_user)
-
-    group_service.add_member(group, current_user)
-
-    # Если это новый участник и есть активный хатм - назначаем джузы
-    if not is_already_member:
-        active_hatm = group_service.get_active_hatm(group)
-        if active_hatm:
-            assigned_juzs = hatm_service.assign_juzs_to_new_member(active_hatm, current_user)
-
-            # Отправляем уведомление если джузы назначены
-            if assigned_juzs and current_user.telegram_id:
-                notification_data = {
-                    'telegram_id': current_user.telegram_id,
-                    'juz_numbers': sorted([j.juz_number for j in assigned_juzs]),
-                    'group_name': group.name,
-                    'duration_days': active_hatm.duration_days
-                }
-
-                async def send_assignment_notification():
-                    notification_service = get_notification_service()
-                    if notification_service and notification_service.bot:
-                        try:
-                            juz_list = ", ".join(str(n) for n in notification_data['juz_numbers'])
-                            text = (
-                                f"📖 *Добро пожаловать в хатм!*\n\n"
-                                f"Группа: {notification_data['group_name']}\n"
-                                f"Срок: {notification_data['duration_days']} дн.\n\n"
-                                f"Вам назначены джузы: *{juz_list}*\n\n"
-                                f"Да поможет вам Аллах в чтении Корана! 🤲"
-                            )
-                            await notification_service.bot.send_message(
-                                chat_id=notification_data['telegram_id'],
-                                text=text,
-                                parse_mode="Markdown"
-                            )
-                        except Exception as e:
-                            import logging
-                            logging.error(f"Failed to send join notification to {notification_data['telegram_id']}: {e}")
-
-                asyncio.create_task(send_assignment_notification())
-
+    group, members_count, has_active_hatm = joined
     return GroupResponse(
         id=group.id,
         name=group.name,
         invite_code=group.invite_code,
         creator_id=group.creator_id,
         created_at=group.created_at,
-        members_count=group_service.get_members_count(group),
-        has_active_hatm=group_service.has_active_hatm(group)
+        members_count=members_count,
+        has_active_hatm=has_active_hatm
     )
 
 
@@ -223,14 +190,14 @@ async def get_group_members(
     group_service: GroupService = Depends(get_group_service)
 ):
     """Получить список участников группы"""
-    group = group_service.get_by_id(group_id)
+    group = await group_service.get_by_id(group_id)
     if not group:
         raise HTTPException(status_code=404, detail="Группа не найдена")
 
-    if not group_service.is_member(group, current_user):
+    if not await group_service.is_member(group, current_user):
         raise HTTPException(status_code=403, detail="Вы не являетесь участником группы")
 
-    members = group_service.get_members(group)
+    members = await group_service.get_members(group)
     return [
         MemberResponse(
             id=m.id,
@@ -247,19 +214,18 @@ async def get_group_members(
 async def leave_group(
     group_id: int,
     current_user: User = Depends(get_current_user),
-    group_service: GroupService = Depends(get_group_service),
-    db: Session = Depends(get_db)
+    group_service: GroupService = Depends(get_group_service)
 ):
     """Покинуть группу"""
-    group = group_service.get_by_id(group_id)
+    group = await group_service.get_by_id(group_id)
     if not group:
         raise HTTPException(status_code=404, detail="Группа не найдена")
 
-    if not group_service.is_member(group, current_user):
+    if not await group_service.is_member(group, current_user):
         raise HTTPException(status_code=400, detail="Вы не являетесь участником группы")
 
     # Проверяем, есть ли активный хатм
-    if group_service.has_active_hatm(group):
+    if await group_service.has_active_hatm(group):
         raise HTTPException(
             status_code=400,
             detail="Нельзя покинуть группу с активным хатмом"
@@ -267,14 +233,42 @@ async def leave_group(
 
     # Если это создатель — удаляем всю группу
     if group.creator_id == current_user.id:
-        db.delete(group)
-        db.commit()
+        await group_service.delete(group)
         return {"message": "Группа удалена"}
 
-    group_service.remove_member(group, current_user)
+    await group_service.remove_member(group, current_user)
     return {"message": "Вы покинули группу"}
 
 
+def _sse_response(topic: str, hello: dict) -> StreamingResponse:
+    """
+    Поток Server-Sent Events. Сессия БД закрывается вместе с зависимостями
+    до начала стрима, поэтому открытый поток не занимает соединение пула.
+    """
+    return StreamingResponse(
+        event_stream(topic, hello),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/groups/{group_id}/events")
+async def group_events(
+    group_id: int,
+    current_user: User = Depends(get_current_user),
+    group_service: GroupService = Depends(get_group_service)
+):
+    """Живые изменения хатмов группы (SSE)"""
+    group = await group_service.get_by_id(group_id)
+    if not group:
+        raise HTTPException(status_code=404, detail="Группа не найдена")
+
+    if not await group_service.is_member(group, current_user):
+        raise HTTPException(status_code=403, detail="Вы не являетесь участником группы")
+
+    return _sse_response(group_topic(group_id), {"type": "hello", "group_id": group_id})
+
+
 # ============== Hatm Routes ==============
 
 @router.post("/groups/{group_id}/hatms", response_model=HatmResponse)
@@ -283,134 +277,101 @@ async def create_hatm(
     hatm_data: HatmCreate,
     current_user: User = Depends(get_current_user),
     group_service: GroupService = Depends(get_group_service),
-    hatm_service: HatmService = Depends(get_hatm_service),
-    db: Session = Depends(get_db)
+    hatm_service: HatmService = Depends(get_hatm_service)
 ):
     """Создать новый хатм в группе"""
-    import asyncio
-
-    group = group_service.get_by_id(group_id)
+    group = await group_service.get_by_id(group_id)
     if not group:
         raise HTTPException(status_code=404, detail="Группа не найдена")
 
-    if not group_service.is_member(group, current_user):
+    if not await group_service.is_member(group, current_user):
         raise HTTPException(status_code=403, detail="Вы не являетесь участником группы")
 
-    if group_service.has_active_hatm(group):
+    if await group_service.has_active_hatm(group):
         raise HTTPException(status_code=400, detail="В группе уже есть активный хатм")
 
-    hatm = hatm_service.create(group, hatm_data)
-
-    # Собираем данные до закрытия сессии
-    members = group_service.get_members(group)
-    juz_assignments = db.query(JuzAssignment).filter(JuzAssignment.hatm_id == hatm.id).all()
-
-    # Группируем джузы по пользователям
-    user_juzs = {}
-    for juz in juz_assignments:
-        if juz.user_id not in user_juzs:
-            user_juzs[juz.user_id] = []
-        user_juzs[juz.user_id].append(juz)
-
-    # Сохраняем данные для уведомлений
-    notification_data = []
-    for member in members:
-        if member.id in user_juzs and member.telegram_id:
-            notification_data.append({
-                'telegram_id': member.telegram_id,
-                'first_name': member.first_name,
-                'juz_numbers': sorted([j.juz_number for j in user_juzs[member.id]]),
-                'group_name': group.name,
-                'duration_days': hatm.duration_days
-            })
-
-    # Отправляем уведомления асинхронно
-    async def send_notifications():
-        notification_service = get_notification_service()
-        if notification_service and notification_service.bot:
-            for data in notification_data:
-                try:
-                    juz_list = ", ".join(str(n) for n in data['juz_numbers'])
-                    text = (
-                        f"📖 *Новый хатм начат!*\n\n"
-                        f"Группа: {data['group_name']}\n"
-                        f"Срок: {data['duration_days']} дн.\n\n"
-                        f"Вам назначены джузы: *{juz_list}*\n\n"
-                        f"Да поможет вам Аллах в чтении Корана! 🤲"
-                    )
-                    await notification_service.bot.send_message(
-                        chat_id=data['telegram_id'],
-                        text=text,
-                        parse_mode="Markdown"
-                    )
-                except Exception as e:
-                    import logging
-                    logging.error(f"Failed to send notification to {data['telegram_id']}: {e}")
-
-    # Запускаем отправку уведомлений в фоне
-    asyncio.create_task(send_notifications())
+    hatm = await hatm_service.create(group, hatm_data)
+
+    # Джузы распределяются только при запуске (start_hatm) - уведомления отправляются там
 
     return HatmResponse(
         id=hatm.id,
         group_id=hatm.group_id,
+        sequence_number=hatm.sequence_number,
         duration_days=hatm.duration_days,
         participants_count=hatm.participants_count,
         status=hatm.status,
         started_at=hatm.started_at,
         ends_at=hatm.ends_at,
-        created_at=hatm.created_at
+        created_at=hatm.created_at,
+        completed_juzs=hatm.completed_juzs,
+        pending_juzs=hatm.pending_juzs,
+        debt_juzs=hatm.debt_juzs,
+        assigned_participants=hatm.assigned_participants
     )
 
 
 @router.get("/groups/{group_id}/hatms", response_model=List[HatmResponse])
 async def get_group_hatms(
     group_id: int,
+    response: Response,
+    page: PageParams = Depends(),
     current_user: User = Depends(get_current_user),
     group_service: GroupService = Depends(get_group_service),
     hatm_service: HatmService = Depends(get_hatm_service)
 ):
-    """Получить список хатмов группы"""
-    group = group_service.get_by_id(group_id)
+    """
+    Хатмы группы от новых к старым, постранично (?limit=&cursor=). Тело - список,
+    как до пагинации; курсор следующей страницы - в заголовке X-Next-Cursor
+    """
+    group = await group_service.get_by_id(group_id)
     if not group:
         raise HTTPException(status_code=404, detail="Группа не найдена")
 
-    if not group_service.is_member(group, current_user):
+    if not await group_service.is_member(group, current_user):
         raise HTTPException(status_code=403, detail="Вы не являетесь участником группы")
 
-    hatms = hatm_service.get_group_hatms(group)
+    hatms, next_cursor = page.page(
+        await hatm_service.get_group_hatms(group, limit=page.limit + 1, after=page.after),
+        lambda hatm: (hatm.created_at, hatm.id)
+    )
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     return [
         HatmResponse(
             id=h.id,
             group_id=h.group_id,
+            sequence_number=h.sequence_number,
             duration_days=h.duration_days,
             participants_count=h.participants_count,
             status=h.status,
             started_at=h.started_at,
             ends_at=h.ends_at,
-            created_at=h.created_at
+            created_at=h.created_at,
+            completed_juzs=h.completed_juzs,
+            pending_juzs=h.pending_juzs,
+            debt_juzs=h.debt_juzs,
+            assigned_participants=h.assigned_participants
         )
         for h in hatms
     ]
 
 
-@router.get("/hatms/{hatm_id}", response_model=HatmDetailResponse)
-async def get_hatm(
-    hatm_id: int,
-    current_user: User = Depends(get_current_user),
-    group_service: GroupService = Depends(get_group_service),
-    hatm_service: HatmService = Depends(get_hatm_service)
-):
-    """Получить информацию о хатме"""
-    hatm = hatm_service.get_by_id(hatm_id)
-    if not hatm:
+async def _get_hatm_version(hatm_service: HatmService, hatm_id: int, user: User) -> int:
+    """Проверить доступ к хатму и вернуть его текущую версию (один запрос)"""
+    found = await hatm_service.get_member_version(hatm_id, user)
+    if not found:
         raise HTTPException(status_code=404, detail="Хатм не найден")
 
-    group = group_service.get_by_id(hatm.group_id)
-    if not group_service.is_member(group, current_user):
+    version, is_member = found
+    if not is_member:
         raise HTTPException(status_code=403, detail="Вы не являетесь участником группы")
+    return version
 
-    progress = hatm_service.get_progress(hatm)
 
+async def _build_hatm_detail(hatm_service: HatmService, hatm: Hatm) -> HatmDetailResponse:
+    """Собрать детальный ответ о хатме вместе с джузами"""
+    progress = await hatm_service.get_progress(hatm)
     return HatmDetailResponse(
         id=hatm.id,
         group_id=hatm.group_id,
@@ -424,30 +385,55 @@ async def get_hatm(
     )
 
 
+@router.get("/hatms/{hatm_id}", response_model=HatmDetailResponse)
+async def get_hatm(
+    hatm_id: int,
+    if_none_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user),
+    hatm_service: HatmService = Depends(get_hatm_service)
+):
+    """
+    Получить информацию о хатме.
+    Ответ кэшируется по (hatm_id, version); при совпадении ETag возвращается 304.
+    """
+    version = await _get_hatm_version(hatm_service, hatm_id, current_user)
+    etag = make_etag("hatm", hatm_id, version)
+    if etag_matches(if_none_match, etag):
+        return cached_json_response(None, etag)
+
+    payload = hatm_payload_cache.get(("hatm", hatm_id, version))
+    if payload is None:
+        hatm = await hatm_service.get_by_id(hatm_id)
+        if not hatm:
+            raise HTTPException(status_code=404, detail="Хатм не найден")
+        payload = dump_json(await _build_hatm_detail(hatm_service, hatm))
+        etag = make_etag("hatm", hatm_id, hatm.version)
+        hatm_payload_cache.set(("hatm", hatm_id, hatm.version), payload)
+
+    return cached_json_response(payload, etag)
+
+
 @router.post("/hatms/{hatm_id}/start", response_model=HatmResponse)
 async def start_hatm(
     hatm_id: int,
     current_user: User = Depends(get_current_user),
     group_service: GroupService = Depends(get_group_service),
-    hatm_service: HatmService = Depends(get_hatm_service),
-    db: Session = Depends(get_db)
+    hatm_service: HatmService = Depends(get_hatm_service)
 ):
     """Запустить хатм (распределить джузы)"""
-    import asyncio
-
-    hatm = hatm_service.get_by_id(hatm_id)
+    hatm = await hatm_service.get_by_id(hatm_id)
     if not hatm:
         raise HTTPException(status_code=404, detail="Хатм не найден")
 
-    group = group_service.get_by_id(hatm.group_id)
-    if not group_service.is_member(group, current_user):
+    group = await group_service.get_by_id(hatm.group_id)
+    if not await group_service.is_member(group, current_user):
         raise HTTPException(status_code=403, detail="Вы не являетесь участником группы")
 
     if hatm.status != HatmStatus.PENDING:
         raise HTTPException(status_code=400, detail="Хатм уже запущен или завершен")
 
     # Получаем участников группы
-    members = group_service.get_members(group)
+    members = await group_service.get_members(group)
     participants = [m.user for m in members]
 
     if len(participants) == 0:
@@ -455,79 +441,66 @@ async def start_hatm(
 
     # Передаём всех текущих участников - сервис сам распределит
     # и создаст нераспределённые джузы для будущих участников
-    hatm = hatm_service.start(hatm, participants)
-
-    # Собираем данные для уведомлений до закрытия сессии
-    user_juzs = {}
-    for assignment in db.query(JuzAssignment).filter(JuzAssignment.hatm_id == hatm.id).all():
-        if assignment.user_id not in user_juzs:
-            user_juzs[assignment.user_id] = []
-        user_juzs[assignment.user_id].append(assignment)
-
-    notification_data = []
-    for user in participants:
-        if user.id in user_juzs and user.telegram_id:
-            notification_data.append({
-                'telegram_id': user.telegram_id,
-                'juz_numbers': sorted([j.juz_number for j in user_juzs[user.id]]),
-                'group_name': group.name,
-                'duration_days': hatm.duration_days
-            })
-
-    # Отправляем уведомления асинхронно
-    async def send_start_notifications():
-        notification_service = get_notification_service()
-        if notification_service and notification_service.bot:
-            for data in notification_data:
-                try:
-                    juz_list = ", ".join(str(n) for n in data['juz_numbers'])
-                    text = (
-                        f"📖 *Хатм начат!*\n\n"
-                        f"Группа: {data['group_name']}\n"
-                        f"Срок: {data['duration_days']} дн.\n\n"
-                        f"Вам назначены джузы: *{juz_list}*\n\n"
-                        f"Да поможет вам Аллах в чтении Корана! 🤲"
-                    )
-                    await notification_service.bot.send_message(
-                        chat_id=data['telegram_id'],
-                        text=text,
-                        parse_mode="Markdown"
-                    )
-                except Exception as e:
-                    import logging
-                    logging.error(f"Failed to send start notification to {data['telegram_id']}: {e}")
-
-    asyncio.create_task(send_start_notifications())
+    # Уведомления о назначенных джузах записываются в outbox сервисом
+    hatm = await hatm_service.start(hatm, participants)
 
     return HatmResponse(
         id=hatm.id,
         group_id=hatm.group_id,
+        sequence_number=hatm.sequence_number,
         duration_days=hatm.duration_days,
         participants_count=hatm.participants_count,
         status=hatm.status,
         started_at=hatm.started_at,
         ends_at=hatm.ends_at,
-        created_at=hatm.created_at
+        created_at=hatm.created_at,
+        completed_juzs=hatm.completed_juzs,
+        pending_juzs=hatm.pending_juzs,
+        debt_juzs=hatm.debt_juzs,
+        assigned_participants=hatm.assigned_participants
     )
 
 
 @router.get("/hatms/{hatm_id}/progress", response_model=HatmProgress)
 async def get_hatm_progress(
     hatm_id: int,
+    if_none_match: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user),
-    group_service: GroupService = Depends(get_group_service),
     hatm_service: HatmService = Depends(get_hatm_service)
 ):
-    """Получить прогресс хатма"""
-    hatm = hatm_service.get_by_id(hatm_id)
-    if not hatm:
-        raise HTTPException(status_code=404, detail="Хатм не найден")
-
-    group = group_service.get_by_id(hatm.group_id)
-    if not group_service.is_member(group, current_user):
-        raise HTTPException(status_code=403, detail="Вы не являетесь участником группы")
-
-    return hatm_service.get_progress(hatm)
+    """
+    Получить прогресс хатма.
+    Ответ кэшируется по (hatm_id, version); при совпадении ETag возвращается 304.
+    """
+    version = await _get_hatm_version(hatm_service, hatm_id, current_user)
+    etag = make_etag("progress", hatm_id, version)
+    if etag_matches(if_none_match, etag):
+        return cached_json_response(None, etag)
+
+    payload = hatm_payload_cache.get(("progress", hatm_id, version))
+    if payload is None:
+        hatm = await hatm_service.get_by_id(hatm_id)
+        if not hatm:
+            raise HTTPException(status_code=404, detail="Хатм не найден")
+        payload = dump_json(await hatm_service.get_progress(hatm))
+        etag = make_etag("progress", hatm_id, hatm.version)
+        hatm_payload_cache.set(("progress", hatm_id, hatm.version), payload)
+
+    return cached_json_response(payload, etag)
+
+
+@router.get("/hatms/{hatm_id}/events")
+async def hatm_events(
+    hatm_id: int,
+    current_user: User = Depends(get_current_user),
+    hatm_service: HatmService = Depends(get_hatm_service)
+):
+    """
+    Живые изменения хатма (SSE): дельты по джузам и счётчики.
+    Первое событие hello содержит текущую версию хатма.
+    """
+    version = await _get_hatm_version(hatm_service, hatm_id, current_user)
+    return _sse_response(hatm_topic(hatm_id), {"type": "hello", "hatm_id": hatm_id, "version": version})
 
 
 @router.post("/hatms/{hatm_id}/complete", response_model=HatmResponse)
@@ -535,18 +508,15 @@ async def complete_hatm(
     hatm_id: int,
     current_user: User = Depends(get_current_user),
     group_service: GroupService = Depends(get_group_service),
-    hatm_service: HatmService = Depends(get_hatm_service),
-    db: Session = Depends(get_db)
+    hatm_service: HatmService = Depends(get_hatm_service)
 ):
     """Завершить хатм вручную"""
-    import asyncio
-
-    hatm = hatm_service.get_by_id(hatm_id)
+    hatm = await hatm_service.get_by_id(hatm_id)
     if not hatm:
         raise HTTPException(status_code=404, detail="Хатм не найден")
 
-    group = group_service.get_by_id(hatm.group_id)
-    if not group_service.is_member(group, current_user):
+    group = await group_service.get_by_id(hatm.group_id)
+    if not await group_service.is_member(group, current_user):
         raise HTTPException(status_code=403, detail="Вы не являетесь участником группы")
 
     if hatm.status == HatmStatus.COMPLETED:
@@ -555,55 +525,22 @@ async def complete_hatm(
     if hatm.status == HatmStatus.PENDING:
         raise HTTPException(status_code=400, detail="Хатм еще не начат")
 
-    hatm = hatm_service.force_complete(hatm)
-
-    # Собираем данные до закрытия сессии
-    participant_ids = db.query(JuzAssignment.user_id).filter(
-        JuzAssignment.hatm_id == hatm.id
-    ).distinct().all()
-
-    from app.models.models import User as UserModel
-    notification_data = []
-    for (user_id,) in participant_ids:
-        user = db.query(UserModel).filter(UserModel.id == user_id).first()
-        if user and user.telegram_id:
-            notification_data.append({
-                'telegram_id': user.telegram_id,
-                'group_name': group.name if group else 'группы'
-            })
-
-    # Отправляем уведомления асинхронно
-    async def send_completion_notifications():
-        notification_service = get_notification_service()
-        if notification_service and notification_service.bot:
-            for data in notification_data:
-                try:
-                    text = (
-                        f"🎉 *Хатм завершен!*\n\n"
-                        f"Группа: {data['group_name']}\n\n"
-                        f"Аллахумма баракалана! Хатм группы успешно завершен!\n"
-                        f"Баракаллаху фикум всем участникам! 🤲"
-                    )
-                    await notification_service.bot.send_message(
-                        chat_id=data['telegram_id'],
-                        text=text,
-                        parse_mode="Markdown"
-                    )
-                except Exception as e:
-                    import logging
-                    logging.error(f"Failed to send completion notification to {data['telegram_id']}: {e}")
-
-    asyncio.create_task(send_completion_notifications())
+    hatm = await hatm_service.force_complete(hatm)
 
     return HatmResponse(
         id=hatm.id,
         group_id=hatm.group_id,
+        sequence_number=hatm.sequence_number,
         duration_days=hatm.duration_days,
         participants_count=hatm.participants_count,
         status=hatm.status,
         started_at=hatm.started_at,
         ends_at=hatm.ends_at,
-        created_at=hatm.created_at
+        created_at=hatm.created_at,
+        completed_juzs=hatm.completed_juzs,
+        pending_juzs=hatm.pending_juzs,
+        debt_juzs=hatm.debt_juzs,
+        assigned_participants=hatm.assigned_participants
     )
 
 
@@ -614,67 +551,21 @@ async def complete_juz(
     juz_id: int,
     current_user: User = Depends(get_current_user),
     juz_service: JuzService = Depends(get_juz_service),
-    hatm_service: HatmService = Depends(get_hatm_service),
-    group_service: GroupService = Depends(get_group_service),
-    db: Session = Depends(get_db)
+    hatm_service: HatmService = Depends(get_hatm_service)
 ):
     """Отметить джуз как прочитанный"""
-    import asyncio
-
-    juz = juz_service.get_by_id(juz_id)
+    juz = await juz_service.get_by_id(juz_id)
     if not juz:
         raise HTTPException(status_code=404, detail="Джуз не найден")
 
     if juz.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Это не ваш джуз")
 
-    juz = juz_service.mark_completed(juz)
+    juz = await juz_service.mark_completed(juz)
 
-    # Проверяем, завершен ли хатм
-    hatm = hatm_service.get_by_id(juz.hatm_id)
+    # Проверяем, завершен ли хатм (уведомления участникам записываются в outbox)
+    hatm = await hatm_service.get_by_id(juz.hatm_id)
     if hatm:
-        was_completed = hatm_service.check_and_complete(hatm)
-
-        # Если хатм был завершен, отправляем уведомления
-        if was_completed:
-            group = group_service.get_by_id(hatm.group_id)
-
-            # Собираем данные до закрытия сессии
-            participant_ids = db.query(JuzAssignment.user_id).filter(
-                JuzAssignment.hatm_id == hatm.id
-            ).distinct().all()
-
-            from app.models.models import User as UserModel
-            notification_data = []
-            for (user_id,) in participant_ids:
-                user = db.query(UserModel).filter(UserModel.id == user_id).first()
-                if user and user.telegram_id:
-                    notification_data.append({
-                        'telegram_id': user.telegram_id,
-                        'group_name': group.name if group else 'группы'
-                    })
-
-            # Отправляем уведомления асинхронно
-            async def send_completion_notifications():
-                notification_service = get_notification_service()
-                if notification_service and notification_service.bot:
-                    for data in notification_data:
-                        try:
-                            text = (
-                                f"🎉 *Хатм завершен!*\n\n"
-                                f"Группа: {data['group_name']}\n\n"
-                                f"Аллахумма баракалана! Хатм группы успешно завершен!\n"
-                                f"Баракаллаху фикум всем участникам! 🤲"
-                            )
-                            await notification_service.bot.send_message(
-                                chat_id=data['telegram_id'],
-                                text=text,
-                                parse_mode="Markdown"
-                            )
-                        except Exception as e:
-                            import logging
-                            logging.error(f"Failed to send completion notification to {data['telegram_id']}: {e}")
-
-            asyncio.create_task(send_completion_notifications())
-
-    return juz_service.get_juz_with_user_info(juz)
+        await hatm_service.check_and_complete(hatm)
+
+    return await juz_service.get_juz_with_user_info(juz)
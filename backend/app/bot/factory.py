@@ -0,0 +1,56 @@
+from aiogram import Bot, Dispatcher
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.enums import ParseMode
+from functools import lru_cache
+import os
+
+from app.database import unit_of_work
+from app.query_stats import track_queries
+
+# Адрес Bot API (свой сервер telegram-bot-api или локальная заглушка для проверок)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+
+
+def create_bot(token: str) -> Bot:
+    """Создать экземпляр бота (соединение с Bot API открывается при первом запросе)"""
+    session = None
+    if TELEGRAM_API_URL:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL))
+    return Bot(
+        token=token,
+        session=session,
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+    )
+
+
+@lru_cache(maxsize=None)
+def get_dispatcher() -> Dispatcher:
+    """
+    Dispatcher с обработчиками команд и кнопок бота. Один на процесс:
+    роутер нельзя подключить к двум диспетчерам (например, при повторном лидерстве)
+    """
+    from app.bot.handlers import router as bot_router
+
+    dp = Dispatcher()
+    dp.update.outer_middleware(_track_update_queries)
+    dp.update.outer_middleware(_unit_of_work)
+    dp.include_router(bot_router)
+    return dp
+
+
+async def _track_update_queries(handler, update, data):
+    """Статистика SQL-запросов на каждый апдейт (как QueryStatsMiddleware для HTTP)"""
+    with track_queries(f"bot {update.event_type}") as stats:
+        try:
+            return await handler(update, data)
+        finally:
+            stats.report()
+
+
+async def _unit_of_work(handler, update, data):
+    """Одна сессия и один commit на апдейт: обработчики получают её параметром db"""
+    async with unit_of_work() as db:
+        data["db"] = db
+        return await handler(update, data)
@@ -5,20 +5,25 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 import os
 import logging
 
-from app.database import SessionLocal
-from app.services import UserService, JuzService, HatmService, GroupService
-from app.models.models import JuzStatus, HatmStatus, Hatm, Group
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services import UserService, JuzService, HatmService
+from app.models.models import JuzStatus, Group
 
 router = Router()
 logger = logging.getLogger(__name__)
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        return db
-    finally:
-        pass  # Connection will be managed by the caller
+async def _group_by_hatm(juz_service: JuzService, juzs: list) -> dict:
+    """Сгруппировать джузы по хатмам: {(hatm_id, group_name, hatm_number): [джузы]}"""
+    hatm_info = await juz_service.get_hatm_info({juz.hatm_id for juz in juzs})
+    by_hatm = {}
+    for juz in juzs:
+        if juz.hatm_id not in hatm_info:
+            continue
+        group_name, hatm_number, _ = hatm_info[juz.hatm_id]
+        by_hatm.setdefault((juz.hatm_id, group_name or "Неизвестная группа", hatm_number), []).append(juz)
+    return by_hatm
 
 
 def get_webapp_url():
@@ -26,360 +31,267 @@ def get_webapp_url():
 
 
 @router.message(Command("start"))
-async def cmd_start(message: Message):
+async def cmd_start(message: Message, db: AsyncSession):
     """Обработчик команды /start"""
-    db = SessionLocal()
-    try:
-        user_service = UserService(db)
-        user = user_service.get_or_create(
-            telegram_id=message.from_user.id,
-            username=message.from_user.username,
-            first_name=message.from_user.first_name
-        )
+    user_service = UserService(db)
+    user = await user_service.get_or_create(
+        telegram_id=message.from_user.id,
+        username=message.from_user.username,
+        first_name=message.from_user.first_name
+    )
+
+    webapp_url = get_webapp_url()
+
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(
+            text="📖 Открыть приложение",
+            web_app=WebAppInfo(url=webapp_url)
+        )],
+        [InlineKeyboardButton(text="📋 Мои джузы", callback_data="my_juzs")],
+        [InlineKeyboardButton(text="⚠️ Мои долги", callback_data="my_debts")]
+    ])
+
+    await message.answer(
+        f"Ассаляму алейкум, {user.first_name or 'дорогой брат/сестра'}! 🌙\n\n"
+        "Добро пожаловать в бот для коллективного чтения Корана (хатм).\n\n"
+        "С этим ботом вы можете:\n"
+        "• Создавать группы для совместного хатма\n"
+        "• Распределять джузы между участниками\n"
+        "• Отслеживать прогресс чтения\n"
+        "• Получать напоминания о джузах\n\n"
+        "Нажмите кнопку ниже, чтобы открыть приложение:",
+        reply_markup=keyboard
+    )
+
+
+@router.message(Command("myjuzs"))
+async def cmd_my_juzs(message: Message, db: AsyncSession):
+    """Показать текущие джузы пользователя"""
+    user_service = UserService(db)
+    juz_service = JuzService(db)
 
-        webapp_url = get_webapp_url()
+    user = await user_service.get_by_telegram_id(message.from_user.id)
+    if not user:
+        await message.answer("Вы еще не зарегистрированы. Используйте /start")
+        return
 
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(
-                text="📖 Открыть приложение",
-                web_app=WebAppInfo(url=webapp_url)
-            )],
-            [InlineKeyboardButton(text="📋 Мои джузы", callback_data="my_juzs")],
-            [InlineKeyboardButton(text="⚠️ Мои долги", callback_data="my_debts")]
-        ])
+    active_juzs = await juz_service.get_user_active_juzs(user)
 
+    if not active_juzs:
         await message.answer(
-            f"Ассаляму алейкум, {user.first_name or 'дорогой брат/сестра'}! 🌙\n\n"
-            "Добро пожаловать в бот для коллективного чтения Корана (хатм).\n\n"
-            "С этим ботом вы можете:\n"
-            "• Создавать группы для совместного хатма\n"
-            "• Распределять джузы между участниками\n"
-            "• Отслеживать прогресс чтения\n"
-            "• Получать напоминания о джузах\n\n"
-            "Нажмите кнопку ниже, чтобы открыть приложение:",
-            reply_markup=keyboard
+            "У вас сейчас нет активных джузов для чтения.\n\n"
+            "Присоединитесь к группе и дождитесь начала хатма!"
         )
-    finally:
-        db.close()
+        return
 
+    # Группируем джузы по хатмам
+    juzs_by_hatm = await _group_by_hatm(juz_service, active_juzs)
 
-@router.message(Command("myjuzs"))
-async def cmd_my_juzs(message: Message):
-    """Показать текущие джузы пользователя"""
-    db = SessionLocal()
-    try:
-        user_service = UserService(db)
-        juz_service = JuzService(db)
-
-        user = user_service.get_by_telegram_id(message.from_user.id)
-        if not user:
-            await message.answer("Вы еще не зарегистрированы. Используйте /start")
-            return
-
-        active_juzs = juz_service.get_user_active_juzs(user)
-
-        if not active_juzs:
-            await message.answer(
-                "У вас сейчас нет активных джузов для чтения.\n\n"
-                "Присоединитесь к группе и дождитесь начала хатма!"
-            )
-            return
-
-        # Группируем джузы по хатмам
-        juzs_by_hatm = {}
-        for juz in active_juzs:
-            hatm = db.query(Hatm).filter(Hatm.id == juz.hatm_id).first()
-            if hatm:
-                group = db.query(Group).filter(Group.id == hatm.group_id).first()
-                # Вычисляем номер хатма в группе
-                hatm_number = db.query(Hatm).filter(
-                    Hatm.group_id == hatm.group_id,
-                    Hatm.id <= hatm.id
-                ).count()
-                key = (hatm.id, group.name if group else "Неизвестная группа", hatm_number)
-                if key not in juzs_by_hatm:
-                    juzs_by_hatm[key] = []
-                juzs_by_hatm[key].append(juz)
-
-        text = "📖 *Ваши текущие джузы:*\n\n"
-        builder = InlineKeyboardBuilder()
-
-        for (hatm_id, group_name, hatm_number), juzs in juzs_by_hatm.items():
-            text += f"🕌 *{group_name}* (Хатм #{hatm_number})\n"
-            for juz in juzs:
-                text += f"  • Джуз {juz.juz_number}\n"
-                builder.add(InlineKeyboardButton(
-                    text=f"✅ Джуз {juz.juz_number} ({group_name})",
-                    callback_data=f"complete_juz:{juz.id}"
-                ))
-            text += "\n"
-
-        builder.adjust(1)
+    text = "📖 *Ваши текущие джузы:*\n\n"
+    builder = InlineKeyboardBuilder()
 
-        await message.answer(
-            text,
-            parse_mode="Markdown",
-            reply_markup=builder.as_markup()
-        )
-    finally:
-        db.close()
+    for (hatm_id, group_name, hatm_number), juzs in juzs_by_hatm.items():
+        text += f"🕌 *{group_name}* (Хатм #{hatm_number})\n"
+        for juz in juzs:
+            text += f"  • Джуз {juz.juz_number}\n"
+            builder.add(InlineKeyboardButton(
+                text=f"✅ Джуз {juz.juz_number} ({group_name})",
+                callback_data=f"complete_juz:{juz.id}"
+            ))
+        text += "\n"
+
+    builder.adjust(1)
+
+    await message.answer(
+        text,
+        parse_mode="Markdown",
+        reply_markup=builder.as_markup()
+    )
 
 
 @router.message(Command("debts"))
-async def cmd_debts(message: Message):
+async def cmd_debts(message: Message, db: AsyncSession):
     """Показать долги пользователя"""
-    db = SessionLocal()
-    try:
-        user_service = UserService(db)
-        juz_service = JuzService(db)
-
-        user = user_service.get_by_telegram_id(message.from_user.id)
-        if not user:
-            await message.answer("Вы еще не зарегистрированы. Используйте /start")
-            return
-
-        debts = juz_service.get_user_debts(user)
-
-        if not debts:
-            await message.answer("✨ У вас нет долгов! Машаллах!")
-            return
-
-        # Группируем долги по хатмам
-        debts_by_hatm = {}
-        for debt in debts:
-            hatm = db.query(Hatm).filter(Hatm.id == debt.hatm_id).first()
-            if hatm:
-                group = db.query(Group).filter(Group.id == hatm.group_id).first()
-                hatm_number = db.query(Hatm).filter(
-                    Hatm.group_id == hatm.group_id,
-                    Hatm.id <= hatm.id
-                ).count()
-                key = (hatm.id, group.name if group else "Неизвестная группа", hatm_number)
-                if key not in debts_by_hatm:
-                    debts_by_hatm[key] = []
-                debts_by_hatm[key].append(debt)
-
-        text = "⚠️ *Ваши долги:*\n\n"
-        builder = InlineKeyboardBuilder()
-
-        for (hatm_id, group_name, hatm_number), group_debts in debts_by_hatm.items():
-            text += f"🕌 *{group_name}* (Хатм #{hatm_number})\n"
-            for debt in group_debts:
-                text += f"  • Джуз {debt.juz_number}\n"
-                builder.add(InlineKeyboardButton(
-                    text=f"✅ Джуз {debt.juz_number} ({group_name})",
-                    callback_data=f"complete_juz:{debt.id}"
-                ))
-            text += "\n"
-
-        builder.adjust(1)
-        text += f"Всего долгов: {len(debts)}"
+    user_service = UserService(db)
+    juz_service = JuzService(db)
 
-        await message.answer(
-            text,
-            parse_mode="Markdown",
-            reply_markup=builder.as_markup()
-        )
-    finally:
-        db.close()
+    user = await user_service.get_by_telegram_id(message.from_user.id)
+    if not user:
+        await message.answer("Вы еще не зарегистрированы. Используйте /start")
+        return
+
+    debts = await juz_service.get_user_debts(user)
+
+    if not debts:
+        await message.answer("✨ У вас нет долгов! Машаллах!")
+        return
+
+    # Группируем долги по хатмам
+    debts_by_hatm = await _group_by_hatm(juz_service, debts)
+
+    text = "⚠️ *Ваши долги:*\n\n"
+    builder = InlineKeyboardBuilder()
+
+    for (hatm_id, group_name, hatm_number), group_debts in debts_by_hatm.items():
+        text += f"🕌 *{group_name}* (Хатм #{hatm_number})\n"
+        for debt in group_debts:
+            text += f"  • Джуз {debt.juz_number}\n"
+            builder.add(InlineKeyboardButton(
+                text=f"✅ Джуз {debt.juz_number} ({group_name})",
+                callback_data=f"complete_juz:{debt.id}"
+            ))
+        text += "\n"
+
+    builder.adjust(1)
+    text += f"Всего долгов: {len(debts)}"
+
+    await message.answer(
+        text,
+        parse_mode="Markdown",
+        reply_markup=builder.as_markup()
+    )
 
 
 @router.callback_query(F.data == "my_juzs")
-async def callback_my_juzs(callback: CallbackQuery):
+async def callback_my_juzs(callback: CallbackQuery, db: AsyncSession):
     """Callback для показа джузов"""
     await callback.answer()
 
-    db = SessionLocal()
-    try:
-        user_service = UserService(db)
-        juz_service = JuzService(db)
-
-        user = user_service.get_by_telegram_id(callback.from_user.id)
-        if not user:
-            await callback.message.answer("Вы еще не зарегистрированы. Используйте /start")
-            return
-
-        active_juzs = juz_service.get_user_active_juzs(user)
-
-        if not active_juzs:
-            await callback.message.answer(
-                "У вас сейчас нет активных джузов для чтения.\n\n"
-                "Присоединитесь к группе и дождитесь начала хатма!"
-            )
-            return
-
-        # Группируем джузы по хатмам
-        juzs_by_hatm = {}
-        for juz in active_juzs:
-            hatm = db.query(Hatm).filter(Hatm.id == juz.hatm_id).first()
-            if hatm:
-                group = db.query(Group).filter(Group.id == hatm.group_id).first()
-                # Вычисляем номер хатма в группе
-                hatm_number = db.query(Hatm).filter(
-                    Hatm.group_id == hatm.group_id,
-                    Hatm.id <= hatm.id
-                ).count()
-                key = (hatm.id, group.name if group else "Неизвестная группа", hatm_number)
-                if key not in juzs_by_hatm:
-                    juzs_by_hatm[key] = []
-                juzs_by_hatm[key].append(juz)
-
-        text = "📖 *Ваши текущие джузы:*\n\n"
-        builder = InlineKeyboardBuilder()
-
-        for (hatm_id, group_name, hatm_number), juzs in juzs_by_hatm.items():
-            text += f"🕌 *{group_name}* (Хатм #{hatm_number})\n"
-            for juz in juzs:
-                text += f"  • Джуз {juz.juz_number}\n"
-                builder.add(InlineKeyboardButton(
-                    text=f"✅ Джуз {juz.juz_number} ({group_name})",
-                    callback_data=f"complete_juz:{juz.id}"
-                ))
-            text += "\n"
-
-        builder.adjust(1)
+    user_service = UserService(db)
+    juz_service = JuzService(db)
 
+    user = await user_service.get_by_telegram_id(callback.from_user.id)
+    if not user:
+        await callback.message.answer("Вы еще не зарегистрированы. Используйте /start")
+        return
+
+    active_juzs = await juz_service.get_user_active_juzs(user)
+
+    if not active_juzs:
         await callback.message.answer(
-            text,
-            parse_mode="Markdown",
-            reply_markup=builder.as_markup()
+            "У вас сейчас нет активных джузов для чтения.\n\n"
+            "Присоединитесь к группе и дождитесь начала хатма!"
         )
-    finally:
-        db.close()
+        return
+
+    # Группируем джузы по хатмам
+    juzs_by_hatm = await _group_by_hatm(juz_service, active_juzs)
+
+    text = "📖 *Ваши текущие джузы:*\n\n"
+    builder = InlineKeyboardBuilder()
+
+    for (hatm_id, group_name, hatm_number), juzs in juzs_by_hatm.items():
+        text += f"🕌 *{group_name}* (Хатм #{hatm_number})\n"
+        for juz in juzs:
+            text += f"  • Джуз {juz.juz_number}\n"
+            builder.add(InlineKeyboardButton(
+                text=f"✅ Джуз {juz.juz_number} ({group_name})",
+                callback_data=f"complete_juz:{juz.id}"
+            ))
+        text += "\n"
+
+    builder.adjust(1)
+
+    await callback.message.answer(
+        text,
+        parse_mode="Markdown",
+        reply_markup=builder.as_markup()
+    )
 
 
 @router.callback_query(F.data == "my_debts")
-async def callback_my_debts(callback: CallbackQuery):
+async def callback_my_debts(callback: CallbackQuery, db: AsyncSession):
     """Callback для показа долгов"""
     await callback.answer()
 
-    db = SessionLocal()
-    try:
-        user_service = UserService(db)
-        juz_service = JuzService(db)
-
-        user = user_service.get_by_telegram_id(callback.from_user.id)
-        if not user:
-            await callback.message.answer("Вы еще не зарегистрированы. Используйте /start")
-            return
-
-        debts = juz_service.get_user_debts(user)
-
-        if not debts:
-            await callback.message.answer("✨ У вас нет долгов! Машаллах!")
-            return
-
-        # Группируем долги по хатмам
-        debts_by_hatm = {}
-        for debt in debts:
-            hatm = db.query(Hatm).filter(Hatm.id == debt.hatm_id).first()
-            if hatm:
-                group = db.query(Group).filter(Group.id == hatm.group_id).first()
-                hatm_number = db.query(Hatm).filter(
-                    Hatm.group_id == hatm.group_id,
-                    Hatm.id <= hatm.id
-                ).count()
-                key = (hatm.id, group.name if group else "Неизвестная группа", hatm_number)
-                if key not in debts_by_hatm:
-                    debts_by_hatm[key] = []
-                debts_by_hatm[key].append(debt)
-
-        text = "⚠️ *Ваши долги:*\n\n"
-        builder = InlineKeyboardBuilder()
-
-        for (hatm_id, group_name, hatm_number), group_debts in debts_by_hatm.items():
-            text += f"🕌 *{group_name}* (Хатм #{hatm_number})\n"
-            for debt in group_debts:
-                text += f"  • Джуз {debt.juz_number}\n"
-                builder.add(InlineKeyboardButton(
-                    text=f"✅ Джуз {debt.juz_number} ({group_name})",
-                    callback_data=f"complete_juz:{debt.id}"
-                ))
-            text += "\n"
-
-        builder.adjust(1)
-        text += f"Всего долгов: {len(debts)}"
+    user_service = UserService(db)
+    juz_service = JuzService(db)
 
-        await callback.message.answer(
-            text,
-            parse_mode="Markdown",
-            reply_markup=builder.as_markup()
-        )
-    finally:
-        db.close()
+    user = await user_service.get_by_telegram_id(callback.from_user.id)
+    if not user:
+        await callback.message.answer("Вы еще не зарегистрированы. Используйте /start")
+        return
+
+    debts = await juz_service.get_user_debts(user)
+
+    if not debts:
+        await callback.message.answer("✨ У вас нет долгов! Машаллах!")
+        return
+
+    # Группируем долги по хатмам
+    debts_by_hatm = await _group_by_hatm(juz_service, debts)
+
+    text = "⚠️ *Ваши долги:*\n\n"
+    builder = InlineKeyboardBuilder()
+
+    for (hatm_id, group_name, hatm_number), group_debts in debts_by_hatm.items():
+        text += f"🕌 *{group_name}* (Хатм #{hatm_number})\n"
+        for debt in group_debts:
+            text += f"  • Джуз {debt.juz_number}\n"
+            builder.add(InlineKeyboardButton(
+                text=f"✅ Джуз {debt.juz_number} ({group_name})",
+                callback_data=f"complete_juz:{debt.id}"
+            ))
+        text += "\n"
+
+    builder.adjust(1)
+    text += f"Всего долгов: {len(debts)}"
+
+    await callback.message.answer(
+        text,
+        parse_mode="Markdown",
+        reply_markup=builder.as_markup()
+    )
 
 
 @router.callback_query(F.data.startswith("complete_juz:"))
-async def callback_complete_juz(callback: CallbackQuery):
+async def callback_complete_juz(callback: CallbackQuery, db: AsyncSession):
     """Отметить джуз как прочитанный"""
     juz_id = int(callback.data.split(":")[1])
 
-    db = SessionLocal()
-    try:
-        user_service = UserService(db)
-        juz_service = JuzService(db)
-        hatm_service = HatmService(db)
-        group_service = GroupService(db)
-
-        user = user_service.get_by_telegram_id(callback.from_user.id)
-        if not user:
-            await callback.answer("Ошибка авторизации", show_alert=True)
-            return
-
-        juz = juz_service.get_by_id(juz_id)
-        if not juz:
-            await callback.answer("Джуз не найден", show_alert=True)
-            return
-
-        if juz.user_id != user.id:
-            await callback.answer("Это не ваш джуз", show_alert=True)
-            return
-
-        if juz.status == JuzStatus.COMPLETED:
-            await callback.answer("Джуз уже отмечен как прочитанный", show_alert=True)
-            return
-
-        juz = juz_service.mark_completed(juz)
-
-        # Проверяем, завершен ли хатм
-        hatm = hatm_service.get_by_id(juz.hatm_id)
-        hatm_completed = False
-        group = None
-        if hatm:
-            hatm_completed = hatm_service.check_and_complete(hatm)
-            group = db.query(Group).filter(Group.id == hatm.group_id).first()
-
-        await callback.answer("Джуз отмечен как прочитанный! Баракаллаху фикум! 🤲", show_alert=True)
-
-        # Получаем название группы для сообщения
-        group_name = group.name if group else "группы"
-
-        # Обновляем сообщение
-        await callback.message.edit_text(
-            f"✅ Джуз {juz.juz_number} ({group_name}) отмечен как прочитанный!\n\n"
-            f"{'🎉 Хатм завершен! Аллахумма баракалана!' if hatm_completed else 'Продолжайте в том же духе!'}"
-        )
+    user_service = UserService(db)
+    juz_service = JuzService(db)
+    hatm_service = HatmService(db)
+
+    user = await user_service.get_by_telegram_id(callback.from_user.id)
+    if not user:
+        await callback.answer("Ошибка авторизации", show_alert=True)
+        return
+
+    juz = await juz_service.get_by_id(juz_id)
+    if not juz:
+        await callback.answer("Джуз не найден", show_alert=True)
+        return
+
+    if juz.user_id != user.id:
+        await callback.answer("Это не ваш джуз", show_alert=True)
+        return
+
+    if juz.status == JuzStatus.COMPLETED:
+        await callback.answer("Джуз уже отмечен как прочитанный", show_alert=True)
+        return
+
+    juz = await juz_service.mark_completed(juz)
+
+    # Проверяем, завершен ли хатм
+    hatm = await hatm_service.get_by_id(juz.hatm_id)
+    hatm_completed = False
+    group = None
+    if hatm:
+        hatm_completed = await hatm_service.check_and_complete(hatm, completed_by=user)
+        group = await db.get(Group, hatm.group_id)
+
+    # Фиксируем отметку до ответа пользователю (commit единицы работы апдейта
+    # после обработчика тогда ничего не делает)
+    await db.commit()
+
+    await callback.answer("Джуз отмечен как прочитанный! Баракаллаху фикум! 🤲", show_alert=True)
+
+    # Получаем название группы для сообщения
+    group_name = group.name if group else "группы"
 
-        # Если хатм завершен, отправляем уведомления всем участникам
-        if hatm_completed and group:
-            try:
-                members = group_service.get_members(group)
-                for member in members:
-                    if member.telegram_id and member.telegram_id != callback.from_user.id:
-                        try:
-                            await callback.bot.send_message(
-                                chat_id=member.telegram_id,
-                                text=(
-                                    f"🎉 *Хатм завершен!*\n\n"
-                                    f"Группа: {group.name}\n\n"
-                                    f"Аллахумма баракалана! Хатм группы успешно завершен!\n"
-                                    f"Баракаллаху фикум всем участникам! 🤲"
-                                ),
-                                parse_mode="Markdown"
-                            )
-                        except Exception as e:
-                            logger.error(f"Failed to notify user {member.telegram_id}: {e}")
-            except Exception as e:
-                logger.error(f"Failed to send hatm completion notifications: {e}")
-    finally:
-        db.close()
+    # Обновляем сообщение
+    await callback.message.edit_text(
+        f"✅ Джуз {juz.juz_number} ({group_name}) отмечен как прочитанный!\n\n"
+        f"{'🎉 Хатм завершен! Аллахумма баракалана!' if hatm_completed else 'Продолжайте в том же духе!'}"
+    )
@@ -1,126 +1,309 @@
 from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from typing import List
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import asyncio
 import logging
+import os
+import time
 
-from app.models.models import User, JuzAssignment, Hatm, Group
+from app import metrics
 
 logger = logging.getLogger(__name__)
 
+# Лимиты Telegram: ~30 сообщений в секунду на бота и ~1 сообщение в секунду в один чат
+NOTIFY_WORKERS = int(os.getenv("NOTIFY_WORKERS", "4"))
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "10000"))
+NOTIFY_GLOBAL_RATE = float(os.getenv("NOTIFY_GLOBAL_RATE", "25"))
+NOTIFY_CHAT_RATE = float(os.getenv("NOTIFY_CHAT_RATE", "1"))
+NOTIFY_MAX_RETRIES = int(os.getenv("NOTIFY_MAX_RETRIES", "3"))
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity про запас"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self) -> float:
+        """Забрать токен. Возвращает, сколько секунд нужно подождать до его появления"""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def is_idle(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+@dataclass
+class OutgoingMessage:
+    chat_id: int
+    text: str
+    parse_mode: Optional[str] = "Markdown"
+    reply_markup: Optional[InlineKeyboardMarkup] = None
+    attempts: int = 0
+    enqueued_at: float = field(default_factory=time.monotonic)
+    future: Optional[asyncio.Future] = None
+
 
 class NotificationService:
-    def __init__(self, bot: Bot):
+    """
+    Центральная очередь отправки уведомлений.
+    Все сообщения проходят через пул воркеров с общим и per-chat token bucket,
+    при 429 воркеры выдерживают retry_after и повторяют отправку.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        workers: int = NOTIFY_WORKERS,
+        queue_size: int = NOTIFY_QUEUE_SIZE,
+        global_rate: float = NOTIFY_GLOBAL_RATE,
+        chat_rate: float = NOTIFY_CHAT_RATE,
+        max_retries: int = NOTIFY_MAX_RETRIES
+    ):
         self.bot = bot
+        self.workers_count = workers
+        self.chat_rate = chat_rate
+        self.max_retries = max_retries
 
-    async def notify_juz_assigned(self, user: User, juz_assignments: List[JuzAssignment], hatm: Hatm, group: Group):
-        """Уведомить пользователя о назначенных джузах"""
-        try:
-            juz_numbers = sorted([j.juz_number for j in juz_assignments])
-            juz_list = ", ".join(str(n) for n in juz_numbers)
-
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(
-                    text="📋 Мои джузы",
-                    callback_data="my_juzs"
-                )]
-            ])
-
-            text = (
-                f"📖 *Новый хатм начат!*\n\n"
-                f"Группа: {group.name}\n"
-                f"Срок: {hatm.duration_days} дн.\n\n"
-                f"Вам назначены джузы: *{juz_list}*\n\n"
-                f"Да поможет вам Аллах в чтении Корана! 🤲"
-            )
+        self._queue: "asyncio.Queue[OutgoingMessage]" = asyncio.Queue(maxsize=queue_size)
+        self._workers: List[asyncio.Task] = []
+        self._global_bucket = TokenBucket(global_rate, global_rate)
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._paused_until = 0.0
 
-            await self.bot.send_message(
-                chat_id=user.telegram_id,
-                text=text,
-                parse_mode="Markdown",
-                reply_markup=keyboard
-            )
-        except Exception as e:
-            logger.error(f"Failed to send notification to user {user.telegram_id}: {e}")
+        # Метрики очереди
+        self.sent_count = 0
+        self.failed_count = 0
+        self.retry_after_count = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self._latency_total = 0.0
 
-    async def notify_hatm_completed(self, user: User, hatm: Hatm, group: Group):
-        """Уведомить пользователя о завершении хатма"""
-        try:
-            text = (
-                f"🎉 *Хатм завершен!*\n\n"
-                f"Группа: {group.name}\n\n"
-                f"Аллахумма баракалана! Хатм группы успешно завершен!\n"
-                f"Баракаллаху фикум всем участникам! 🤲"
-            )
+    # ============== Очередь и воркеры ==============
 
-            await self.bot.send_message(
-                chat_id=user.telegram_id,
-                text=text,
-                parse_mode="Markdown"
-            )
-        except Exception as e:
-            logger.error(f"Failed to send completion notification to user {user.telegram_id}: {e}")
+    async def start(self) -> None:
+        """Запустить воркеры отправки"""
+        if self._workers:
+            return
+        for i in range(self.workers_count):
+            self._workers.append(asyncio.create_task(self._worker(), name=f"notify-worker-{i}"))
+        metrics.notification_queue_depth.set_function(self._queue.qsize)
+        logger.info(f"Notification dispatcher started with {self.workers_count} workers")
 
-    async def notify_reminder(self, user: User, juz_assignments: List[JuzAssignment], hatm: Hatm, days_left: int):
-        """Напоминание о непрочитанных джузах"""
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Дождаться отправки очереди (не дольше timeout) и остановить воркеры"""
+        if not self._workers:
+            return
         try:
-            juz_numbers = sorted([j.juz_number for j in juz_assignments])
-            juz_list = ", ".join(str(n) for n in juz_numbers)
-
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[])
-
-            for juz in juz_assignments:
-                keyboard.inline_keyboard.append([
-                    InlineKeyboardButton(
-                        text=f"✅ Джуз {juz.juz_number} прочитан",
-                        callback_data=f"complete_juz:{juz.id}"
-                    )
-                ])
-
-            text = (
-                f"⏰ *Напоминание*\n\n"
-                f"До окончания хатма осталось: {days_left} дн.\n\n"
-                f"У вас есть непрочитанные джузы: *{juz_list}*\n\n"
-                f"Не забудьте прочитать их вовремя! 📖"
-            )
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Notification queue not drained on shutdown: {self._queue.qsize()} left")
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+        metrics.notification_queue_depth.set_function(None)
 
-            await self.bot.send_message(
-                chat_id=user.telegram_id,
-                text=text,
-                parse_mode="Markdown",
-                reply_markup=keyboard
-            )
-        except Exception as e:
-            logger.error(f"Failed to send reminder to user {user.telegram_id}: {e}")
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
 
-    async def notify_debt_created(self, user: User, juz_assignments: List[JuzAssignment]):
-        """Уведомить пользователя о появлении долгов"""
-        try:
-            juz_numbers = sorted([j.juz_number for j in juz_assignments])
-            juz_list = ", ".join(str(n) for n in juz_numbers)
-
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(
-                    text="⚠️ Мои долги",
-                    callback_data="my_debts"
-                )]
-            ])
-
-            text = (
-                f"⚠️ *У вас появились долги*\n\n"
-                f"Хатм завершился, но у вас остались непрочитанные джузы: *{juz_list}*\n\n"
-                f"Вы можете закрыть их в любое время. 📖"
-            )
+    def get_stats(self) -> dict:
+        """Метрики очереди уведомлений"""
+        return {
+            "queue_depth": self._queue.qsize(),
+            "workers": len(self._workers),
+            "sent": self.sent_count,
+            "failed": self.failed_count,
+            "retry_after": self.retry_after_count,
+            "last_latency": round(self.last_latency, 3),
+            "avg_latency": round(self._latency_total / self.sent_count, 3) if self.sent_count else 0.0,
+            "max_latency": round(self.max_latency, 3),
+        }
+
+    async def _worker(self) -> None:
+        while True:
+            message = await self._queue.get()
+            try:
+                await self._deliver(message)
+                if message.future and not message.future.done():
+                    message.future.set_result(None)
+            except asyncio.CancelledError:
+                if message.future and not message.future.done():
+                    message.future.cancel()
+                raise
+            except Exception as e:
+                self.failed_count += 1
+                if message.future and not message.future.done():
+                    message.future.set_exception(e)
+                else:
+                    logger.error(f"Failed to send notification to {message.chat_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _wait_for_slot(self, chat_id: int) -> None:
+        """Дождаться паузы после 429, глобального и per-chat лимита"""
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
 
-            await self.bot.send_message(
-                chat_id=user.telegram_id,
-                text=text,
-                parse_mode="Markdown",
-                reply_markup=keyboard
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > 10000:
+                self._chat_buckets = {k: b for k, b in self._chat_buckets.items() if not b.is_idle()}
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, 1)
+
+        delay = max(self._global_bucket.reserve(), bucket.reserve())
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _deliver(self, message: OutgoingMessage) -> None:
+        while True:
+            await self._wait_for_slot(message.chat_id)
+            message.attempts += 1
+            try:
+                await self.bot.send_message(
+                    chat_id=message.chat_id,
+                    text=message.text,
+                    parse_mode=message.parse_mode,
+                    reply_markup=message.reply_markup
+                )
+            except TelegramRetryAfter as e:
+                self.retry_after_count += 1
+                metrics.telegram_errors_total.inc(code="429")
+                # Flood control действует на весь бот - приостанавливаем все воркеры
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+                if message.attempts > self.max_retries:
+                    raise
+                logger.warning(f"Telegram flood control, retry in {e.retry_after}s (chat {message.chat_id})")
+                continue
+            except Exception as e:
+                metrics.telegram_errors_total.inc(code=metrics.telegram_error_code(e))
+                raise
+
+            latency = time.monotonic() - message.enqueued_at
+            self.sent_count += 1
+            self.last_latency = latency
+            self.max_latency = max(self.max_latency, latency)
+            self._latency_total += latency
+            metrics.notifications_sent_total.inc()
+            metrics.notification_send_latency.observe(latency)
+            return
+
+    # ============== Уведомления ==============
+
+    async def send(self, kind: str, chat_id: int, payload: dict) -> None:
+        """
+        Отправить уведомление типа kind через очередь и дождаться результата.
+        Используется outbox-воркером: ждёт места в очереди вместо отбрасывания
+        и пробрасывает ошибку Telegram, если отправить не удалось.
+        """
+        text, keyboard = RENDERERS[kind](**payload)
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(OutgoingMessage(chat_id, text, reply_markup=keyboard, future=future))
+        await future
+
+
+# ============== Тексты уведомлений ==============
+
+def render_juz_assigned(
+    juz_numbers: Iterable[int],
+    group_name: str,
+    duration_days: int,
+    title: str = "Новый хатм начат!"
+) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """Уведомление о назначенных джузах"""
+    juz_list = ", ".join(str(n) for n in sorted(juz_numbers))
+
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(
+            text="📋 Мои джузы",
+            callback_data="my_juzs"
+        )]
+    ])
+
+    text = (
+        f"📖 *{title}*\n\n"
+        f"Группа: {group_name}\n"
+        f"Срок: {duration_days} дн.\n\n"
+        f"Вам назначены джузы: *{juz_list}*\n\n"
+        f"Да поможет вам Аллах в чтении Корана! 🤲"
+    )
+    return text, keyboard
+
+
+def render_hatm_completed(group_name: str) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """Уведомление о завершении хатма"""
+    text = (
+        f"🎉 *Хатм завершен!*\n\n"
+        f"Группа: {group_name}\n\n"
+        f"Аллахумма баракалана! Хатм группы успешно завершен!\n"
+        f"Баракаллаху фикум всем участникам! 🤲"
+    )
+    return text, None
+
+
+def render_reminder(juzs: List[Tuple[int, int]], days_left: int) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """Напоминание о непрочитанных джузах. juzs - список (id, номер джуза)"""
+    juzs = sorted(juzs, key=lambda j: j[1])
+    juz_list = ", ".join(str(number) for _, number in juzs)
+
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[])
+
+    for juz_id, juz_number in juzs:
+        keyboard.inline_keyboard.append([
+            InlineKeyboardButton(
+                text=f"✅ Джуз {juz_number} прочитан",
+                callback_data=f"complete_juz:{juz_id}"
             )
-        except Exception as e:
-            logger.error(f"Failed to send debt notification to user {user.telegram_id}: {e}")
+        ])
+
+    text = (
+        f"⏰ *Напоминание*\n\n"
+        f"До окончания хатма осталось: {days_left} дн.\n\n"
+        f"У вас есть непрочитанные джузы: *{juz_list}*\n\n"
+        f"Не забудьте прочитать их вовремя! 📖"
+    )
+    return text, keyboard
+
+
+def render_debt_created(juz_numbers: Iterable[int]) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """Уведомление о появлении долгов"""
+    juz_list = ", ".join(str(n) for n in sorted(juz_numbers))
+
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(
+            text="⚠️ Мои долги",
+            callback_data="my_debts"
+        )]
+    ])
+
+    text = (
+        f"⚠️ *У вас появились долги*\n\n"
+        f"Хатм завершился, но у вас остались непрочитанные джузы: *{juz_list}*\n\n"
+        f"Вы можете закрыть их в любое время. 📖"
+    )
+    return text, keyboard
+
 
-    async def notify_all_members_hatm_completed(self, members: List[User], hatm: Hatm, group: Group):
-        """Уведомить всех участников группы о завершении хатма"""
-        for user in members:
-            await self.notify_hatm_completed(user, hatm, group)
+# Типы уведомлений, которые можно записать в outbox (kind -> функция текста)
+RENDERERS: Dict[str, Callable[..., Tuple[str, Optional[InlineKeyboardMarkup]]]] = {
+    "juz_assigned": render_juz_assigned,
+    "hatm_completed": render_hatm_completed,
+    "reminder": render_reminder,
+    "debt_created": render_debt_created,
+}
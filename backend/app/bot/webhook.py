@@ -0,0 +1,93 @@
+# Приём апдейтов Telegram через webhook (BOT_MODE=webhook)
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+from typing import Set
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.types import Update
+from fastapi import Request, Response
+from pydantic import ValidationError
+
+from app.query_stats import detached_context
+
+logger = logging.getLogger(__name__)
+
+# polling - бот сам забирает апдейты (getUpdates), webhook - Telegram присылает их в API
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+# Публичный https-адрес API, на который Telegram будет слать апдейты
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "").rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+# Секрет из заголовка X-Telegram-Bot-Api-Secret-Token (по умолчанию выводится из токена бота)
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def webhook_enabled() -> bool:
+    return BOT_MODE == "webhook"
+
+
+def webhook_url() -> str:
+    return f"{WEBHOOK_BASE_URL}{WEBHOOK_PATH}"
+
+
+def webhook_secret(token: str) -> str:
+    """Секрет webhook: допустимы только A-Z, a-z, 0-9, _ и -, поэтому hex от токена"""
+    return WEBHOOK_SECRET or hashlib.sha256(token.encode()).hexdigest()
+
+
+class WebhookHandler:
+    """
+    Endpoint для апдейтов Telegram. Проверяет секрет, передаёт апдейт в Dispatcher
+    фоновой задачей и сразу отвечает 200: Telegram не ждёт обработчиков,
+    а медленный обработчик не задерживает следующие апдейты.
+    """
+
+    def __init__(self, bot: Bot, dp: Dispatcher, secret: str):
+        self.bot = bot
+        self.dp = dp
+        self.secret = secret
+        # Ссылки на задачи, чтобы их не собрал GC и можно было дождаться при остановке
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def handle(self, request: Request) -> Response:
+        token = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token, self.secret):
+            return Response(status_code=401)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except (ValueError, ValidationError) as e:
+            logger.warning(f"Invalid webhook update: {e}")
+            return Response(status_code=400)
+
+        # Обработка апдейта не относится к HTTP-запросу webhook и его статистике SQL
+        task = asyncio.create_task(self._process(update), context=detached_context())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return Response(status_code=200)
+
+    async def _process(self, update: Update) -> None:
+        try:
+            result = await self.dp.feed_update(self.bot, update)
+            # Обработчик может вернуть метод вместо вызова - выполняем его сами
+            if isinstance(result, TelegramMethod):
+                await self.bot(result)
+        except Exception as e:
+            logger.error(f"Webhook update {update.update_id} failed: {e}")
+
+    @property
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    async def close(self, timeout: float = 10.0) -> None:
+        """Дождаться обработки принятых апдейтов и закрыть сессию бота"""
+        if self._tasks:
+            _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+        await self.bot.session.close()
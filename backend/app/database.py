@@ -1,27 +1,77 @@
-from sqlalchemy import create_engine
+from contextlib import asynccontextmanager, contextmanager
+from typing import Callable
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import QueuePool, StaticPool
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
 import os
 
+from app.query_stats import QUERY_STATS_ENABLED, install as install_query_stats
+from app.sqlite import (
+    SQLITE_MAX_OVERFLOW, SQLITE_POOL_SIZE, SerializedWriteSession, apply_pragmas, production_profile, writer_queue
+)
+
 # Railway использует postgres://, но SQLAlchemy требует postgresql://
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./hatm.db")
 if DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
-# Оптимизированные настройки для PostgreSQL
-if "sqlite" in DATABASE_URL:
-    # SQLite - для локальной разработки
+# Ключ advisory lock, под которым процессы по очереди выполняют миграции
+MIGRATION_LOCK_KEY = 727273
+
+
+def get_async_database_url(url: str) -> str:
+    """Преобразовать URL базы данных в URL для асинхронного драйвера"""
+    if url.startswith("sqlite:///"):
+        return url.replace("sqlite:///", "sqlite+aiosqlite:///", 1)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    if url.startswith("postgresql+psycopg2://"):
+        return url.replace("postgresql+psycopg2://", "postgresql+asyncpg://", 1)
+    return url
+
+
+ASYNC_DATABASE_URL = get_async_database_url(DATABASE_URL)
+
+# Движки: SQLite (профиль production или legacy, см. app.sqlite) или PostgreSQL
+if production_profile(DATABASE_URL):
+    # SQLite в продакшене: WAL и прагмы на каждом соединении, пул вместо одного
+    # общего соединения (app.sqlite); синхронный движок - только для миграций
+    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+    apply_pragmas(engine)
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=SQLITE_POOL_SIZE,
+        max_overflow=SQLITE_MAX_OVERFLOW,
+        pool_timeout=30
+    )
+    apply_pragmas(async_engine.sync_engine)
+elif "sqlite" in DATABASE_URL:
+    # SQLite - для локальной разработки (SQLITE_PROFILE=legacy или база в памяти)
     engine = create_engine(
         DATABASE_URL,
         connect_args={"check_same_thread": False},
         poolclass=StaticPool
     )
+    # Асинхронный движок: aiosqlite сам выбирает пул для файловой БД
+    async_engine = create_async_engine(ASYNC_DATABASE_URL)
 else:
-    # PostgreSQL - с connection pooling для продакшена
+    # PostgreSQL - синхронный движок нужен только для миграций при старте
     engine = create_engine(
         DATABASE_URL,
         poolclass=QueuePool,
+        pool_size=5,
+        max_overflow=0,
+        pool_recycle=1800,
+        pool_pre_ping=True,
+        echo=False
+    )
+    # PostgreSQL - асинхронный движок (asyncpg) с connection pooling для продакшена
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
         pool_size=20,           # Базовый размер пула
         max_overflow=30,        # Дополнительные соединения при пиковой нагрузке
         pool_timeout=30,        # Таймаут ожидания соединения
@@ -30,50 +80,134 @@ else:
         echo=False              # Отключить SQL логирование
     )
 
+if QUERY_STATS_ENABLED:
+    install_query_stats(async_engine.sync_engine)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# expire_on_commit=False: после commit атрибуты остаются загруженными, поэтому
+# объекты, записанные за единицу работы, не перечитываются (refresh не нужен),
+# а обращение к ним в асинхронном коде не требует ленивой загрузки
+# На SQLite пишущие транзакции процесса идут через очередь писателя (app.sqlite)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    class_=SerializedWriteSession if production_profile(DATABASE_URL) else AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 Base = declarative_base()
 
 
-def get_db():
-    """Dependency для получения сессии базы данных"""
-    db = SessionLocal()
-    try:
+@asynccontextmanager
+async def unit_of_work():
+    """
+    Сессия на единицу работы (HTTP-запрос, апдейт бота, пачка фоновой задачи).
+    Сервисы только добавляют изменения и делают flush, commit выполняется
+    один раз при выходе из блока; при исключении изменения откатываются.
+    """
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+        await db.commit()
+
+
+async def get_db():
+    """
+    Dependency для получения асинхронной сессии базы данных: одна транзакция
+    на HTTP-запрос, commit после обработчика и до отправки ответа
+    (HTTPException из обработчика откатывает изменения)
+    """
+    async with unit_of_work() as db:
+        yield db
+
+
+_AFTER_COMMIT_KEY = "after_commit_callbacks"
+
+
+def after_commit(session, callback: Callable[[], None]) -> None:
+    """Выполнить callback после успешного commit сессии; при rollback он отбрасывается"""
+    session.info.setdefault(_AFTER_COMMIT_KEY, []).append(callback)
+
+
+@event.listens_for(Session, "after_commit")
+def _run_after_commit(session: Session) -> None:
+    for callback in session.info.pop(_AFTER_COMMIT_KEY, ()):
+        callback()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_commit(session: Session) -> None:
+    session.info.pop(_AFTER_COMMIT_KEY, None)
 
 
 def init_db():
-    """Инициализация базы данных"""
-    from app.models import models  # noqa
-    Base.metadata.create_all(bind=engine)
+    """
+    Инициализация базы данных: проверка версии схемы одним запросом и, если нужно,
+    применение миграций (app.migrations; отдельно - python -m app.manage migrate)
+    """
+    from app.migrations import ensure_schema
+    ensure_schema()
 
-    # Автоматические миграции
-    run_migrations()
 
+@contextmanager
+def migration_lock():
+    """
+    При нескольких процессах (воркеры uvicorn + бот) миграции могут запуститься одновременно:
+    они выполняются по очереди под advisory lock (PostgreSQL) или flock (SQLite)
+    """
+    if "sqlite" in DATABASE_URL:
+        with _sqlite_file_lock("migrate"):
+            yield
+        return
 
-def run_migrations():
-    """Выполнить миграции базы данных"""
     from sqlalchemy import text
-    import logging
 
     with engine.connect() as conn:
-        # Миграция: сделать user_id nullable в juz_assignments
-        if "postgresql" in DATABASE_URL:
-            try:
-                # Проверяем, является ли колонка nullable
-                result = conn.execute(text("""
-                    SELECT is_nullable
-                    FROM information_schema.columns
-                    WHERE table_name = 'juz_assignments' AND column_name = 'user_id'
-                """))
-                row = result.fetchone()
-
-                if row and row[0] == 'NO':
-                    # Колонка NOT NULL - нужно изменить
-                    conn.execute(text("ALTER TABLE juz_assignments ALTER COLUMN user_id DROP NOT NULL"))
-                    conn.commit()
-                    logging.info("Migration: user_id in juz_assignments is now nullable")
-            except Exception as e:
-                logging.warning(f"Migration check failed (may be OK on first run): {e}")
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        conn.commit()
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+            conn.commit()
+
+
+@contextmanager
+def _sqlite_file_lock(suffix: str):
+    """Блокирующий flock на файле рядом с базой SQLite (процессы одной машины)"""
+    import fcntl
+    from sqlalchemy.engine import make_url
+
+    database_path = make_url(DATABASE_URL).database
+    if not database_path or database_path == ":memory:":
+        yield
+        return
+
+    with open(f"{database_path}.{suffix}", "a+") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@asynccontextmanager
+async def serialized_writes():
+    """
+    Выполнять блок по очереди с другими писателями процесса на SQLite (например,
+    проверку и запись, которые должны идти без вклинившейся записи); на PostgreSQL ничего не делает
+    """
+    if "sqlite" not in DATABASE_URL:
+        yield
+        return
+    acquired = await writer_queue.acquire()
+    try:
+        yield
+    finally:
+        if acquired:
+            writer_queue.release()
+
+
+async def close_db():
+    """Закрыть соединения асинхронного пула"""
+    await async_engine.dispose()
@@ -0,0 +1,5 @@
+from .outbox_drainer import OutboxDrainer
+from .expiry_sweeper import ExpirySweeper
+from .reminder_scheduler import ReminderScheduler
+
+__all__ = ["OutboxDrainer", "ExpirySweeper", "ReminderScheduler"]
@@ -0,0 +1,48 @@
+import asyncio
+import logging
+import os
+
+from app.database import unit_of_work
+from app.metrics import job_timer
+from app.services.hatm_service import HatmService
+
+logger = logging.getLogger(__name__)
+
+EXPIRY_SWEEP_INTERVAL = float(os.getenv("EXPIRY_SWEEP_INTERVAL", "60"))
+EXPIRY_SWEEP_BATCH = int(os.getenv("EXPIRY_SWEEP_BATCH", "500"))
+
+
+class ExpirySweeper:
+    """
+    Периодически завершает хатмы с истекшим ends_at:
+    непрочитанные джузы становятся долгами, должникам уходит уведомление.
+    """
+
+    def __init__(self, interval: float = EXPIRY_SWEEP_INTERVAL, batch_size: int = EXPIRY_SWEEP_BATCH):
+        self.interval = interval
+        self.batch_size = batch_size
+
+    async def run(self) -> None:
+        logger.info("Expiry sweeper started")
+        while True:
+            try:
+                with job_timer("expiry_sweeper"):
+                    await self.sweep_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Expiry sweeper error: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def sweep_once(self) -> int:
+        """Завершить все просроченные хатмы пачками. Возвращает их количество"""
+        total = 0
+        while True:
+            async with unit_of_work() as db:
+                expired = await HatmService(db).expire_overdue(limit=self.batch_size)
+            total += expired
+            if expired < self.batch_size:
+                break
+        if total:
+            logger.info(f"Expiry sweeper: completed {total} overdue hatms")
+        return total
@@ -0,0 +1,106 @@
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNotFound
+from collections import defaultdict
+from datetime import timedelta
+import asyncio
+import logging
+import os
+import time
+
+from app.database import unit_of_work
+from app.metrics import job_timer
+from app.bot.notifications import NotificationService
+from app.services.outbox_service import OutboxService
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1.0"))
+# Строки в PROCESSING дольше этого времени считаются брошенными (процесс упал)
+OUTBOX_STALE_AFTER = int(os.getenv("OUTBOX_STALE_AFTER", "300"))
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", "7"))
+
+# Ошибки, при которых повторная отправка бессмысленна (бот заблокирован, чат не найден)
+PERMANENT_ERRORS = (TelegramForbiddenError, TelegramBadRequest, TelegramNotFound)
+
+
+class OutboxDrainer:
+    """
+    Фоновый воркер: забирает уведомления из outbox пачками,
+    отправляет через очередь NotificationService и отмечает результат.
+    """
+
+    def __init__(
+        self,
+        notification_service: NotificationService,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        poll_interval: float = OUTBOX_POLL_INTERVAL
+    ):
+        self.notification_service = notification_service
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.stale_after = timedelta(seconds=OUTBOX_STALE_AFTER)
+        self._last_purge = 0.0
+
+    async def run(self) -> None:
+        """Основной цикл: пока есть уведомления - отправляем пачками, иначе ждём"""
+        logger.info("Outbox drainer started")
+        while True:
+            try:
+                with job_timer("outbox_drainer"):
+                    claimed = await self.drain_once()
+                await self._purge_if_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Outbox drainer error: {e}")
+                claimed = 0
+            if claimed < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+    async def drain_once(self) -> int:
+        """
+        Отправить одну пачку. Возвращает количество забранных уведомлений.
+        Захват пачки и отметка результата - отдельные транзакции: во время
+        отправки соединение с базой не занято, а блокировка записи не удерживается.
+        """
+        async with unit_of_work() as db:
+            batch = await OutboxService(db).claim_batch(self.batch_size, self.stale_after)
+        if not batch:
+            return 0
+
+        results = await asyncio.gather(
+            *(self.notification_service.send(kind, chat_id, payload) for _, kind, chat_id, payload in batch),
+            return_exceptions=True
+        )
+
+        sent_ids = []
+        retry = defaultdict(list)
+        permanent = defaultdict(list)
+        for (outbox_id, _, chat_id, _), result in zip(batch, results):
+            if not isinstance(result, BaseException):
+                sent_ids.append(outbox_id)
+            elif isinstance(result, PERMANENT_ERRORS):
+                permanent[str(result)].append(outbox_id)
+            else:
+                logger.warning(f"Outbox message {outbox_id} to {chat_id} failed: {result}")
+                retry[str(result)].append(outbox_id)
+
+        async with unit_of_work() as db:
+            outbox = OutboxService(db)
+            await outbox.mark_sent(sent_ids)
+            for error, ids in permanent.items():
+                await outbox.mark_failed(ids, error, permanent=True)
+            for error, ids in retry.items():
+                await outbox.mark_failed(ids, error)
+
+        return len(batch)
+
+    async def _purge_if_due(self) -> None:
+        """Раз в час удалять старые доставленные уведомления"""
+        if time.monotonic() - self._last_purge < 3600:
+            return
+        self._last_purge = time.monotonic()
+        async with unit_of_work() as db:
+            purged = await OutboxService(db).purge_sent(timedelta(days=OUTBOX_RETENTION_DAYS))
+            if purged:
+                logger.info(f"Outbox: purged {purged} delivered notifications")
@@ -0,0 +1,64 @@
+import asyncio
+import logging
+import os
+from datetime import timedelta
+
+from app.database import unit_of_work
+from app.metrics import job_timer
+from app.services.juz_service import JuzService
+
+logger = logging.getLogger(__name__)
+
+# Как часто искать пользователей, которым пора напомнить (секунды)
+REMINDER_CHECK_INTERVAL = float(os.getenv("REMINDER_CHECK_INTERVAL", "300"))
+# Минимальный интервал между напоминаниями по одному хатму (часы)
+REMINDER_INTERVAL_HOURS = float(os.getenv("REMINDER_INTERVAL_HOURS", "24"))
+# Напоминания размазываются случайной задержкой в этом окне (секунды)
+REMINDER_SPREAD = float(os.getenv("REMINDER_SPREAD", "1800"))
+REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", "1000"))
+
+
+class ReminderScheduler:
+    """
+    Периодически ставит в outbox напоминания о непрочитанных джузах.
+    Саму отправку с ограничением скорости выполняет OutboxDrainer.
+    """
+
+    def __init__(
+        self,
+        check_interval: float = REMINDER_CHECK_INTERVAL,
+        interval_hours: float = REMINDER_INTERVAL_HOURS,
+        spread: float = REMINDER_SPREAD,
+        batch_size: int = REMINDER_BATCH_SIZE
+    ):
+        self.check_interval = check_interval
+        self.interval = timedelta(hours=interval_hours)
+        self.spread = spread
+        self.batch_size = batch_size
+
+    async def run(self) -> None:
+        logger.info("Reminder scheduler started")
+        while True:
+            try:
+                with job_timer("reminder_scheduler"):
+                    await self.schedule_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Reminder scheduler error: {e}")
+            await asyncio.sleep(self.check_interval)
+
+    async def schedule_once(self) -> int:
+        """Запланировать все назревшие напоминания пачками. Возвращает их количество"""
+        total = 0
+        while True:
+            async with unit_of_work() as db:
+                scheduled = await JuzService(db).schedule_reminders(
+                    self.interval, self.spread, limit=self.batch_size
+                )
+            total += scheduled
+            if scheduled < self.batch_size:
+                break
+        if total:
+            logger.info(f"Reminder scheduler: queued {total} reminders")
+        return total
@@ -0,0 +1,106 @@
+# Выбор лидера: ровно один процесс получает апдейты Telegram и выполняет фоновые задачи
+import logging
+import os
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.database import DATABASE_URL, async_engine
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory lock в PostgreSQL (любое число, общее для всех процессов приложения)
+LEADER_LOCK_KEY = int(os.getenv("LEADER_LOCK_KEY", "727274"))
+
+
+class LeaderLock:
+    """
+    Эксклюзивная блокировка на уровне базы данных.
+    PostgreSQL: session-level advisory lock на выделенном соединении - снимается
+    сервером сам, если процесс упал или соединение разорвано.
+    SQLite: flock на файле рядом с базой - снимается ОС при завершении процесса
+    (все процессы работают на одной машине с одним файлом базы).
+    """
+
+    def __init__(self, key: int = LEADER_LOCK_KEY):
+        self.key = key
+        self._connection: Optional[AsyncConnection] = None
+        self._file = None
+
+    @property
+    def held(self) -> bool:
+        return self._connection is not None or self._file is not None
+
+    async def acquire(self) -> bool:
+        """Попытаться стать лидером без ожидания"""
+        if self.held:
+            return True
+        if "sqlite" in DATABASE_URL:
+            return self._acquire_file()
+
+        connection = await async_engine.connect()
+        try:
+            acquired = await connection.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.key})
+            # Session-level lock переживает commit, а соединение не остаётся "idle in transaction"
+            await connection.commit()
+        except Exception:
+            await connection.close()
+            raise
+        if not acquired:
+            await connection.close()
+            return False
+        self._connection = connection
+        return True
+
+    def _acquire_file(self) -> bool:
+        import fcntl
+
+        database_path = make_url(DATABASE_URL).database
+        if not database_path or database_path == ":memory:":
+            # База в памяти видна только этому процессу - он и лидер
+            self._file = True
+            return True
+
+        lock_file = open(f"{database_path}.leader", "a+")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._file = lock_file
+        return True
+
+    async def check(self) -> bool:
+        """Проверить, что блокировка всё ещё наша (соединение с PostgreSQL живо)"""
+        if self._connection is None:
+            return self.held
+        try:
+            await self._connection.execute(text("SELECT 1"))
+            await self._connection.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Leader lock connection lost: {e}")
+            await self._discard_connection()
+            return False
+
+    async def release(self) -> None:
+        if self._connection is not None:
+            try:
+                await self._connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.key})
+                await self._connection.commit()
+            except Exception as e:
+                logger.warning(f"Failed to release leader lock: {e}")
+            await self._discard_connection()
+        if self._file is not None:
+            if self._file is not True:
+                self._file.close()
+            self._file = None
+
+    async def _discard_connection(self) -> None:
+        connection, self._connection = self._connection, None
+        try:
+            await connection.close()
+        except Exception:
+            pass
@@ -5,19 +5,25 @@ from pathlib import Path
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from aiogram import Bot, Dispatcher
-from aiogram.enums import ParseMode
-from aiogram.client.default import DefaultBotProperties
+from fastapi.responses import PlainTextResponse, Response
 
-from app.database import init_db
+from app.database import init_db, close_db, async_engine
+from app.api.pagination import NEXT_CURSOR_HEADER
 from app.api.routes import router as api_router
-from app.bot.handlers import router as bot_router
+from app.api.responses import ORJSONResponse
+from app.bot.factory import create_bot, get_dispatcher
 from app.bot.notifications import NotificationService
+from app.bot.webhook import WebhookHandler, webhook_enabled, webhook_secret, WEBHOOK_PATH
+from app.metrics import (
+    MetricsMiddleware, bind_db_pool, metrics_exposed, monitor_event_loop, render_metrics, authorized as metrics_authorized
+)
+from app.query_stats import QueryStatsMiddleware, QUERY_STATS_ENABLED
+from app.realtime import VersionPoller, SSE_POLL_INTERVAL
+from app.static import IMMUTABLE, PrecompressedStaticFiles, SpaIndex
+from app.worker import BotRuntime, run_as_leader
 
 # Путь к статическим файлам фронтенда
 STATIC_DIR = Path(__file__).parent.parent / "static"
@@ -36,18 +42,27 @@ logger = logging.getLogger(__name__)
 BOT_TOKEN = os.getenv("BOT_TOKEN", "")
 WEBAPP_URL = os.getenv("WEBAPP_URL", "http://localhost:5173")
 DEV_MODE = os.getenv("DEV_MODE", "false").lower() == "true"
+# Запускать бота и фоновые задачи внутри веб-процесса. При нескольких воркерах
+# uvicorn их выполняет только лидер; false - если запущен отдельный python -m app.worker
+EMBED_WORKER = os.getenv("EMBED_WORKER", "true").lower() == "true"
+# Уровень gzip: 9 (по умолчанию в Starlette) почти не сжимает JSON сильнее, но заметно дороже по CPU
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+# Эндпоинт /metrics в формате Prometheus (метрики своего процесса)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# Бот и фоновые задачи (работают, только пока этот процесс - лидер)
+bot_runtime = BotRuntime()
+background_tasks = []
 
-# Глобальные переменные для бота
-bot = None
-dp = None
-notification_service = None
+# В режиме webhook апдейты принимает каждый веб-воркер
+webhook_handler = None
+if webhook_enabled() and BOT_TOKEN:
+    webhook_handler = WebhookHandler(create_bot(BOT_TOKEN), get_dispatcher(), webhook_secret(BOT_TOKEN))
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Управление жизненным циклом приложения"""
-    global bot, dp, notification_service
-
     # Startup
     logger.info("Starting application...")
 
@@ -55,38 +70,30 @@ async def lifespan(app: FastAPI):
     init_db()
     logger.info("Database initialized")
 
-    # Инициализация бота
-    if BOT_TOKEN:
-        bot = Bot(
-            token=BOT_TOKEN,
-            default=DefaultBotProperties(parse_mode=ParseMode.HTML)
-        )
-        dp = Dispatcher()
-        dp.include_router(bot_router)
-
-        # Инициализация сервиса уведомлений
-        notification_service = NotificationService(bot)
-
-        # Запуск бота в фоновом режиме
-        asyncio.create_task(start_bot())
-        logger.info("Bot started")
+    if METRICS_ENABLED:
+        bind_db_pool(async_engine.sync_engine.pool)
+        background_tasks.append(asyncio.create_task(monitor_event_loop()))
+
+    # Живые обновления об изменениях из других процессов
+    if SSE_POLL_INTERVAL > 0:
+        background_tasks.append(asyncio.create_task(VersionPoller().run()))
+
+    if EMBED_WORKER:
+        background_tasks.append(asyncio.create_task(run_as_leader(bot_runtime)))
     else:
-        logger.warning("BOT_TOKEN not set, bot will not start")
+        logger.info("EMBED_WORKER=false: bot and background jobs run in a separate worker process")
 
     yield
 
     # Shutdown
     logger.info("Shutting down application...")
-    if bot:
-        await bot.session.close()
-
-
-async def start_bot():
-    """Запуск Telegram бота"""
-    try:
-        await dp.start_polling(bot)
-    except Exception as e:
-        logger.error(f"Bot polling error: {e}")
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    if webhook_handler:
+        await webhook_handler.close()
+    await close_db()
 
 
 # Создание FastAPI приложения
@@ -94,7 +101,9 @@ app = FastAPI(
     title="Hatm Bot API",
     description="API для Telegram бота коллективного чтения Корана",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    # orjson вместо stdlib json для всех ответов
+    default_response_class=ORJSONResponse
 )
 
 # CORS настройки
@@ -114,46 +123,86 @@ app.add_middleware(
     allow_credentials=True if not DEV_MODE else False,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Курсор следующей страницы истории хатмов должен быть виден фронтенду
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
+class StreamingAwareGZipMiddleware(GZipMiddleware):
+    """
+    GZip на лету только для ответов API. Кроме SSE: сжатый поток буферизуется
+    и события задерживаются. Статика сжата при сборке (app.static).
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and (not scope["path"].startswith("/api/") or scope["path"].endswith("/events")):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
 # GZip сжатие для уменьшения размера ответов
-app.add_middleware(GZipMiddleware, minimum_size=500)
+app.add_middleware(StreamingAwareGZipMiddleware, minimum_size=500, compresslevel=GZIP_LEVEL)
+
+# Число SQL-запросов и время в БД на запрос (заголовок Server-Timing, предупреждения о N+1)
+if QUERY_STATS_ENABLED:
+    app.add_middleware(QueryStatsMiddleware)
+
+# Латентность по маршрутам и запросы в обработке для /metrics (внешний слой - полное время)
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
 
 # Подключение роутов API
 app.include_router(api_router, prefix="/api")
 
 
+if webhook_handler:
+    app.add_api_route(WEBHOOK_PATH, webhook_handler.handle, methods=["POST"], include_in_schema=False)
+
+
 @app.get("/health")
 async def health():
     """Проверка здоровья сервиса"""
     return {"status": "healthy"}
 
 
-# Раздача статических файлов фронтенда
+if METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics(authorization: str = Header(None)):
+        """Метрики процесса в текстовом формате Prometheus (только при заданном METRICS_TOKEN)"""
+        if not metrics_exposed():
+            return Response(status_code=404)
+        if not metrics_authorized(authorization):
+            return Response(status_code=401)
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+# Раздача статических файлов фронтенда (сжатие - при сборке, см. frontend/scripts/compress.mjs)
 if STATIC_DIR.exists():
-    # Монтируем папку с ассетами
-    app.mount("/assets", StaticFiles(directory=STATIC_DIR / "assets"), name="assets")
+    # Ассеты с хэшем в имени кэшируются навсегда
+    app.mount("/assets", PrecompressedStaticFiles(directory=STATIC_DIR / "assets", cache_control=IMMUTABLE), name="assets")
+
+    # Файлы из public (favicon, logo и т.д.): имена без хэша, кэш на сутки
+    public_files = PrecompressedStaticFiles(directory=STATIC_DIR, cache_control="public, max-age=86400")
+    spa_index = SpaIndex(STATIC_DIR / "index.html")
 
-    # Отдаём статические файлы (favicon, logo и т.д.)
     @app.get("/logo.png")
-    async def logo():
-        return FileResponse(STATIC_DIR / "logo.png")
+    async def logo(request: Request):
+        return await public_files.get_response("logo.png", request.scope)
 
     @app.get("/favicon.ico")
-    async def favicon():
-        favicon_path = STATIC_DIR / "favicon.ico"
-        if favicon_path.exists():
-            return FileResponse(favicon_path)
-        return FileResponse(STATIC_DIR / "logo.png")
+    async def favicon(request: Request):
+        if (STATIC_DIR / "favicon.ico").exists():
+            return await public_files.get_response("favicon.ico", request.scope)
+        return await public_files.get_response("logo.png", request.scope)
 
     # SPA fallback - все остальные маршруты отдают index.html
     @app.get("/{full_path:path}")
-    async def serve_spa(full_path: str):
+    async def serve_spa(full_path: str, request: Request):
         """Отдаём index.html для всех маршрутов SPA"""
         # Пропускаем API и health
         if full_path.startswith("api/") or full_path == "health":
             return {"detail": "Not Found"}
-        return FileResponse(STATIC_DIR / "index.html")
+        return spa_index.response(request)
 else:
     @app.get("/")
     async def root():
@@ -166,9 +215,8 @@ else:
 
 
 def get_notification_service() -> NotificationService:
-    """Получить сервис уведомлений"""
-    global notification_service
-    return notification_service
+    """Получить сервис уведомлений (None, если бот работает в другом процессе)"""
+    return bot_runtime.notification_service
 
 
 if __name__ == "__main__":
@@ -0,0 +1,83 @@
+# Служебные команды: python -m app.manage <команда>
+import argparse
+import asyncio
+import logging
+import sys
+
+from dotenv import load_dotenv
+
+# Переменные окружения нужны до импорта настроек базы данных
+load_dotenv()
+
+from app.database import close_db, engine, unit_of_work  # noqa: E402
+from app.migrations import LATEST_VERSION, MIGRATIONS, migrate, schema_version  # noqa: E402
+from app.services.hatm_service import HatmService  # noqa: E402
+
+
+async def check_counters(repair: bool, hatm_ids=None) -> int:
+    """Сверить счётчики хатмов с juz_assignments и при repair исправить расхождения"""
+    try:
+        async with unit_of_work() as db:
+            hatm_service = HatmService(db)
+            mismatches = await hatm_service.verify_counters(hatm_ids)
+            for hatm_id, stored, actual in mismatches:
+                diff = ", ".join(
+                    f"{name}: {stored[name]} -> {actual[name]}"
+                    for name in stored if stored[name] != actual[name]
+                )
+                print(f"hatm {hatm_id}: {diff}")
+
+            if not mismatches:
+                print("Counters are consistent")
+                return 0
+            if not repair:
+                print(f"{len(mismatches)} hatms have inconsistent counters (use --repair to fix)")
+                return 1
+
+            repaired = await hatm_service.repair_counters([hatm_id for hatm_id, _, _ in mismatches])
+            print(f"Repaired counters of {repaired} hatms")
+            return 0
+    finally:
+        await close_db()
+
+
+def run_migrations(status_only: bool) -> int:
+    """Применить недостающие миграции схемы (команда перед деплоем) или показать их"""
+    if status_only:
+        with engine.connect() as conn:
+            current = schema_version(conn) or 0
+        print(f"Schema version {current}, latest {LATEST_VERSION}")
+        for step in MIGRATIONS:
+            if step.version > current:
+                print(f"pending {step.version}: {step.name}")
+        return 0 if current >= LATEST_VERSION else 1
+
+    applied = migrate()
+    print(f"Applied migrations: {', '.join(map(str, applied))}" if applied else "Schema is up to date")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.manage")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    counters = commands.add_parser("counters", help="Проверить счётчики прогресса хатмов")
+    counters.add_argument("--repair", action="store_true", help="Исправить найденные расхождения")
+    counters.add_argument("--hatm", type=int, action="append", dest="hatm_ids", help="Проверить только этот хатм")
+
+    migrate_parser = commands.add_parser("migrate", help="Применить миграции схемы базы данных")
+    migrate_parser.add_argument("--status", action="store_true",
+                                help="Только показать версию и недостающие миграции (код 1, если они есть)")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.command == "counters":
+        return asyncio.run(check_counters(args.repair, args.hatm_ids))
+    if args.command == "migrate":
+        return run_migrations(args.status)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
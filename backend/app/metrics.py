@@ -0,0 +1,378 @@
+# Метрики в текстовом формате Prometheus: лёгкие счётчики в памяти процесса без зависимостей
+import asyncio
+import logging
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Токен /metrics (заголовок Authorization: Bearer <токен>); без него /metrics не отдаётся (404)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+# Интервал замера задержки event loop (секунды)
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+JOB_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+
+    def _key(self, labels: dict) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(_Metric):
+    """Значение задаётся set/inc/dec или вычисляется функцией в момент сбора"""
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        function: Optional[Callable[[], Optional[float]]] = None
+    ):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._function = function
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Optional[Callable[[], Optional[float]]]) -> None:
+        self._function = function
+
+    def samples(self) -> List[str]:
+        if self._function is not None:
+            try:
+                value = self._function()
+            except Exception as e:
+                logger.warning(f"Gauge {self.name} callback failed: {e}")
+                value = None
+            return [] if value is None else [f"{self.name} {_format_value(value)}"]
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [счётчики по корзинам (+Inf последней), сумма]
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return sum(state[0]) if state else 0
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help_text, labels))
+
+
+def gauge(name: str, help_text: str, labels: Sequence[str] = (), function=None) -> Gauge:
+    return REGISTRY.register(Gauge(name, help_text, labels, function))
+
+
+def histogram(name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help_text, labels, buckets))
+
+
+# ============== Метрики приложения ==============
+
+http_requests_total = counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+http_request_duration = histogram(
+    "http_request_duration_seconds", "HTTP request latency by route (without SSE streams)", ("method", "route")
+)
+http_requests_in_flight = gauge("http_requests_in_flight", "HTTP requests being processed")
+
+db_pool_size = gauge("db_pool_size", "Configured size of the async DB connection pool")
+db_pool_checked_out = gauge("db_pool_checked_out", "DB connections checked out of the pool")
+db_pool_overflow = gauge("db_pool_overflow", "DB connections opened above pool_size")
+db_write_queue_wait = histogram(
+    "db_write_queue_wait_seconds", "Time SQLite write transactions waited for the process writer queue", buckets=LAG_BUCKETS
+)
+
+event_loop_lag = histogram("event_loop_lag_seconds", "Event loop scheduling delay", buckets=LAG_BUCKETS)
+event_loop_lag_last = gauge("event_loop_lag_last_seconds", "Last measured event loop scheduling delay")
+
+notification_queue_depth = gauge("notification_queue_depth", "Messages waiting in the notification queue")
+notification_send_latency = histogram(
+    "notification_send_latency_seconds", "Time from enqueue to successful send", buckets=JOB_BUCKETS
+)
+notifications_sent_total = counter("notifications_sent_total", "Notifications delivered to Telegram")
+telegram_errors_total = counter("telegram_errors_total", "Telegram Bot API errors by code", ("code",))
+
+job_duration = histogram("job_duration_seconds", "Background job iteration duration", ("job",), buckets=JOB_BUCKETS)
+job_errors_total = counter("job_errors_total", "Failed background job iterations", ("job",))
+
+
+def bind_db_pool(pool) -> None:
+    """Снимать показатели пула в момент сбора (у NullPool/StaticPool их нет)"""
+    for metric, method in (
+        (db_pool_size, "size"),
+        (db_pool_checked_out, "checkedout"),
+    ):
+        function = getattr(pool, method, None)
+        if callable(function):
+            metric.set_function(function)
+    # QueuePool.overflow() отрицателен, пока пул не заполнен (-pool_size у пустого пула)
+    overflow = getattr(pool, "overflow", None)
+    if callable(overflow):
+        db_pool_overflow.set_function(lambda: max(0, overflow()))
+
+
+@contextmanager
+def job_timer(job: str) -> Iterator[None]:
+    """Длительность итерации фоновой задачи и счётчик ошибок"""
+    started = time.perf_counter()
+    try:
+        yield
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        job_errors_total.inc(job=job)
+        raise
+    finally:
+        job_duration.observe(time.perf_counter() - started, job=job)
+
+
+def telegram_error_code(error: BaseException) -> str:
+    """Код ошибки Bot API для метки: HTTP-код или класс ошибки, если кода нет"""
+    from aiogram import exceptions
+
+    codes = (
+        (exceptions.TelegramRetryAfter, "429"),
+        (exceptions.TelegramBadRequest, "400"),
+        (exceptions.TelegramUnauthorizedError, "401"),
+        (exceptions.TelegramForbiddenError, "403"),
+        (exceptions.TelegramNotFound, "404"),
+        (exceptions.TelegramConflictError, "409"),
+        (exceptions.TelegramEntityTooLarge, "413"),
+        (exceptions.TelegramServerError, "5xx"),
+        (exceptions.TelegramNetworkError, "network"),
+    )
+    for error_class, code in codes:
+        if isinstance(error, error_class):
+            return code
+    return "other"
+
+
+async def monitor_event_loop(interval: float = LOOP_LAG_INTERVAL) -> None:
+    """Замерять, насколько позже запланированного просыпается задача"""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - started - interval)
+        event_loop_lag.observe(lag)
+        event_loop_lag_last.set(lag)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: число запросов, латентность по шаблону маршрута
+    (/api/hatms/{hatm_id}, а не конкретный id) и запросы в обработке.
+    Длительность SSE-потоков в гистограмму не попадает.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        streaming = False
+
+        async def send_with_status(message):
+            nonlocal status, streaming
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                streaming = any(
+                    name == b"content-type" and value.startswith(b"text/event-stream")
+                    for name, value in message.get("headers", [])
+                )
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_flight.dec()
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            http_requests_total.inc(method=method, route=route_path, status=status)
+            if not streaming:
+                http_request_duration.observe(time.perf_counter() - started, method=method, route=route_path)
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
+
+
+def metrics_exposed() -> bool:
+    """/metrics отдаётся только с токеном: без него маршруты, пул и задачи были бы видны всем"""
+    return bool(METRICS_TOKEN)
+
+
+def authorized(authorization: Optional[str]) -> bool:
+    """Проверить заголовок Authorization для /metrics"""
+    import hmac
+
+    if not METRICS_TOKEN:
+        return False
+    return hmac.compare_digest(authorization or "", f"Bearer {METRICS_TOKEN}")
+
+
+async def serve_metrics(port: int) -> asyncio.AbstractServer:
+    """
+    Минимальный HTTP-сервер /metrics для процесса без FastAPI (python -m app.worker):
+    очередь уведомлений и фоновые задачи живут там.
+    """
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=5)
+            lines = request.decode("latin-1").split("\r\n")
+            path = lines[0].split(" ")[1] if len(lines[0].split(" ")) > 1 else ""
+            headers = dict(line.split(": ", 1) for line in lines[1:] if ": " in line)
+            authorization = next((v for k, v in headers.items() if k.lower() == "authorization"), None)
+            if path.split("?")[0] != "/metrics" or not metrics_exposed():
+                status, body = "404 Not Found", b""
+            elif not authorized(authorization):
+                status, body = "401 Unauthorized", b""
+            else:
+                status, body = "200 OK", render_metrics().encode()
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "0.0.0.0", port)
+    logger.info(f"Metrics available on port {port}")
+    return server
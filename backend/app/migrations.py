@@ -0,0 +1,279 @@
+# Версионные миграции схемы: упорядоченные шаги и таблица schema_migrations с применёнными версиями.
+# Новая колонка, индекс или таблица - новый шаг с версией больше последней (шаги не меняются
+# после выката): create_all на существующей базе не выполняется
+import logging
+import os
+from datetime import datetime
+from typing import Callable, List, NamedTuple, Optional
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, insert, inspect, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import DBAPIError
+
+from app.database import DATABASE_URL, Base, engine, migration_lock
+
+logger = logging.getLogger(__name__)
+
+# Применять недостающие миграции при старте процесса. false - только командой
+# python -m app.manage migrate перед деплоем; процесс со старой схемой не запустится
+MIGRATE_ON_START = os.getenv("MIGRATE_ON_START", "true").lower() == "true"
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String(100), nullable=False),
+    Column("applied_at", DateTime, nullable=False, default=datetime.utcnow),
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable[[Connection], None]
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, name: str):
+    """Зарегистрировать шаг миграции; шаги должны быть идемпотентны (повтор после сбоя безопасен)"""
+    def register(function: Callable[[Connection], None]):
+        assert not MIGRATIONS or version > MIGRATIONS[-1].version, "migrations must be ordered"
+        MIGRATIONS.append(Migration(version, name, function))
+        return function
+    return register
+
+
+def _add_column_if_missing(conn: Connection, table: str, column: str, ddl: str) -> bool:
+    """
+    Добавить колонку в существующую таблицу (create_all новые колонки не добавляет).
+    Возвращает True, если колонка была добавлена.
+    """
+    columns = {c["name"] for c in inspect(conn).get_columns(table)}
+    if column in columns:
+        return False
+    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    logger.info(f"Migration: added {table}.{column}")
+    return True
+
+
+# ============== Шаги ==============
+
+@migration(1, "baseline")
+def create_missing_tables(conn: Connection) -> None:
+    # База до версионных миграций: таблицы, которых в ней ещё нет
+    from app.models import models  # noqa
+
+    Base.metadata.create_all(bind=conn)
+
+
+@migration(2, "juz_reminded_at")
+def add_juz_reminded_at(conn: Connection) -> None:
+    # Отметка последнего напоминания о джузе
+    _add_column_if_missing(
+        conn, "juz_assignments", "reminded_at",
+        "TIMESTAMP" if "postgresql" in DATABASE_URL else "DATETIME"
+    )
+
+
+@migration(3, "hatm_counters")
+def add_hatm_counters(conn: Connection) -> None:
+    # Счётчики прогресса в hatms, заполняются по juz_assignments. SQL зафиксирован
+    # (не модели и не сервисы): шаг должен давать тот же результат при любой версии кода.
+    # SQLAlchemy Enum хранит имена членов: 'PENDING', 'COMPLETED', 'DEBT'
+    added = False
+    for column in ("completed_juzs", "pending_juzs", "debt_juzs", "assigned_participants"):
+        added |= _add_column_if_missing(conn, "hatms", column, "INTEGER NOT NULL DEFAULT 0")
+    if added:
+        conn.execute(text("""
+            UPDATE hatms SET
+                completed_juzs = (
+                    SELECT COUNT(*) FROM juz_assignments
+                    WHERE juz_assignments.hatm_id = hatms.id AND juz_assignments.status = 'COMPLETED'
+                ),
+                pending_juzs = (
+                    SELECT COUNT(*) FROM juz_assignments
+                    WHERE juz_assignments.hatm_id = hatms.id AND juz_assignments.status = 'PENDING'
+                ),
+                debt_juzs = (
+                    SELECT COUNT(*) FROM juz_assignments
+                    WHERE juz_assignments.hatm_id = hatms.id AND juz_assignments.status = 'DEBT'
+                ),
+                assigned_participants = (
+                    SELECT COUNT(DISTINCT juz_assignments.user_id) FROM juz_assignments
+                    WHERE juz_assignments.hatm_id = hatms.id AND juz_assignments.user_id IS NOT NULL
+                )
+        """))
+        logger.info("Migration: hatm counters backfilled")
+
+
+@migration(4, "hatm_version")
+def add_hatm_version(conn: Connection) -> None:
+    # Версия хатма для кэша прогресса
+    _add_column_if_missing(conn, "hatms", "version", "INTEGER NOT NULL DEFAULT 0")
+
+
+@migration(5, "hatm_sequence_number")
+def add_hatm_sequence_number(conn: Connection) -> None:
+    # Хранимый номер хатма в группе вместо COUNT(hatms WHERE id <= ...)
+    _add_column_if_missing(conn, "groups", "hatm_sequence", "INTEGER NOT NULL DEFAULT 0")
+    _add_column_if_missing(conn, "hatms", "sequence_number", "INTEGER")
+    if conn.execute(text("SELECT 1 FROM hatms WHERE sequence_number IS NULL LIMIT 1")).first():
+        conn.execute(text("""
+            UPDATE hatms SET sequence_number = (
+                SELECT COUNT(*) FROM hatms AS earlier
+                WHERE earlier.group_id = hatms.group_id AND earlier.id <= hatms.id
+            )
+        """))
+        conn.execute(text("""
+            UPDATE groups SET hatm_sequence = COALESCE(
+                (SELECT MAX(sequence_number) FROM hatms WHERE hatms.group_id = groups.id), 0
+            )
+        """))
+        if "postgresql" in DATABASE_URL:
+            conn.execute(text("ALTER TABLE hatms ALTER COLUMN sequence_number SET NOT NULL"))
+        logger.info("Migration: hatm sequence numbers backfilled")
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_hatm_group_sequence ON hatms (group_id, sequence_number)"
+    ))
+
+
+@migration(6, "history_keyset_indexes")
+def add_history_keyset_indexes(conn: Connection) -> None:
+    # Индексы под keyset-пагинацию истории
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS idx_hatm_group_created ON hatms (group_id, created_at, id)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS idx_juz_user_completed ON juz_assignments (user_id, completed_at, id)"
+    ))
+
+
+@migration(7, "juz_user_nullable")
+def make_juz_user_nullable(conn: Connection) -> None:
+    # user_id в juz_assignments nullable (нераспределённые джузы); SQLite создаёт таблицу сразу так
+    if "postgresql" in DATABASE_URL:
+        conn.execute(text("ALTER TABLE juz_assignments ALTER COLUMN user_id DROP NOT NULL"))
+
+
+@migration(8, "index_audit")
+def apply_index_audit(conn: Connection) -> None:
+    # Набор индексов по планам запросов (python -m benchmarks.query_plans): уникальность
+    # джуза в хатме, составные индексы для фоновых задач, без дублей первичного ключа
+    # и одноколоночных индексов, которые являются префиксом составных
+    duplicates = conn.execute(text("""
+        SELECT hatm_id FROM juz_assignments
+        GROUP BY hatm_id, juz_number HAVING COUNT(*) > 1 LIMIT 10
+    """)).scalars().all()
+    if duplicates:
+        raise RuntimeError(
+            f"juz_assignments has duplicate (hatm_id, juz_number) rows in hatms {sorted(set(duplicates))}: "
+            "remove them before applying the unique index"
+        )
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_juz_hatm_number ON juz_assignments (hatm_id, juz_number)"
+    ))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_hatm_status_ends ON hatms (status, ends_at)"))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS idx_outbox_status_claimed ON notification_outbox (status, claimed_at)"
+    ))
+    for index in (
+        "ix_users_id", "ix_groups_id", "ix_group_members_id", "ix_group_members_group_id",
+        "ix_hatms_id", "ix_hatms_group_id", "ix_hatms_status",
+        "ix_juz_assignments_id", "ix_juz_assignments_hatm_id", "ix_juz_assignments_user_id",
+        "ix_juz_assignments_status", "ix_juz_assignments_is_debt", "ix_notification_outbox_id",
+    ):
+        conn.execute(text(f"DROP INDEX IF EXISTS {index}"))
+    logger.info("Migration: index set updated")
+
+
+@migration(9, "group_member_unique")
+def make_group_member_unique(conn: Connection) -> None:
+    # Уникальное членство (group_id, user_id) для вступления через INSERT ... ON CONFLICT DO NOTHING.
+    # Дубли от прежней гонки проверки и вставки удаляются, остаётся самое раннее членство
+    removed = conn.execute(text("""
+        DELETE FROM group_members WHERE id NOT IN (
+            SELECT MIN(id) FROM group_members GROUP BY group_id, user_id
+        )
+    """)).rowcount
+    if removed:
+        logger.info(f"Migration: removed {removed} duplicate group memberships")
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_group_member_group_user ON group_members (group_id, user_id)"
+    ))
+    conn.execute(text("DROP INDEX IF EXISTS idx_group_member_group_user"))
+
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+# ============== Применение ==============
+
+def schema_version(conn: Connection) -> Optional[int]:
+    """Версия схемы одним запросом; None - база без schema_migrations (новая или до версий)"""
+    try:
+        return conn.execute(select(func.coalesce(func.max(schema_migrations.c.version), 0))).scalar()
+    except DBAPIError:
+        conn.rollback()
+        return None
+
+
+def _record(conn: Connection, step: Migration) -> None:
+    conn.execute(insert(schema_migrations).values(version=step.version, name=step.name, applied_at=datetime.utcnow()))
+
+
+def migrate() -> List[int]:
+    """
+    Применить недостающие миграции под блокировкой (advisory lock / flock), каждую -
+    в своей транзакции вместе с записью в schema_migrations. Процесс, дождавшийся
+    блокировки после другого, видит новую версию и ничего не делает.
+    Возвращает применённые версии.
+    """
+    from app.models import models  # noqa
+
+    applied = []
+    with migration_lock(), engine.connect() as conn:
+        current = schema_version(conn)
+        if current is None:
+            fresh = not inspect(conn).has_table("hatms")
+            schema_migrations.create(bind=conn, checkfirst=True)
+            if fresh:
+                # Новая база: create_all сразу создаёт актуальную схему, шаги только отмечаются
+                Base.metadata.create_all(bind=conn)
+                for step in MIGRATIONS:
+                    _record(conn, step)
+                conn.commit()
+                logger.info(f"Created schema at version {LATEST_VERSION}")
+                return [step.version for step in MIGRATIONS]
+            conn.commit()
+            current = 0
+
+        for step in MIGRATIONS:
+            if step.version <= current:
+                continue
+            logger.info(f"Applying migration {step.version}: {step.name}")
+            step.apply(conn)
+            _record(conn, step)
+            conn.commit()
+            applied.append(step.version)
+    return applied
+
+
+def ensure_schema() -> None:
+    """
+    Проверка схемы при старте: один запрос версии, если миграции уже применены
+    (обычный случай после python -m app.manage migrate перед деплоем)
+    """
+    with engine.connect() as conn:
+        current = schema_version(conn)
+    if current is not None and current >= LATEST_VERSION:
+        if current > LATEST_VERSION:
+            logger.warning(f"Database schema version {current} is newer than this code ({LATEST_VERSION})")
+        return
+    if not MIGRATE_ON_START:
+        raise RuntimeError(
+            f"Database schema is at version {current or 0}, expected {LATEST_VERSION}: "
+            "run `python -m app.manage migrate`"
+        )
+    migrate()
@@ -1,3 +1,9 @@
-from .models import User, Group, GroupMember, Hatm, JuzAssignment, HatmStatus, JuzStatus
+from .models import (
+    User, Group, GroupMember, Hatm, JuzAssignment, NotificationOutbox,
+    HatmStatus, JuzStatus, OutboxStatus
+)
 
-__all__ = ["User", "Group", "GroupMember", "Hatm", "JuzAssignment", "HatmStatus", "JuzStatus"]
+__all__ = [
+    "User", "Group", "GroupMember", "Hatm", "JuzAssignment", "NotificationOutbox",
+    "HatmStatus", "JuzStatus", "OutboxStatus"
+]
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, Enum, Boolean, Index
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, ForeignKey, Enum, Boolean, Index, JSON
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -18,10 +18,17 @@ class JuzStatus(str, enum.Enum):
     DEBT = "debt"
 
 
+class OutboxStatus(str, enum.Enum):
+    PENDING = "pending"
+    PROCESSING = "processing"
+    SENT = "sent"
+    FAILED = "failed"
+
+
 class User(Base):
     __tablename__ = "users"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     telegram_id = Column(BigInteger, unique=True, index=True, nullable=False)
     username = Column(String(255), nullable=True)
     first_name = Column(String(255), nullable=True)
@@ -36,11 +43,13 @@ class User(Base):
 class Group(Base):
     __tablename__ = "groups"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     name = Column(String(255), nullable=False)
     invite_code = Column(String(8), unique=True, index=True, nullable=False)
     creator_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Последний выданный номер хатма в группе (Hatm.sequence_number)
+    hatm_sequence = Column(Integer, default=0, server_default="0", nullable=False)
 
     # Relationships
     creator = relationship("User", back_populates="created_groups")
@@ -51,11 +60,12 @@ class Group(Base):
 class GroupMember(Base):
     __tablename__ = "group_members"
     __table_args__ = (
-        Index('idx_group_member_group_user', 'group_id', 'user_id'),
+        # Одно членство на пользователя в группе: вступление - INSERT ... ON CONFLICT DO NOTHING
+        Index('uq_group_member_group_user', 'group_id', 'user_id', unique=True),
     )
 
-    id = Column(Integer, primary_key=True, index=True)
-    group_id = Column(Integer, ForeignKey("groups.id"), nullable=False, index=True)
+    id = Column(Integer, primary_key=True)
+    group_id = Column(Integer, ForeignKey("groups.id"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     joined_at = Column(DateTime, default=datetime.utcnow)
 
@@ -68,17 +78,31 @@ class Hatm(Base):
     __tablename__ = "hatms"
     __table_args__ = (
         Index('idx_hatm_group_status', 'group_id', 'status'),
+        Index('uq_hatm_group_sequence', 'group_id', 'sequence_number', unique=True),
+        Index('idx_hatm_group_created', 'group_id', 'created_at', 'id'),  # история группы
+        Index('idx_hatm_status_ends', 'status', 'ends_at'),  # просроченные хатмы и напоминания
     )
 
-    id = Column(Integer, primary_key=True, index=True)
-    group_id = Column(Integer, ForeignKey("groups.id"), nullable=False, index=True)
+    id = Column(Integer, primary_key=True)
+    group_id = Column(Integer, ForeignKey("groups.id"), nullable=False)
+    # Номер хатма в группе ("Хатм #N"), выдаётся при создании из Group.hatm_sequence
+    sequence_number = Column(Integer, nullable=False)
     duration_days = Column(Integer, nullable=False)
     participants_count = Column(Integer, nullable=False)
-    status = Column(Enum(HatmStatus), default=HatmStatus.PENDING, index=True)
+    status = Column(Enum(HatmStatus), default=HatmStatus.PENDING)
     started_at = Column(DateTime, nullable=True)
     ends_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # Денормализованные счётчики джузов: обновляются сервисами атомарно,
+    # сверка и починка - python -m app.manage counters
+    completed_juzs = Column(Integer, default=0, server_default="0", nullable=False)
+    pending_juzs = Column(Integer, default=0, server_default="0", nullable=False)
+    debt_juzs = Column(Integer, default=0, server_default="0", nullable=False)
+    assigned_participants = Column(Integer, default=0, server_default="0", nullable=False)
+    # Увеличивается при любом изменении джузов или статуса (ключ кэша и ETag прогресса)
+    version = Column(Integer, default=0, server_default="0", nullable=False)
+
     # Relationships
     group = relationship("Group", back_populates="hatms")
     juz_assignments = relationship("JuzAssignment", back_populates="hatm", cascade="all, delete-orphan")
@@ -89,16 +113,41 @@ class JuzAssignment(Base):
     __table_args__ = (
         Index('idx_juz_hatm_user', 'hatm_id', 'user_id'),
         Index('idx_juz_user_status', 'user_id', 'status'),
+        Index('idx_juz_user_completed', 'user_id', 'completed_at', 'id'),  # история пользователя
+        # Каждый джуз хатма - одна строка (и порядок джузов в прогрессе без сортировки)
+        Index('uq_juz_hatm_number', 'hatm_id', 'juz_number', unique=True),
     )
 
-    id = Column(Integer, primary_key=True, index=True)
-    hatm_id = Column(Integer, ForeignKey("hatms.id"), nullable=False, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)  # NULL = unassigned
+    id = Column(Integer, primary_key=True)
+    hatm_id = Column(Integer, ForeignKey("hatms.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # NULL = unassigned
     juz_number = Column(Integer, nullable=False)  # 1-30
-    status = Column(Enum(JuzStatus), default=JuzStatus.PENDING, index=True)
+    status = Column(Enum(JuzStatus), default=JuzStatus.PENDING)
     completed_at = Column(DateTime, nullable=True)
-    is_debt = Column(Boolean, default=False, index=True)
+    is_debt = Column(Boolean, default=False)
+    reminded_at = Column(DateTime, nullable=True)  # когда последний раз напоминали
 
     # Relationships
     hatm = relationship("Hatm", back_populates="juz_assignments")
     user = relationship("User", back_populates="juz_assignments")
+
+
+class NotificationOutbox(Base):
+    """Уведомления, записанные в той же транзакции, что и изменение состояния"""
+    __tablename__ = "notification_outbox"
+    __table_args__ = (
+        Index('idx_outbox_status_available', 'status', 'available_at'),
+        Index('idx_outbox_status_claimed', 'status', 'claimed_at'),  # зависшие в PROCESSING
+    )
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(32), nullable=False)
+    chat_id = Column(BigInteger, nullable=False)
+    payload = Column(JSON, nullable=False, default=dict)
+    status = Column(Enum(OutboxStatus), default=OutboxStatus.PENDING, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    available_at = Column(DateTime, default=datetime.utcnow, nullable=False)  # не отправлять раньше
+    claimed_at = Column(DateTime, nullable=True)
+    sent_at = Column(DateTime, nullable=True)
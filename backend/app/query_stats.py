@@ -0,0 +1,172 @@
+# Учёт SQL-запросов на HTTP-запрос и апдейт бота: количество, время в БД, подозрения на N+1
+import logging
+import os
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import Context, ContextVar, copy_context
+from typing import Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+QUERY_STATS_ENABLED = os.getenv("QUERY_STATS_ENABLED", "true").lower() == "true"
+# Предупреждение в лог, если запрос/апдейт выполнил больше стольких SQL-запросов
+QUERY_WARN_STATEMENTS = int(os.getenv("QUERY_WARN_STATEMENTS", "25"))
+# Один и тот же запрос (с точностью до параметров) столько раз за запрос/апдейт - вероятный N+1
+QUERY_REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", "5"))
+
+# Списки параметров IN (...) и VALUES (...) разной длины - одна и та же форма запроса
+_PARAM = r"(?:\?|\$\d+|%\(\w+\)s|:\w+)"
+_PARAM_LIST_RE = re.compile(rf"\(\s*{_PARAM}(?:\s*,\s*{_PARAM})*\s*\)")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """Нормализованная форма запроса: параметры уже вынесены, схлопываем списки и пробелы"""
+    return _SPACES_RE.sub(" ", _PARAM_LIST_RE.sub("(...)", statement)).strip()
+
+
+class QueryStats:
+    """
+    Статистика SQL-запросов одной единицы работы. Вложенные трекеры
+    передают запросы и во внешний (например, тест вокруг HTTP-запроса).
+    """
+
+    def __init__(self, label: str = "", parent: Optional["QueryStats"] = None):
+        self.label = label
+        self.parent = parent
+        self.statements = 0
+        self.db_time = 0.0
+        self._statements: Counter = Counter()
+
+    def record(self, statement: str, duration: float) -> None:
+        stats = self
+        while stats is not None:
+            stats.statements += 1
+            stats.db_time += duration
+            stats._statements[statement] += 1
+            stats = stats.parent
+
+    def repeated(self, threshold: int = QUERY_REPEAT_THRESHOLD) -> List[Tuple[str, int]]:
+        """Формы запросов, выполненные не меньше threshold раз, от самых частых"""
+        shapes: Counter = Counter()
+        for statement, count in self._statements.items():
+            shapes[statement_shape(statement)] += count
+        return [(shape, count) for shape, count in shapes.most_common() if count >= threshold]
+
+    def summary(self) -> str:
+        return f"{self.statements} queries, {self.db_time * 1000:.1f}ms in db"
+
+    def assert_budget(self, max_statements: int, max_repeats: Optional[int] = None) -> None:
+        """Проверка бюджета запросов для тестов: AssertionError с перечнем форм запросов"""
+        problems = []
+        if self.statements > max_statements:
+            problems.append(f"{self.statements} statements > budget {max_statements}")
+        if max_repeats is not None:
+            problems.extend(
+                f"statement repeated {count} times > {max_repeats}: {shape}"
+                for shape, count in self.repeated(max_repeats + 1)
+            )
+        if problems:
+            shapes = "\n".join(f"  {count}x {shape}" for shape, count in self.repeated(1))
+            raise AssertionError(f"{self.label or 'query budget'}: " + "; ".join(problems) + f"\n{shapes}")
+
+    def report(self) -> None:
+        """Записать в лог превышение порога и подозрения на N+1"""
+        if self.statements > QUERY_WARN_STATEMENTS:
+            logger.warning(f"{self.label}: {self.summary()} (threshold {QUERY_WARN_STATEMENTS})")
+        for shape, count in self.repeated():
+            logger.warning(f"{self.label}: possible N+1, statement repeated {count} times: {shape[:300]}")
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def current_stats() -> Optional[QueryStats]:
+    return _current.get()
+
+
+def detached_context() -> Context:
+    """Копия текущего контекста без трекера - для фоновых задач, живущих дольше запроса"""
+    context = copy_context()
+    context.run(_current.set, None)
+    return context
+
+
+@contextmanager
+def track_queries(label: str = "") -> Iterator[QueryStats]:
+    """
+    Считать SQL-запросы, выполненные в текущем контексте (задаче asyncio).
+    В тестах: with track_queries() as stats: ... ; stats.assert_budget(5, max_repeats=1)
+    """
+    stats = QueryStats(label, parent=_current.get())
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+_START_KEY = "query_stats_started"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault(_START_KEY, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    started = conn.info.get(_START_KEY)
+    if stats is not None and started:
+        stats.record(statement, time.perf_counter() - started.pop())
+
+
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    started = conn.info.get(_START_KEY) if conn is not None else None
+    if started:
+        started.pop()
+
+
+def install(engine) -> None:
+    """Подключить учёт к синхронному движку (для async - async_engine.sync_engine)"""
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+class QueryStatsMiddleware:
+    """
+    ASGI middleware: статистика на каждый HTTP-запрос, заголовок Server-Timing
+    (видно во вкладке Network браузера) и предупреждения в лог.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track_queries(f"{scope['method']} {scope['path']}") as stats:
+            async def send_with_timing(message):
+                if message["type"] == "http.response.start":
+                    headers = list(message.get("headers", []))
+                    headers.append((
+                        b"server-timing",
+                        f'db;dur={stats.db_time * 1000:.1f};desc="{stats.statements} queries"'.encode()
+                    ))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                stats.report()
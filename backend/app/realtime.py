@@ -0,0 +1,254 @@
+# Живые обновления прогресса: pub/sub внутри процесса + Server-Sent Events
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import and_, event, func, or_, select
+from sqlalchemy.orm import Session
+
+from app.database import AsyncSessionLocal
+from app.models.models import Hatm, HatmStatus
+
+logger = logging.getLogger(__name__)
+
+# Сколько событий может накопиться у одного медленного подписчика
+SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "100"))
+# Интервал keep-alive комментариев в потоке (секунды)
+SSE_KEEPALIVE = float(os.getenv("SSE_KEEPALIVE", "15"))
+# Сверка версий хатмов с базой (секунды, 0 - выключить): изменения, сделанные
+# другими процессами (воркеры uvicorn, бот), не проходят через hub этого процесса
+SSE_POLL_INTERVAL = float(os.getenv("SSE_POLL_INTERVAL", "5"))
+
+KEEPALIVE_MESSAGE = b": keepalive\n\n"
+
+_STAGED_KEY = "realtime_events"
+
+
+def format_sse(data: dict) -> bytes:
+    """Сериализовать событие в формат text/event-stream"""
+    return f"event: {data['type']}\ndata: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n".encode()
+
+
+RESYNC_MESSAGE = format_sse({"type": "resync"})
+
+
+def hatm_topic(hatm_id: int) -> str:
+    return f"hatm:{hatm_id}"
+
+
+def group_topic(group_id: int) -> str:
+    return f"group:{group_id}"
+
+
+def _topic_ids(topics: Iterable[str], prefix: str) -> List[int]:
+    return [int(topic[len(prefix):]) for topic in topics if topic.startswith(prefix)]
+
+
+class EventHub:
+    """
+    Pub/sub внутри процесса. Событие сериализуется один раз и раздаётся
+    во все очереди подписчиков топика без ожидания. Если очередь медленного
+    подписчика переполнена, его накопленные события отбрасываются и вместо
+    них отправляется resync - клиент перезапросит полный снимок.
+    """
+
+    def __init__(self, queue_size: int = SSE_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+        # Последняя версия хатма, о которой узнали подписчики этого процесса
+        self.versions: Dict[int, int] = {}
+        self.published_count = 0
+        self.resync_count = 0
+
+    def subscribe(self, topic: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers[topic].add(queue)
+        return queue
+
+    def unsubscribe(self, topic: str, queue: asyncio.Queue) -> None:
+        subscribers = self._subscribers.get(topic)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self._subscribers[topic]
+
+    def publish(self, topic: str, data: dict) -> int:
+        """Отправить событие подписчикам топика. Возвращает число получателей"""
+        subscribers = self._subscribers.get(topic)
+        if not subscribers:
+            return 0
+
+        self.observe(data)
+        message = format_sse(data)
+        for queue in subscribers:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self._resync_queue(queue)
+        self.published_count += 1
+        return len(subscribers)
+
+    def resync(self, topic: str) -> None:
+        """Попросить всех подписчиков топика перезапросить полный снимок"""
+        for queue in self._subscribers.get(topic, ()):
+            self._resync_queue(queue)
+
+    def _resync_queue(self, queue: asyncio.Queue) -> None:
+        # Накопленные события устарели: снимок всё равно будет перезапрошен
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(RESYNC_MESSAGE)
+        self.resync_count += 1
+
+    def observe(self, data: dict) -> None:
+        """Запомнить версию хатма из события или hello"""
+        hatm_id, version = data.get("hatm_id"), data.get("version")
+        if hatm_id is not None and version is not None and version > self.versions.get(hatm_id, -1):
+            self.versions[hatm_id] = version
+
+    def topics(self) -> List[str]:
+        return list(self._subscribers)
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+hub = EventHub()
+
+
+def stage_event(session, topics: Iterable[str], data: dict) -> None:
+    """
+    Запомнить событие в сессии. Оно будет опубликовано только после
+    успешного commit; при rollback событие отбрасывается.
+    """
+    session.info.setdefault(_STAGED_KEY, []).append((tuple(topics), data))
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_staged_events(session: Session) -> None:
+    for topics, data in session.info.pop(_STAGED_KEY, ()):
+        for topic in topics:
+            hub.publish(topic, data)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_staged_events(session: Session) -> None:
+    session.info.pop(_STAGED_KEY, None)
+
+
+async def event_stream(topic: str, hello: dict):
+    """
+    Генератор тела SSE-ответа: сначала hello (клиент сверяет версию
+    и при необходимости перезапрашивает снимок), затем события топика.
+    """
+    queue = hub.subscribe(topic)
+    hub.observe(hello)
+    try:
+        yield format_sse(hello)
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE)
+            except asyncio.TimeoutError:
+                message = KEEPALIVE_MESSAGE
+            yield message
+    finally:
+        hub.unsubscribe(topic, queue)
+
+
+class VersionPoller:
+    """
+    Периодически сверяет версии хатмов, на которые есть подписчики, с базой.
+    Если версия в базе опередила последнее событие этого процесса (изменение
+    пришло из другого воркера или бота), подписчики получают resync.
+    Один запрос на процесс за интервал (два, если у групп нет открытых хатмов),
+    независимо от числа подписчиков.
+    """
+
+    def __init__(self, event_hub: EventHub = None, interval: float = SSE_POLL_INTERVAL):
+        self.hub = event_hub or hub
+        self.interval = interval
+        # Хатмы групп на момент прошлой сверки: новый хатм в группе - тоже изменение
+        self._group_hatms: Dict[int, Set[int]] = {}
+        # Незавершённые хатмы групп на прошлой сверке: их завершение видно по версии
+        self._open_hatms: Set[int] = set()
+        # Наибольший id хатма в базе на прошлой сверке: хатмы с большим id созданы после неё
+        self._last_hatm_id: Optional[int] = None
+
+    async def run(self) -> None:
+        logger.info("SSE version poller started")
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.poll_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"SSE version poller error: {e}")
+
+    async def poll_once(self) -> int:
+        """Сверить версии. Возвращает число топиков, получивших resync"""
+        topics = self.hub.topics()
+        hatm_ids = _topic_ids(topics, hatm_topic(""))
+        group_ids = _topic_ids(topics, group_topic(""))
+        if not hatm_ids and not group_ids:
+            self.hub.versions.clear()
+            self._group_hatms.clear()
+            self._open_hatms.clear()
+            self._last_hatm_id = None
+            return 0
+
+        # История групп (завершённые хатмы) не перечитывается: из хатмов групп - только
+        # незавершённые, открытые на прошлой сверке и созданные после неё
+        recent = Hatm.status != HatmStatus.COMPLETED
+        if self._last_hatm_id is not None:
+            recent = or_(recent, Hatm.id > self._last_hatm_id)
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                select(
+                    Hatm.id, Hatm.group_id, Hatm.version, Hatm.status,
+                    select(func.max(Hatm.id)).scalar_subquery()
+                )
+                .where(or_(
+                    Hatm.id.in_(set(hatm_ids) | self._open_hatms),
+                    and_(Hatm.group_id.in_(group_ids), recent)
+                ))
+            )).all()
+            # Без строк (у групп нет открытых хатмов) наибольший id - отдельным запросом
+            last_hatm_id = rows[0][-1] if rows else await db.scalar(select(func.max(Hatm.id)))
+
+        stale = set()
+        versions = {}
+        group_hatms: Dict[int, Set[int]] = defaultdict(set)
+        # Кандидаты в новые хатмы группы: завершённый из прошлых сверок новым не бывает
+        new_hatms: Dict[int, Set[int]] = defaultdict(set)
+        open_hatms = set()
+        for hatm_id, group_id, version, status, _ in rows:
+            known = self.hub.versions.get(hatm_id)
+            if known is not None and version > known:
+                stale.update((hatm_topic(hatm_id), group_topic(group_id)))
+            versions[hatm_id] = max(version, known or 0)
+            group_hatms[group_id].add(hatm_id)
+            if status != HatmStatus.COMPLETED:
+                open_hatms.add(hatm_id)
+            if status != HatmStatus.COMPLETED or (self._last_hatm_id is not None and hatm_id > self._last_hatm_id):
+                new_hatms[group_id].add(hatm_id)
+
+        for group_id in group_ids:
+            previous = self._group_hatms.get(group_id)
+            if previous is not None and new_hatms[group_id] - previous:
+                stale.add(group_topic(group_id))
+
+        # Храним версии только тех хатмов, на которые ещё есть подписчики
+        self.hub.versions = versions
+        self._group_hatms = {group_id: group_hatms[group_id] for group_id in group_ids}
+        self._open_hatms = open_hatms
+        self._last_hatm_id = last_hatm_id
+
+        for topic in stale:
+            self.hub.resync(topic)
+        return len(stale)
@@ -95,12 +95,17 @@ class JuzResponse(BaseModel):
 class HatmResponse(BaseModel):
     id: int
     group_id: int
+    sequence_number: Optional[int] = None
     duration_days: int
     participants_count: int
     status: HatmStatus
     started_at: Optional[datetime]
     ends_at: Optional[datetime]
     created_at: datetime
+    completed_juzs: int = 0
+    pending_juzs: int = 0
+    debt_juzs: int = 0
+    assigned_participants: int = 0
 
     class Config:
         from_attributes = True
@@ -141,6 +146,8 @@ class UserJuzStats(BaseModel):
     pending: int = 0
     debts: int = 0
     juzs: List[JuzResponse] = []
+    # Курсор следующей страницы juzs (?cursor=), None - страница последняя
+    next_cursor: Optional[str] = None
 
 
 class UserDebtResponse(BaseModel):
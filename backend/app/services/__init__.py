@@ -2,5 +2,6 @@ from .group_service import GroupService
 from .hatm_service import HatmService
 from .juz_service import JuzService
 from .user_service import UserService
+from .outbox_service import OutboxService
 
-__all__ = ["GroupService", "HatmService", "JuzService", "UserService"]
+__all__ = ["GroupService", "HatmService", "JuzService", "UserService", "OutboxService"]
@@ -1,58 +1,69 @@
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func
-from typing import List, Optional, Dict, Tuple
+from sqlalchemy import select, func, and_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from typing import List, Optional, Tuple
 import secrets
 import string
+from datetime import datetime
 
+from app.database import serialized_writes
 from app.models.models import Group, GroupMember, User, Hatm, HatmStatus
 from app.schemas.schemas import GroupCreate
+from app.services.hatm_service import HatmService
+
+# Сколько SQL-запросов может выполнить вступление в группу (GroupService.join);
+# проверяется в python -m benchmarks.join_storm
+JOIN_STATEMENT_BUDGET = 5
 
 
 class GroupService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
 
-    def _generate_invite_code(self) -> str:
+    async def _generate_invite_code(self) -> str:
         """Генерация уникального 8-символьного кода приглашения"""
         chars = string.ascii_uppercase + string.digits
         while True:
             code = ''.join(secrets.choice(chars) for _ in range(8))
-            if not self.db.query(Group).filter(Group.invite_code == code).first():
+            existing = await self.db.scalar(select(Group.id).where(Group.invite_code == code))
+            if existing is None:
                 return code
 
-    def create(self, user: User, group_data: GroupCreate) -> Group:
-        """Создать новую группу"""
+    async def create(self, user: User, group_data: GroupCreate) -> Group:
+        """Создать новую группу; создатель сразу становится участником"""
         group = Group(
             name=group_data.name,
-            invite_code=self._generate_invite_code(),
+            invite_code=await self._generate_invite_code(),
             creator_id=user.id
         )
+        # Группа и членство создателя - одним flush
+        group.members.append(GroupMember(user_id=user.id))
         self.db.add(group)
-        self.db.commit()
-        self.db.refresh(group)
-
-        # Автоматически добавить создателя в группу
-        self.add_member(group, user)
+        await self.db.flush()
         return group
 
-    def get_by_id(self, group_id: int) -> Optional[Group]:
+    async def get_by_id(self, group_id: int) -> Optional[Group]:
         """Получить группу по ID"""
-        return self.db.query(Group).filter(Group.id == group_id).first()
+        return await self.db.get(Group, group_id)
 
-    def get_by_invite_code(self, invite_code: str) -> Optional[Group]:
+    async def get_by_invite_code(self, invite_code: str) -> Optional[Group]:
         """Получить группу по коду приглашения"""
-        return self.db.query(Group).filter(Group.invite_code == invite_code.upper()).first()
+        result = await self.db.execute(
+            select(Group).where(Group.invite_code == invite_code.upper())
+        )
+        return result.scalars().first()
 
-    def get_user_groups(self, user: User) -> List[Group]:
+    async def get_user_groups(self, user: User) -> List[Group]:
         """Получить все группы пользователя"""
-        return (
-            self.db.query(Group)
+        result = await self.db.execute(
+            select(Group)
             .join(GroupMember)
-            .filter(GroupMember.user_id == user.id)
-            .all()
+            .where(GroupMember.user_id == user.id)
         )
+        return list(result.scalars().all())
 
-    def get_user_groups_with_stats(self, user: User) -> List[Tuple[Group, int, bool]]:
+    async def get_user_groups_with_stats(self, user: User) -> List[Tuple[Group, int, bool]]:
         """
         Получить все группы пользователя с members_count и has_active_hatm
         за ОДИН запрос вместо N+1.
@@ -60,7 +71,7 @@ class GroupService:
         """
         # Подзапрос для подсчета участников
         members_subq = (
-            self.db.query(
+            select(
                 GroupMember.group_id,
                 func.count(GroupMember.id).label('members_count')
             )
@@ -70,18 +81,18 @@ class GroupService:
 
         # Подзапрос для проверки активного хатма
         active_hatm_subq = (
-            self.db.query(
+            select(
                 Hatm.group_id,
                 func.count(Hatm.id).label('active_count')
             )
-            .filter(Hatm.status == HatmStatus.ACTIVE)
+            .where(Hatm.status == HatmStatus.ACTIVE)
             .group_by(Hatm.group_id)
             .subquery()
         )
 
         # Основной запрос - получаем группы пользователя с джоинами на подзапросы
-        results = (
-            self.db.query(
+        result = await self.db.execute(
+            select(
                 Group,
                 func.coalesce(members_subq.c.members_count, 0).label('members_count'),
                 func.coalesce(active_hatm_subq.c.active_count, 0).label('active_count')
@@ -89,75 +100,125 @@ class GroupService:
             .join(GroupMember, GroupMember.group_id == Group.id)
             .outerjoin(members_subq, members_subq.c.group_id == Group.id)
             .outerjoin(active_hatm_subq, active_hatm_subq.c.group_id == Group.id)
-            .filter(GroupMember.user_id == user.id)
-            .all()
+            .where(GroupMember.user_id == user.id)
         )
 
-        return [(r[0], r[1], r[2] > 0) for r in results]
+        return [(r[0], r[1], r[2] > 0) for r in result.all()]
 
-    def add_member(self, group: Group, user: User) -> GroupMember:
-        """Добавить участника в группу"""
-        # Проверяем, не является ли уже участником
-        existing = (
-            self.db.query(GroupMember)
-            .filter(GroupMember.group_id == group.id, GroupMember.user_id == user.id)
-            .first()
+    async def _get_membership(self, group: Group, user: User) -> Optional[GroupMember]:
+        result = await self.db.execute(
+            select(GroupMember)
+            .where(GroupMember.group_id == group.id, GroupMember.user_id == user.id)
         )
-        if existing:
-            return existing
-
-        member = GroupMember(group_id=group.id, user_id=user.id)
-        self.db.add(member)
-        self.db.commit()
-        self.db.refresh(member)
-        return member
+        return result.scalars().first()
 
-    def remove_member(self, group: Group, user: User) -> bool:
-        """Удалить участника из группы"""
-        member = (
-            self.db.query(GroupMember)
-            .filter(GroupMember.group_id == group.id, GroupMember.user_id == user.id)
-            .first()
+    async def join(self, user: User, invite_code: str) -> Optional[Tuple[Group, int, bool]]:
+        """
+        Вступить в группу по коду приглашения с фиксированным числом запросов
+        (не больше JOIN_STATEMENT_BUDGET, commit - в конце единицы работы):
+        1. группа, активный хатм, членство и число участников - один SELECT;
+        2. INSERT участника ... ON CONFLICT DO NOTHING RETURNING: повторное
+           вступление и параллельный двойной тап ничего не пишут;
+        3-5. новому участнику при активном хатме - слот, джузы и уведомление
+           (HatmService.claim_juzs).
+        Уже состоящий в группе участник обходится одним SELECT без записи.
+        Возвращает (group, members_count, has_active_hatm) или None, если группы нет.
+        """
+        is_member = (
+            select(GroupMember.id)
+            .where(GroupMember.group_id == Group.id, GroupMember.user_id == user.id)
+            .exists()
         )
+        members_count = (
+            select(func.count(GroupMember.id))
+            .where(GroupMember.group_id == Group.id)
+            .scalar_subquery()
+        )
+        row = (await self.db.execute(
+            select(Group, Hatm, is_member, members_count)
+            .outerjoin(Hatm, and_(Hatm.group_id == Group.id, Hatm.status == HatmStatus.ACTIVE))
+            .where(Group.invite_code == invite_code.upper())
+            .limit(1)
+        )).first()
+        if row is None:
+            return None
+
+        group, active_hatm, already_member, count = row
+        if already_member:
+            return group, count, active_hatm is not None
+
+        async with serialized_writes():
+            inserted = await self.db.scalar(
+                self._insert_ignore(GroupMember)
+                .values(group_id=group.id, user_id=user.id, joined_at=datetime.utcnow())
+                .on_conflict_do_nothing(index_elements=["group_id", "user_id"])
+                .returning(GroupMember.id)
+            )
+            if inserted is not None:
+                count += 1
+                if active_hatm is not None:
+                    # Уведомление о назначенных джузах записывается в outbox сервисом
+                    await HatmService(self.db).claim_juzs(active_hatm, user)
+                await self.db.flush()
+        return group, count, active_hatm is not None
+
+    def _insert_ignore(self, model):
+        """INSERT с ON CONFLICT для диалекта сессии (SQLite или PostgreSQL)"""
+        if self.db.get_bind().dialect.name == "postgresql":
+            return postgresql.insert(model)
+        return sqlite.insert(model)
+
+    async def remove_member(self, group: Group, user: User) -> bool:
+        """Удалить участника из группы"""
+        member = await self._get_membership(group, user)
         if member:
-            self.db.delete(member)
-            self.db.commit()
+            await self.db.delete(member)
+            await self.db.flush()
             return True
         return False
 
-    def is_member(self, group: Group, user: User) -> bool:
+    async def is_member(self, group: Group, user: User) -> bool:
         """Проверить, является ли пользователь участником группы"""
-        return (
-            self.db.query(GroupMember)
-            .filter(GroupMember.group_id == group.id, GroupMember.user_id == user.id)
-            .first()
-        ) is not None
+        member_id = await self.db.scalar(
+            select(GroupMember.id)
+            .where(GroupMember.group_id == group.id, GroupMember.user_id == user.id)
+            .limit(1)
+        )
+        return member_id is not None
 
-    def get_members(self, group: Group) -> List[GroupMember]:
+    async def get_members(self, group: Group) -> List[GroupMember]:
         """Получить всех участников группы с eager loading пользователей"""
-        return (
-            self.db.query(GroupMember)
+        result = await self.db.execute(
+            select(GroupMember)
             .options(joinedload(GroupMember.user))
-            .filter(GroupMember.group_id == group.id)
-            .all()
+            .where(GroupMember.group_id == group.id)
         )
+        return list(result.scalars().all())
 
-    def get_members_count(self, group: Group) -> int:
+    async def get_members_count(self, group: Group) -> int:
         """Получить количество участников группы"""
-        return self.db.query(GroupMember).filter(GroupMember.group_id == group.id).count()
+        return await self.db.scalar(
+            select(func.count(GroupMember.id)).where(GroupMember.group_id == group.id)
+        )
 
-    def has_active_hatm(self, group: Group) -> bool:
+    async def has_active_hatm(self, group: Group) -> bool:
         """Проверить, есть ли активный хатм в группе"""
-        return (
-            self.db.query(Hatm)
-            .filter(Hatm.group_id == group.id, Hatm.status == HatmStatus.ACTIVE)
-            .first()
-        ) is not None
+        hatm_id = await self.db.scalar(
+            select(Hatm.id)
+            .where(Hatm.group_id == group.id, Hatm.status == HatmStatus.ACTIVE)
+            .limit(1)
+        )
+        return hatm_id is not None
 
-    def get_active_hatm(self, group: Group) -> Optional[Hatm]:
+    async def get_active_hatm(self, group: Group) -> Optional[Hatm]:
         """Получить активный хатм группы"""
-        return (
-            self.db.query(Hatm)
-            .filter(Hatm.group_id == group.id, Hatm.status == HatmStatus.ACTIVE)
-            .first()
+        result = await self.db.execute(
+            select(Hatm)
+            .where(Hatm.group_id == group.id, Hatm.status == HatmStatus.ACTIVE)
         )
+        return result.scalars().first()
+
+    async def delete(self, group: Group) -> None:
+        """Удалить группу вместе с участниками и хатмами"""
+        await self.db.delete(group)
+        await self.db.flush()
@@ -1,46 +1,116 @@
+import logging
 import random
-from sqlalchemy.orm import Session, joinedload
-from typing import List, Optional, Dict
+from sqlalchemy import select, insert, update, func, cast, and_, tuple_, String
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm.attributes import set_committed_value
+from typing import List, Optional, Dict, Tuple
 from datetime import datetime, timedelta
 
+from app.database import serialized_writes
 from app.models.models import Hatm, HatmStatus, JuzAssignment, JuzStatus, Group, GroupMember, User
 from app.schemas.schemas import HatmCreate, HatmProgress, JuzResponse
+from app.services.outbox_service import OutboxService
+from app.realtime import stage_event, hatm_topic, group_topic
+
+logger = logging.getLogger(__name__)
+
+COUNTER_COLUMNS = ("completed_juzs", "pending_juzs", "debt_juzs", "assigned_participants")
+
+
+def hatm_counter_expressions() -> dict:
+    """
+    Коррелированные подзапросы, пересчитывающие счётчики хатма по juz_assignments.
+    Используются для сверки, починки и начального заполнения счётчиков.
+    """
+    def count_juzs(status: JuzStatus):
+        return (
+            select(func.count(JuzAssignment.id))
+            .where(JuzAssignment.hatm_id == Hatm.id, JuzAssignment.status == status)
+            .scalar_subquery()
+        )
+
+    return {
+        "completed_juzs": count_juzs(JuzStatus.COMPLETED),
+        "pending_juzs": count_juzs(JuzStatus.PENDING),
+        "debt_juzs": count_juzs(JuzStatus.DEBT),
+        "assigned_participants": (
+            select(func.count(func.distinct(JuzAssignment.user_id)))
+            .where(JuzAssignment.hatm_id == Hatm.id, JuzAssignment.user_id.isnot(None))
+            .scalar_subquery()
+        ),
+    }
 
 
 class HatmService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
 
-    def create(self, group: Group, hatm_data: HatmCreate) -> Hatm:
-        """Создать новый хатм"""
+    async def create(self, group: Group, hatm_data: HatmCreate) -> Hatm:
+        """Создать новый хатм со следующим номером в группе"""
+        # UPDATE ... RETURNING блокирует строку группы до commit: номера не повторяются
+        sequence_number = await self.db.scalar(
+            update(Group)
+            .where(Group.id == group.id)
+            .values(hatm_sequence=Group.hatm_sequence + 1)
+            .returning(Group.hatm_sequence)
+        )
         hatm = Hatm(
             group_id=group.id,
+            sequence_number=sequence_number,
             duration_days=hatm_data.duration_days,
             participants_count=hatm_data.participants_count,
             status=HatmStatus.PENDING
         )
         self.db.add(hatm)
-        self.db.commit()
-        self.db.refresh(hatm)
+        await self.db.flush()
         return hatm
 
-    def get_by_id(self, hatm_id: int) -> Optional[Hatm]:
+    async def get_by_id(self, hatm_id: int) -> Optional[Hatm]:
         """Получить хатм по ID"""
-        return self.db.query(Hatm).filter(Hatm.id == hatm_id).first()
+        return await self.db.get(Hatm, hatm_id)
+
+    async def get_group_hatms(
+        self,
+        group: Group,
+        limit: Optional[int] = None,
+        after: Optional[Tuple[datetime, int]] = None
+    ) -> List[Hatm]:
+        """
+        Хатмы группы от новых к старым. after - ключ (created_at, id)
+        последнего хатма предыдущей страницы.
+        """
+        query = select(Hatm).where(Hatm.group_id == group.id)
+        if after:
+            query = query.where(tuple_(Hatm.created_at, Hatm.id) < tuple_(*after))
+        result = await self.db.execute(
+            query.order_by(Hatm.created_at.desc(), Hatm.id.desc()).limit(limit)
+        )
+        return list(result.scalars().all())
 
-    def get_group_hatms(self, group: Group) -> List[Hatm]:
-        """Получить все хатмы группы"""
-        return self.db.query(Hatm).filter(Hatm.group_id == group.id).order_by(Hatm.created_at.desc()).all()
+    async def get_member_version(self, hatm_id: int, user: User) -> Optional[Tuple[int, bool]]:
+        """
+        Одним запросом получить версию хатма и признак членства пользователя в его группе.
+        Возвращает (version, is_member) или None, если хатма нет.
+        """
+        is_member = (
+            select(GroupMember.id)
+            .where(GroupMember.group_id == Hatm.group_id, GroupMember.user_id == user.id)
+            .exists()
+        )
+        row = (await self.db.execute(
+            select(Hatm.version, is_member).where(Hatm.id == hatm_id)
+        )).first()
+        return (row[0], bool(row[1])) if row else None
 
-    def get_active_hatm(self, group: Group) -> Optional[Hatm]:
+    async def get_active_hatm(self, group: Group) -> Optional[Hatm]:
         """Получить активный хатм группы"""
-        return (
-            self.db.query(Hatm)
-            .filter(Hatm.group_id == group.id, Hatm.status == HatmStatus.ACTIVE)
-            .first()
+        result = await self.db.execute(
+            select(Hatm).where(Hatm.group_id == group.id, Hatm.status == HatmStatus.ACTIVE)
         )
+        return result.scalars().first()
 
-    def start(self, hatm: Hatm, participants: List[User]) -> Hatm:
+    async def start(self, hatm: Hatm, participants: List[User]) -> Hatm:
         """
         Запустить хатм и распределить джузы.
         Распределение происходит инкрементально:
@@ -58,18 +128,55 @@ class HatmService:
         hatm.status = HatmStatus.ACTIVE
 
         # Распределить 30 джузов (часть назначена текущим участникам, часть без назначения)
-        self._distribute_juzs_incremental(hatm, participants)
+        # и записать их одним многострочным INSERT
+        rows = self._distribute_juzs_incremental(hatm, participants)
+        await self.db.execute(
+            insert(JuzAssignment).values([
+                {
+                    "hatm_id": hatm.id,
+                    "user_id": user_id,
+                    "juz_number": juz_number,
+                    "status": JuzStatus.PENDING,
+                    "is_debt": False,
+                }
+                for user_id, juz_number in rows
+            ])
+        )
+        user_juzs: Dict[int, List[int]] = {}
+        for user_id, juz_number in rows:
+            if user_id is not None:
+                user_juzs.setdefault(user_id, []).append(juz_number)
+
+        # У незапущенного хатма счётчики нулевые
+        await self.adjust_counters(
+            hatm.id,
+            event={"type": "status", "status": HatmStatus.ACTIVE.value},
+            pending_juzs=30,
+            assigned_participants=len(user_juzs)
+        )
+
+        # Уведомления пишутся в outbox в той же транзакции
+        group = await self.db.get(Group, hatm.group_id)
+        outbox = OutboxService(self.db)
+        for user in participants:
+            if user.id in user_juzs and user.telegram_id:
+                outbox.add_juz_assigned(
+                    user.telegram_id, user_juzs[user.id], group.name, hatm.duration_days,
+                    title="Хатм начат!"
+                )
 
-        self.db.commit()
-        self.db.refresh(hatm)
+        await self.db.flush()
         return hatm
 
-    def _distribute_juzs_incremental(self, hatm: Hatm, current_participants: List[User]):
+    def _distribute_juzs_incremental(
+        self, hatm: Hatm, current_participants: List[User]
+    ) -> List[Tuple[Optional[int], int]]:
         """
         Инкрементальное распределение 30 джузов.
         - participants_count (из hatm) определяет количество джузов на человека
         - Текущие участники получают свои порции
         - Остальные джузы создаются с user_id = NULL
+        Возвращает строки (user_id, juz_number) для вставки, в базу ничего не пишет.
         """
         total_juzs = 30
         target_participants = hatm.participants_count  # Целевое количество участников
@@ -87,6 +194,7 @@ class HatmService:
         current_count = min(len(current_participants), target_participants)
 
         juz_index = 0
+        rows: List[Tuple[Optional[int], int]] = []
 
         # Раздаём джузы текущим участникам
         for i in range(current_count):
@@ -95,13 +203,7 @@ class HatmService:
             juzs_for_user = base_juzs + (1 if i < remainder else 0)
 
             for _ in range(juzs_for_user):
-                assignment = JuzAssignment(
-                    hatm_id=hatm.id,
-                    user_id=user.id,
-                    juz_number=juz_numbers[juz_index],
-                    status=JuzStatus.PENDING
-                )
-                self.db.add(assignment)
+                rows.append((user.id, juz_numbers[juz_index]))
                 juz_index += 1
 
         # Создаём нераспределённые джузы (user_id = NULL) для оставшихся слотов
@@ -109,89 +211,204 @@ class HatmService:
             juzs_for_slot = base_juzs + (1 if i < remainder else 0)
 
             for _ in range(juzs_for_slot):
-                assignment = JuzAssignment(
-                    hatm_id=hatm.id,
-                    user_id=None,  # Нераспределённый джуз
-                    juz_number=juz_numbers[juz_index],
-                    status=JuzStatus.PENDING
-                )
-                self.db.add(assignment)
+                rows.append((None, juz_numbers[juz_index]))  # Нераспределённый джуз
                 juz_index += 1
 
+        return rows
+
     def get_juzs_per_participant(self, hatm: Hatm) -> int:
         """Получить количество джузов на одного участника"""
         return 30 // hatm.participants_count
 
-    def get_assigned_participants_count(self, hatm: Hatm) -> int:
-        """Получить количество участников, которым уже назначены джузы"""
-        result = (
-            self.db.query(JuzAssignment.user_id)
-            .filter(JuzAssignment.hatm_id == hatm.id, JuzAssignment.user_id.isnot(None))
-            .distinct()
-            .count()
+    async def adjust_counters(
+        self,
+        hatm_id: int,
+        event: Optional[dict] = None,
+        condition=None,
+        **deltas: int
+    ) -> Optional[dict]:
+        """
+        Атомарно изменить счётчики хатма и увеличить его версию:
+        UPDATE hatms SET x = x + delta, version = version + 1 ... RETURNING.
+        Без deltas только увеличивает версию (например, при смене статуса).
+        condition - дополнительное условие WHERE; если строка под него не попала,
+        ничего не меняется и возвращается None.
+        Загруженный в сессию объект хатма получает новые значения без SELECT.
+        event - дельта для подписчиков хатма и группы; к ней добавляются
+        новые счётчики и версия, публикуется она после commit.
+        Возвращает {"group_id", "version", "counters"}.
+        """
+        values = {name: getattr(Hatm, name) + delta for name, delta in deltas.items() if delta}
+        values["version"] = Hatm.version + 1
+
+        query = update(Hatm).where(Hatm.id == hatm_id)
+        if condition is not None:
+            query = query.where(condition)
+        result = await self.db.execute(
+            query
+            .values(**values)
+            .returning(Hatm.group_id, Hatm.version, *(getattr(Hatm, name) for name in COUNTER_COLUMNS))
+            .execution_options(synchronize_session=False)
+        )
+        row = result.first()
+        if row is None:
+            return None
+
+        group_id, version, *counters = row
+        state = {"group_id": group_id, "version": version, "counters": dict(zip(COUNTER_COLUMNS, counters))}
+        hatm = self.db.identity_map.get(self.db.identity_key(Hatm, hatm_id))
+        if hatm is not None:
+            set_committed_value(hatm, "version", version)
+            for name, value in state["counters"].items():
+                set_committed_value(hatm, name, value)
+
+        if event is not None:
+            self._stage_event(hatm_id, state, event)
+        return state
+
+    def _stage_event(self, hatm_id: int, state: dict, event: dict) -> None:
+        """Поставить событие хатма в очередь публикации после commit"""
+        stage_event(
+            self.db, (hatm_topic(hatm_id), group_topic(state["group_id"])),
+            {**event, "hatm_id": hatm_id, "version": state["version"], "counters": state["counters"]}
         )
-        return result
 
-    def assign_juzs_to_new_member(self, hatm: Hatm, user: User) -> List[JuzAssignment]:
+    async def verify_counters(self, hatm_ids: Optional[List[int]] = None) -> List[Tuple[int, dict, dict]]:
         """
-        Назначить джузы новому участнику из нераспределённого пула.
-        Возвращает список назначенных джузов или пустой список если мест нет.
+        Сверить счётчики с juz_assignments.
+        Возвращает список (hatm_id, сохранённые значения, фактические значения) для расхождений.
+        """
+        actual = hatm_counter_expressions()
+        query = select(
+            Hatm.id,
+            *(getattr(Hatm, name) for name in COUNTER_COLUMNS),
+            *(actual[name] for name in COUNTER_COLUMNS)
+        ).order_by(Hatm.id)
+        if hatm_ids is not None:
+            query = query.where(Hatm.id.in_(hatm_ids))
+
+        mismatches = []
+        size = len(COUNTER_COLUMNS)
+        for row in (await self.db.execute(query)).all():
+            stored = dict(zip(COUNTER_COLUMNS, row[1:1 + size]))
+            real = dict(zip(COUNTER_COLUMNS, row[1 + size:]))
+            if stored != real:
+                mismatches.append((row[0], stored, real))
+        return mismatches
+
+    async def repair_counters(self, hatm_ids: Optional[List[int]] = None) -> int:
+        """Пересчитать счётчики хатмов с расхождениями. Возвращает количество исправленных"""
+        broken = [hatm_id for hatm_id, _, _ in await self.verify_counters(hatm_ids)]
+        if not broken:
+            return 0
+        await self.db.execute(
+            update(Hatm)
+            .where(Hatm.id.in_(broken))
+            .values(**hatm_counter_expressions())
+            .execution_options(synchronize_session=False)
+        )
+        return len(broken)
+
+    async def assign_juzs_to_new_member(self, hatm: Hatm, user: User) -> List[int]:
+        """
+        Назначить джузы новому участнику из нераспределённого пула (claim_juzs
+        и flush). На SQLite (один писатель на базу) назначения внутри процесса
+        выполняются по очереди, чтобы не упираться в блокировку базы.
+        Возвращает номера назначенных джузов или пустой список если мест нет.
         """
         if hatm.status != HatmStatus.ACTIVE:
             return []
 
-        # Проверяем, не назначены ли уже джузы этому пользователю в этом хатме
-        existing = (
-            self.db.query(JuzAssignment)
-            .filter(JuzAssignment.hatm_id == hatm.id, JuzAssignment.user_id == user.id)
-            .first()
-        )
-        if existing:
-            return []  # У пользователя уже есть джузы
+        async with serialized_writes():
+            juz_numbers = await self.claim_juzs(hatm, user)
+            await self.db.flush()
+        return juz_numbers
 
-        # Проверяем, есть ли свободные слоты
-        assigned_count = self.get_assigned_participants_count(hatm)
-        if assigned_count >= hatm.participants_count:
-            return []  # Все слоты заняты
+    async def claim_juzs(self, hatm: Hatm, user: User) -> List[int]:
+        """
+        Занять слот и джузы в текущей транзакции, без commit: слот - одним условным
+        UPDATE счётчика хатма (мест нет или у пользователя уже есть джузы - ничего
+        не меняется), джузы - одним UPDATE ... WHERE id IN (SELECT ... FOR UPDATE
+        SKIP LOCKED) RETURNING, поэтому параллельные вступления не переполняют слоты
+        и не делят джузы. Уведомление добавляется в outbox той же транзакции.
+        Не больше трёх запросов: два UPDATE и INSERT уведомления при flush.
+        """
+        # Занимаем слот: счётчик растёт, только пока есть свободные места
+        # и у пользователя ещё нет джузов в этом хатме
+        has_juzs = (
+            select(JuzAssignment.id)
+            .where(JuzAssignment.hatm_id == hatm.id, JuzAssignment.user_id == user.id)
+            .exists()
+        )
+        state = await self.adjust_counters(
+            hatm.id,
+            condition=and_(
+                Hatm.status == HatmStatus.ACTIVE,
+                Hatm.assigned_participants < Hatm.participants_count,
+                ~has_juzs
+            ),
+            assigned_participants=1
+        )
+        if state is None:
+            return []  # Все слоты заняты или джузы уже назначены
 
-        # Определяем сколько джузов нужно назначить
+        # Новый участник получает столько джузов, сколько положено для его "слота"
+        slot = state["counters"]["assigned_participants"] - 1
         base_juzs = 30 // hatm.participants_count
         remainder = 30 % hatm.participants_count
-        # Новый участник получает столько джузов, сколько положено для его "слота"
-        juzs_for_user = base_juzs + (1 if assigned_count < remainder else 0)
+        juzs_for_user = base_juzs + (1 if slot < remainder else 0)
 
-        # Берём нераспределённые джузы
-        unassigned_juzs = (
-            self.db.query(JuzAssignment)
-            .filter(JuzAssignment.hatm_id == hatm.id, JuzAssignment.user_id.is_(None))
+        # Забираем нераспределённые джузы; строки, занятые параллельной транзакцией, пропускаются
+        free_juzs = (
+            select(JuzAssignment.id)
+            .where(JuzAssignment.hatm_id == hatm.id, JuzAssignment.user_id.is_(None))
+            .order_by(JuzAssignment.id)
             .limit(juzs_for_user)
-            .all()
+            .with_for_update(skip_locked=True)
         )
-
-        if len(unassigned_juzs) == 0:
+        claimed = (await self.db.execute(
+            update(JuzAssignment)
+            .where(JuzAssignment.id.in_(free_juzs.scalar_subquery()))
+            .values(user_id=user.id)
+            .returning(JuzAssignment.id, JuzAssignment.juz_number)
+            .execution_options(synchronize_session=False)
+        )).all()
+
+        if not claimed:
+            # Счётчик разошёлся с пулом джузов - возвращаем слот
+            logger.warning(f"Hatm {hatm.id}: free slot without unassigned juzs")
+            await self.adjust_counters(hatm.id, assigned_participants=-1)
             return []
 
-        # Назначаем джузы пользователю
-        for juz in unassigned_juzs:
-            juz.user_id = user.id
-
-        self.db.commit()
-        return unassigned_juzs
+        self._stage_event(hatm.id, state, {
+            "type": "assigned",
+            "user": {"id": user.id, "username": user.username, "first_name": user.first_name},
+            "juzs": [{"id": juz_id, "juz_number": number} for juz_id, number in claimed],
+        })
 
-    def get_progress(self, hatm: Hatm) -> HatmProgress:
-        """Получить прогресс хатма - оптимизировано с batch загрузкой пользователей"""
+        juz_numbers = sorted(number for _, number in claimed)
+        if user.telegram_id:
+            # Группа обычно уже в сессии (загружена вместе с хатмом) - без SELECT
+            group = await self.db.get(Group, hatm.group_id)
+            OutboxService(self.db).add_juz_assigned(
+                user.telegram_id, juz_numbers, group.name, hatm.duration_days,
+                title="Добро пожаловать в хатм!"
+            )
+        return juz_numbers
+
+    async def get_progress(self, hatm: Hatm) -> HatmProgress:
+        """
+        Получить прогресс хатма - оптимизировано с batch загрузкой пользователей.
+        Итоговые числа берутся из счётчиков хатма.
+        """
         # Используем joinedload для загрузки user вместе с assignment - 1 запрос вместо N+1
-        assignments = (
-            self.db.query(JuzAssignment)
+        result = await self.db.execute(
+            select(JuzAssignment)
             .options(joinedload(JuzAssignment.user))
-            .filter(JuzAssignment.hatm_id == hatm.id)
+            .where(JuzAssignment.hatm_id == hatm.id)
             .order_by(JuzAssignment.juz_number)
-            .all()
         )
-
-        completed = sum(1 for a in assignments if a.status == JuzStatus.COMPLETED)
-        pending = sum(1 for a in assignments if a.status == JuzStatus.PENDING)
-        debt = sum(1 for a in assignments if a.status == JuzStatus.DEBT)
+        assignments = list(result.scalars().all())
 
         juz_responses = []
         for a in assignments:
@@ -210,54 +427,155 @@ class HatmService:
 
         return HatmProgress(
             total_juzs=30,
-            completed_juzs=completed,
-            pending_juzs=pending,
-            debt_juzs=debt,
-            progress_percent=round((completed / 30) * 100, 1),
+            completed_juzs=hatm.completed_juzs,
+            pending_juzs=hatm.pending_juzs,
+            debt_juzs=hatm.debt_juzs,
+            progress_percent=round((hatm.completed_juzs / 30) * 100, 1),
             juz_assignments=juz_responses
         )
 
-    def complete(self, hatm: Hatm) -> Hatm:
+    async def complete(self, hatm: Hatm) -> Hatm:
         """Завершить хатм"""
         hatm.status = HatmStatus.COMPLETED
 
         # Пометить непрочитанные джузы как долги
-        self.db.query(JuzAssignment).filter(
-            JuzAssignment.hatm_id == hatm.id,
-            JuzAssignment.status == JuzStatus.PENDING
-        ).update({
-            JuzAssignment.status: JuzStatus.DEBT,
-            JuzAssignment.is_debt: True
-        })
+        result = await self.db.execute(
+            update(JuzAssignment)
+            .where(
+                JuzAssignment.hatm_id == hatm.id,
+                JuzAssignment.status == JuzStatus.PENDING
+            )
+            .values(status=JuzStatus.DEBT, is_debt=True)
+        )
+        await self.adjust_counters(
+            hatm.id,
+            event={"type": "status", "status": HatmStatus.COMPLETED.value},
+            pending_juzs=-result.rowcount,
+            debt_juzs=result.rowcount
+        )
 
-        self.db.commit()
-        self.db.refresh(hatm)
+        await self.db.flush()
         return hatm
 
-    def check_and_complete(self, hatm: Hatm) -> bool:
-        """Проверить, все ли джузы прочитаны, и завершить хатм если да"""
-        pending_count = (
-            self.db.query(JuzAssignment)
-            .filter(JuzAssignment.hatm_id == hatm.id, JuzAssignment.status == JuzStatus.PENDING)
-            .count()
-        )
-
-        if pending_count == 0:
+    async def check_and_complete(self, hatm: Hatm, completed_by: Optional[User] = None) -> bool:
+        """
+        Проверить, все ли джузы прочитаны, и завершить хатм если да.
+        completed_by - пользователь, закрывший последний джуз (ему уведомление не нужно).
+        """
+        if hatm.status == HatmStatus.ACTIVE and hatm.pending_juzs == 0:
             hatm.status = HatmStatus.COMPLETED
-            self.db.commit()
+            await self.adjust_counters(hatm.id, event={"type": "status", "status": HatmStatus.COMPLETED.value})
+            await self._add_completion_notifications(hatm, exclude_user=completed_by)
+            await self.db.flush()
             return True
         return False
 
-    def check_expired(self, hatm: Hatm) -> bool:
+    async def check_expired(self, hatm: Hatm) -> bool:
         """Проверить, истек ли срок хатма"""
         if hatm.ends_at and datetime.utcnow() > hatm.ends_at:
-            self.complete(hatm)
+            await self.complete(hatm)
             return True
         return False
 
-    def force_complete(self, hatm: Hatm) -> Hatm:
+    async def expire_overdue(self, now: Optional[datetime] = None, limit: int = 500) -> int:
+        """
+        Завершить пачку просроченных хатмов (не больше limit) set-based запросами:
+        UPDATE статуса хатмов (только ещё активных) с RETURNING, UPDATE их джузов
+        (PENDING -> DEBT) и сгруппированный SELECT должников - вместо загрузки
+        каждого хатма через ORM. Джузы и должники берутся только по хатмам, которые
+        завершил этот UPDATE: хатм, завершённый между выборкой и UPDATE другим
+        процессом, не получает долгов и уведомлений второй раз.
+        Каждому должнику пишется одно уведомление в outbox на всю пачку.
+        Возвращает количество завершённых хатмов.
+        """
+        now = now or datetime.utcnow()
+        hatm_ids = (await self.db.scalars(
+            select(Hatm.id)
+            .where(Hatm.status == HatmStatus.ACTIVE, Hatm.ends_at < now)
+            .order_by(Hatm.ends_at)
+            .limit(limit)
+        )).all()
+        if not hatm_ids:
+            return 0
+
+        expired = (await self.db.execute(
+            update(Hatm)
+            .where(Hatm.id.in_(hatm_ids), Hatm.status == HatmStatus.ACTIVE)
+            .values(
+                status=HatmStatus.COMPLETED,
+                debt_juzs=Hatm.debt_juzs + Hatm.pending_juzs,
+                pending_juzs=0,
+                version=Hatm.version + 1
+            )
+            .returning(Hatm.id, Hatm.group_id, Hatm.version, *(getattr(Hatm, name) for name in COUNTER_COLUMNS))
+            .execution_options(synchronize_session=False)
+        )).all()
+        expired_ids = [hatm_id for hatm_id, *_ in expired]
+        if not expired_ids:
+            return 0
+
+        for hatm_id, group_id, version, *counters in expired:
+            stage_event(self.db, (hatm_topic(hatm_id), group_topic(group_id)), {
+                "type": "status",
+                "status": HatmStatus.COMPLETED.value,
+                "hatm_id": hatm_id,
+                "version": version,
+                "counters": dict(zip(COUNTER_COLUMNS, counters)),
+            })
+
+        await self.db.execute(
+            update(JuzAssignment)
+            .where(
+                JuzAssignment.hatm_id.in_(expired_ids),
+                JuzAssignment.status == JuzStatus.PENDING
+            )
+            .values(status=JuzStatus.DEBT, is_debt=True)
+            .execution_options(synchronize_session=False)
+        )
+
+        debtors = await self.db.execute(
+            select(
+                User.telegram_id,
+                func.aggregate_strings(cast(JuzAssignment.juz_number, String), ",")
+            )
+            .join(User, User.id == JuzAssignment.user_id)
+            .where(
+                JuzAssignment.hatm_id.in_(expired_ids),
+                JuzAssignment.status == JuzStatus.DEBT,
+                User.telegram_id.isnot(None)
+            )
+            .group_by(User.id, User.telegram_id)
+        )
+        outbox = OutboxService(self.db)
+        for telegram_id, juz_numbers in debtors.all():
+            outbox.add_debt_created(telegram_id, (int(n) for n in juz_numbers.split(",")))
+
+        await self.db.flush()
+        return len(expired_ids)
+
+    async def force_complete(self, hatm: Hatm) -> Hatm:
         """Завершить хатм вручную (без пометки долгов)"""
         hatm.status = HatmStatus.COMPLETED
-        self.db.commit()
-        self.db.refresh(hatm)
+        await self.adjust_counters(hatm.id, event={"type": "status", "status": HatmStatus.COMPLETED.value})
+        await self._add_completion_notifications(hatm)
+        await self.db.flush()
         return hatm
+
+    async def _add_completion_notifications(self, hatm: Hatm, exclude_user: Optional[User] = None) -> None:
+        """Записать в outbox уведомления о завершении для всех участников хатма"""
+        query = (
+            select(User.telegram_id)
+            .where(
+                User.id.in_(
+                    select(JuzAssignment.user_id)
+                    .where(JuzAssignment.hatm_id == hatm.id, JuzAssignment.user_id.isnot(None))
+                ),
+                User.telegram_id.isnot(None)
+            )
+        )
+        if exclude_user is not None:
+            query = query.where(User.id != exclude_user.id)
+        telegram_ids = (await self.db.scalars(query)).all()
+
+        group = await self.db.get(Group, hatm.group_id)
+        OutboxService(self.db).add_hatm_completed(telegram_ids, group.name if group else 'группы')
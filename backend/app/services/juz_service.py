@@ -1,106 +1,176 @@
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func
-from typing import List, Optional, Dict, Tuple
-from datetime import datetime
+import math
+import random
+from sqlalchemy import select, update, func, cast, and_, or_, tuple_, String
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+from typing import Dict, Iterable, List, Optional, Tuple
+from datetime import datetime, timedelta
 
 from app.models.models import JuzAssignment, JuzStatus, User, Hatm, HatmStatus, Group
 from app.schemas.schemas import JuzResponse, UserJuzStats, UserDebtResponse
+from app.services.hatm_service import HatmService
+from app.services.outbox_service import OutboxService
 
 
 class JuzService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
 
-    def get_by_id(self, juz_id: int) -> Optional[JuzAssignment]:
+    async def get_by_id(self, juz_id: int) -> Optional[JuzAssignment]:
         """Получить джуз по ID"""
-        return self.db.query(JuzAssignment).filter(JuzAssignment.id == juz_id).first()
-
-    def mark_completed(self, juz: JuzAssignment) -> JuzAssignment:
-        """Отметить джуз как прочитанный"""
-        juz.status = JuzStatus.COMPLETED
-        juz.completed_at = datetime.utcnow()
-        if juz.is_debt:
-            juz.is_debt = False  # Погашен долг
-        self.db.commit()
-        self.db.refresh(juz)
+        return await self.db.get(JuzAssignment, juz_id)
+
+    async def mark_completed(self, juz: JuzAssignment) -> JuzAssignment:
+        """
+        Отметить джуз как прочитанный.
+        Статус меняется условным UPDATE (только из прежнего статуса), поэтому
+        при повторном или параллельном нажатии счётчики хатма не сдвигаются дважды.
+        """
+        previous_status = juz.status
+        if previous_status == JuzStatus.COMPLETED:
+            return juz
+
+        completed_at = datetime.utcnow()
+        result = await self.db.execute(
+            update(JuzAssignment)
+            .where(JuzAssignment.id == juz.id, JuzAssignment.status == previous_status)
+            .values(
+                status=JuzStatus.COMPLETED,
+                completed_at=completed_at,
+                is_debt=False  # Погашен долг
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            source = "debt_juzs" if previous_status == JuzStatus.DEBT else "pending_juzs"
+            await HatmService(self.db).adjust_counters(
+                juz.hatm_id,
+                event={
+                    "type": "juz",
+                    "juz": {
+                        "id": juz.id,
+                        "juz_number": juz.juz_number,
+                        "status": JuzStatus.COMPLETED.value,
+                        "user_id": juz.user_id,
+                        "completed_at": completed_at.isoformat(),
+                        "is_debt": False,
+                    },
+                },
+                completed_juzs=1,
+                **{source: -1}
+            )
+            # Объект получает записанные значения без SELECT
+            set_committed_value(juz, "status", JuzStatus.COMPLETED)
+            set_committed_value(juz, "completed_at", completed_at)
+            set_committed_value(juz, "is_debt", False)
+        else:
+            # Статус уже изменил параллельный запрос - перечитываем джуз
+            await self.db.refresh(juz)
         return juz
 
-    def get_user_juzs(self, user: User, hatm_id: int = None) -> List[JuzAssignment]:
+    async def get_user_juzs(self, user: User, hatm_id: int = None) -> List[JuzAssignment]:
         """Получить джузы пользователя"""
-        query = self.db.query(JuzAssignment).filter(JuzAssignment.user_id == user.id)
+        query = select(JuzAssignment).where(JuzAssignment.user_id == user.id)
         if hatm_id:
-            query = query.filter(JuzAssignment.hatm_id == hatm_id)
-        return query.order_by(JuzAssignment.juz_number).all()
+            query = query.where(JuzAssignment.hatm_id == hatm_id)
+        result = await self.db.execute(query.order_by(JuzAssignment.juz_number))
+        return list(result.scalars().all())
 
-    def get_user_active_juzs(self, user: User) -> List[JuzAssignment]:
+    async def get_user_active_juzs(self, user: User) -> List[JuzAssignment]:
         """Получить активные (невыполненные) джузы пользователя из активных хатмов"""
-        return (
-            self.db.query(JuzAssignment)
+        result = await self.db.execute(
+            select(JuzAssignment)
             .join(Hatm)
-            .filter(
+            .where(
                 JuzAssignment.user_id == user.id,
                 JuzAssignment.status == JuzStatus.PENDING,
                 Hatm.status == HatmStatus.ACTIVE
             )
             .order_by(JuzAssignment.juz_number)
-            .all()
         )
+        return list(result.scalars().all())
 
-    def get_user_debts(self, user: User) -> List[JuzAssignment]:
+    async def get_user_debts(self, user: User) -> List[JuzAssignment]:
         """Получить долги пользователя"""
-        return (
-            self.db.query(JuzAssignment)
-            .filter(
+        result = await self.db.execute(
+            select(JuzAssignment)
+            .where(
                 JuzAssignment.user_id == user.id,
                 JuzAssignment.is_debt == True
             )
             .order_by(JuzAssignment.juz_number)
-            .all()
         )
+        return list(result.scalars().all())
 
-    def _get_hatm_info_cache(self, hatm_ids: List[int]) -> Dict[int, Tuple[str, int, int]]:
-        """Получить информацию о хатмах (group_name, hatm_number, group_id)"""
-        cache = {}
+    async def get_hatm_info(self, hatm_ids: Iterable[int]) -> Dict[int, Tuple[Optional[str], int, int]]:
+        """Информация о хатмах одним запросом: {hatm_id: (group_name, hatm_number, group_id)}"""
+        hatm_ids = list(hatm_ids)
         if not hatm_ids:
-            return cache
-
-        # Получаем все хатмы с их группами в одном запросе (eager loading)
-        hatms = (
-            self.db.query(Hatm)
-            .options(joinedload(Hatm.group))
-            .filter(Hatm.id.in_(hatm_ids))
-            .all()
+            return {}
+
+        result = await self.db.execute(
+            select(Hatm.id, Group.name, Hatm.sequence_number, Hatm.group_id)
+            .outerjoin(Group, Group.id == Hatm.group_id)
+            .where(Hatm.id.in_(hatm_ids))
         )
+        return {hatm_id: (group_name, number, group_id) for hatm_id, group_name, number, group_id in result}
+
+    async def get_user_juz_counts(self, user: User) -> Tuple[int, int, int, int]:
+        """Сводка по всем джузам пользователя одним агрегатом: (всего, прочитано, ожидают, долги)"""
+        row = (await self.db.execute(
+            select(
+                func.count(JuzAssignment.id),
+                func.count(JuzAssignment.id).filter(JuzAssignment.status == JuzStatus.COMPLETED),
+                func.count(JuzAssignment.id).filter(JuzAssignment.status == JuzStatus.PENDING),
+                func.count(JuzAssignment.id).filter(JuzAssignment.is_debt == True),
+            ).where(JuzAssignment.user_id == user.id)
+        )).one()
+        return tuple(row)
+
+    async def get_user_juz_history(
+        self,
+        user: User,
+        limit: int,
+        after: Optional[Tuple[Optional[datetime], int]] = None
+    ) -> List[JuzAssignment]:
+        """
+        Джузы пользователя от новых к старым: сначала непрочитанные (completed_at IS NULL),
+        затем по убыванию completed_at. after - ключ (completed_at, id) последней строки
+        предыдущей страницы.
+        """
+        query = select(JuzAssignment).where(JuzAssignment.user_id == user.id)
+        if after:
+            completed_at, juz_id = after
+            if completed_at is None:
+                query = query.where(or_(
+                    and_(JuzAssignment.completed_at.is_(None), JuzAssignment.id < juz_id),
+                    JuzAssignment.completed_at.isnot(None)
+                ))
+            else:
+                query = query.where(
+                    JuzAssignment.completed_at.isnot(None),
+                    tuple_(JuzAssignment.completed_at, JuzAssignment.id) < tuple_(completed_at, juz_id)
+                )
+        result = await self.db.execute(
+            query
+            .order_by(JuzAssignment.completed_at.desc().nulls_first(), JuzAssignment.id.desc())
+            .limit(limit)
+        )
+        return list(result.scalars().all())
+
+    async def get_user_stats(
+        self,
+        user: User,
+        limit: int,
+        after: Optional[Tuple[Optional[datetime], int]] = None
+    ) -> UserJuzStats:
+        """Сводка по всем джузам пользователя и страница истории (get_user_juz_history)"""
+        total, completed, pending, debts = await self.get_user_juz_counts(user)
+        all_juzs = await self.get_user_juz_history(user, limit, after)
 
-        # Группируем хатмы по group_id для подсчета номера
-        group_hatm_counts = {}
-        for hatm in hatms:
-            if hatm.group:
-                if hatm.group_id not in group_hatm_counts:
-                    # Один запрос для подсчета всех хатмов группы
-                    count = self.db.query(func.count(Hatm.id)).filter(
-                        Hatm.group_id == hatm.group_id,
-                        Hatm.id <= hatm.id
-                    ).scalar()
-                    group_hatm_counts[(hatm.group_id, hatm.id)] = count
-                else:
-                    count = group_hatm_counts.get((hatm.group_id, hatm.id), 1)
-
-                cache[hatm.id] = (hatm.group.name, count, hatm.group_id)
-
-        return cache
-
-    def get_user_stats(self, user: User) -> UserJuzStats:
-        """Получить статистику пользователя по джузам"""
-        all_juzs = self.get_user_juzs(user)
-
-        completed = sum(1 for j in all_juzs if j.status == JuzStatus.COMPLETED)
-        pending = sum(1 for j in all_juzs if j.status == JuzStatus.PENDING)
-        debts = sum(1 for j in all_juzs if j.is_debt)
-
-        # Получаем информацию о хатмах для всех джузов
+        # Получаем информацию о хатмах для джузов страницы
         hatm_ids = list(set(j.hatm_id for j in all_juzs))
-        hatm_info = self._get_hatm_info_cache(hatm_ids)
+        hatm_info = await self.get_hatm_info(hatm_ids)
 
         juz_responses = []
         for j in all_juzs:
@@ -118,16 +188,16 @@ class JuzService:
             ))
 
         return UserJuzStats(
-            total_assigned=len(all_juzs),
+            total_assigned=total,
             completed=completed,
             pending=pending,
             debts=debts,
             juzs=juz_responses
         )
 
-    def get_user_debt_response(self, user: User) -> UserDebtResponse:
+    async def get_user_debt_response(self, user: User) -> UserDebtResponse:
         """Получить ответ с долгами пользователя"""
-        debts = self.get_user_debts(user)
+        debts = await self.get_user_debts(user)
 
         debt_responses = []
         for d in debts:
@@ -145,9 +215,9 @@ class JuzService:
             total_debts=len(debts)
         )
 
-    def get_juz_with_user_info(self, juz: JuzAssignment) -> JuzResponse:
+    async def get_juz_with_user_info(self, juz: JuzAssignment) -> JuzResponse:
         """Получить информацию о джузе с данными пользователя"""
-        user = self.db.query(User).filter(User.id == juz.user_id).first()
+        user = await self.db.get(User, juz.user_id) if juz.user_id else None
         return JuzResponse(
             id=juz.id,
             juz_number=juz.juz_number,
@@ -158,3 +228,77 @@ class JuzService:
             completed_at=juz.completed_at,
             is_debt=juz.is_debt
         )
+
+    async def schedule_reminders(
+        self,
+        interval: timedelta,
+        spread: float,
+        now: Optional[datetime] = None,
+        limit: int = 1000
+    ) -> int:
+        """
+        Запланировать напоминания о непрочитанных джузах.
+        Один сгруппированный SELECT по juz_assignments + активным хатмам находит
+        пары (пользователь, хатм), которым не напоминали дольше interval.
+        Напоминания пишутся в outbox со случайной задержкой в пределах spread
+        секунд, чтобы не отправлять их одной волной, а reminded_at обновляется
+        в той же транзакции - после рестарта повторной рассылки не будет.
+        Возвращает количество запланированных напоминаний.
+        """
+        now = now or datetime.utcnow()
+        cutoff = now - interval
+        last_reminded = func.max(JuzAssignment.reminded_at)
+
+        due = (await self.db.execute(
+            select(
+                JuzAssignment.hatm_id,
+                JuzAssignment.user_id,
+                User.telegram_id,
+                Hatm.ends_at,
+                func.aggregate_strings(
+                    cast(JuzAssignment.id, String) + ":" + cast(JuzAssignment.juz_number, String),
+                    ","
+                )
+            )
+            .join(Hatm, Hatm.id == JuzAssignment.hatm_id)
+            .join(User, User.id == JuzAssignment.user_id)
+            .where(
+                Hatm.status == HatmStatus.ACTIVE,
+                Hatm.started_at <= cutoff,
+                Hatm.ends_at > now,
+                JuzAssignment.status == JuzStatus.PENDING,
+                User.telegram_id.isnot(None)
+            )
+            .group_by(JuzAssignment.hatm_id, JuzAssignment.user_id, User.telegram_id, Hatm.ends_at)
+            .having(or_(last_reminded.is_(None), last_reminded <= cutoff))
+            .order_by(JuzAssignment.hatm_id, JuzAssignment.user_id)
+            .limit(limit)
+        )).all()
+        if not due:
+            return 0
+
+        outbox = OutboxService(self.db)
+        for _, _, telegram_id, ends_at, juzs in due:
+            days_left = max(1, math.ceil((ends_at - now).total_seconds() / 86400))
+            juz_pairs = [tuple(int(x) for x in item.split(":")) for item in juzs.split(",")]
+            outbox.add_reminder(
+                telegram_id, juz_pairs, days_left,
+                available_at=now + timedelta(seconds=random.uniform(0, spread))
+            )
+
+        # hatm_id IN (...) - поиск по индексу: сравнение пар (hatm_id, user_id)
+        # со списком VALUES SQLite выполняет полным сканированием таблицы
+        await self.db.execute(
+            update(JuzAssignment)
+            .where(
+                JuzAssignment.hatm_id.in_({hatm_id for hatm_id, *_ in due}),
+                tuple_(JuzAssignment.hatm_id, JuzAssignment.user_id).in_(
+                    [(hatm_id, user_id) for hatm_id, user_id, *_ in due]
+                ),
+                JuzAssignment.status == JuzStatus.PENDING
+            )
+            .values(reminded_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        await self.db.flush()
+        return len(due)
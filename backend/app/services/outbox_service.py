@@ -0,0 +1,170 @@
+from sqlalchemy import select, update, delete, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Iterable, List, Optional, Tuple
+from datetime import datetime, timedelta
+import os
+
+from app.models.models import NotificationOutbox, OutboxStatus
+
+# После стольких неудачных попыток уведомление помечается как FAILED
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+# Пауза перед повторной попыткой после временной ошибки (секунды)
+OUTBOX_RETRY_DELAY = int(os.getenv("OUTBOX_RETRY_DELAY", "60"))
+
+
+class OutboxService:
+    """
+    Outbox уведомлений. Методы add_* только добавляют строки в сессию:
+    они коммитятся вместе с изменением состояния, которое их вызвало.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    def add(
+        self,
+        kind: str,
+        chat_id: int,
+        payload: dict,
+        available_at: Optional[datetime] = None
+    ) -> NotificationOutbox:
+        """Записать уведомление в outbox (без commit). available_at - не отправлять раньше"""
+        message = NotificationOutbox(
+            kind=kind,
+            chat_id=chat_id,
+            payload=payload,
+            status=OutboxStatus.PENDING,
+            available_at=available_at or datetime.utcnow()
+        )
+        self.db.add(message)
+        return message
+
+    def add_juz_assigned(
+        self,
+        telegram_id: int,
+        juz_numbers: Iterable[int],
+        group_name: str,
+        duration_days: int,
+        title: str
+    ) -> NotificationOutbox:
+        return self.add("juz_assigned", telegram_id, {
+            "juz_numbers": sorted(juz_numbers),
+            "group_name": group_name,
+            "duration_days": duration_days,
+            "title": title,
+        })
+
+    def add_hatm_completed(self, telegram_ids: Iterable[int], group_name: str) -> None:
+        for telegram_id in telegram_ids:
+            self.add("hatm_completed", telegram_id, {"group_name": group_name})
+
+    def add_debt_created(self, telegram_id: int, juz_numbers: Iterable[int]) -> NotificationOutbox:
+        return self.add("debt_created", telegram_id, {"juz_numbers": sorted(juz_numbers)})
+
+    def add_reminder(
+        self,
+        telegram_id: int,
+        juzs: List[Tuple[int, int]],
+        days_left: int,
+        available_at: Optional[datetime] = None
+    ) -> NotificationOutbox:
+        return self.add(
+            "reminder", telegram_id,
+            {"juzs": [list(j) for j in juzs], "days_left": days_left},
+            available_at=available_at
+        )
+
+    async def claim_batch(self, limit: int, stale_after: timedelta) -> List[Tuple[int, str, int, dict]]:
+        """
+        Забрать пачку уведомлений на отправку одним UPDATE ... RETURNING.
+        На PostgreSQL строки выбираются с FOR UPDATE SKIP LOCKED, поэтому
+        несколько воркеров не мешают друг другу. SQLite игнорирует FOR UPDATE,
+        но там сам UPDATE выполняется под блокировкой записи всей базы.
+        Зависшие в PROCESSING дольше stale_after (упавший процесс) забираются повторно.
+        Пачку нужно зафиксировать до отправки (отдельная единица работы).
+        """
+        now = datetime.utcnow()
+        candidates = (
+            select(NotificationOutbox.id)
+            .where(
+                or_(
+                    and_(
+                        NotificationOutbox.status == OutboxStatus.PENDING,
+                        NotificationOutbox.available_at <= now
+                    ),
+                    and_(
+                        NotificationOutbox.status == OutboxStatus.PROCESSING,
+                        NotificationOutbox.claimed_at < now - stale_after
+                    )
+                )
+            )
+            # Не по id: порядок первичного ключа SQLite получает сканированием всей таблицы
+            # (с доставленными за OUTBOX_RETENTION_DAYS), а не поиском по двум индексам статуса
+            .order_by(NotificationOutbox.available_at, NotificationOutbox.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        result = await self.db.execute(
+            update(NotificationOutbox)
+            .where(NotificationOutbox.id.in_(candidates.scalar_subquery()))
+            .values(
+                status=OutboxStatus.PROCESSING,
+                claimed_at=now,
+                attempts=NotificationOutbox.attempts + 1
+            )
+            .returning(
+                NotificationOutbox.id,
+                NotificationOutbox.kind,
+                NotificationOutbox.chat_id,
+                NotificationOutbox.payload
+            )
+            .execution_options(synchronize_session=False)
+        )
+        return sorted(tuple(row) for row in result.all())
+
+    async def mark_sent(self, ids: List[int]) -> None:
+        """Отметить уведомления как доставленные"""
+        if not ids:
+            return
+        await self.db.execute(
+            update(NotificationOutbox)
+            .where(NotificationOutbox.id.in_(ids))
+            .values(status=OutboxStatus.SENT, sent_at=datetime.utcnow(), last_error=None)
+            .execution_options(synchronize_session=False)
+        )
+
+    async def mark_failed(self, ids: List[int], error: str, permanent: bool = False) -> None:
+        """
+        Вернуть уведомления в очередь для повторной попытки или,
+        если попытки исчерпаны (или ошибка постоянная), пометить как FAILED.
+        """
+        if not ids:
+            return
+        exhausted = NotificationOutbox.attempts >= OUTBOX_MAX_ATTEMPTS
+        if permanent:
+            updates = [(OutboxStatus.FAILED, NotificationOutbox.id.in_(ids))]
+        else:
+            updates = [
+                (OutboxStatus.FAILED, and_(NotificationOutbox.id.in_(ids), exhausted)),
+                (OutboxStatus.PENDING, and_(NotificationOutbox.id.in_(ids), ~exhausted)),
+            ]
+        retry_at = datetime.utcnow() + timedelta(seconds=OUTBOX_RETRY_DELAY)
+        for status, condition in updates:
+            await self.db.execute(
+                update(NotificationOutbox)
+                .where(condition)
+                .values(status=status, last_error=error[:1000], available_at=retry_at)
+                .execution_options(synchronize_session=False)
+            )
+
+    async def purge_sent(self, older_than: timedelta) -> int:
+        """Удалить доставленные уведомления старше older_than"""
+        result = await self.db.execute(
+            delete(NotificationOutbox)
+            .where(
+                NotificationOutbox.status == OutboxStatus.SENT,
+                NotificationOutbox.sent_at < datetime.utcnow() - older_than
+            )
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount
@@ -1,22 +1,24 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
-from app.models.models import User
+from app.models.models import User, Hatm, JuzAssignment
 from app.schemas.schemas import UserCreate
 
 
 class UserService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
 
-    def get_by_telegram_id(self, telegram_id: int) -> Optional[User]:
+    async def get_by_telegram_id(self, telegram_id: int) -> Optional[User]:
         """Получить пользователя по Telegram ID"""
-        return self.db.query(User).filter(User.telegram_id == telegram_id).first()
+        result = await self.db.execute(select(User).where(User.telegram_id == telegram_id))
+        return result.scalars().first()
 
-    def get_by_id(self, user_id: int) -> Optional[User]:
+    async def get_by_id(self, user_id: int) -> Optional[User]:
         """Получить пользователя по ID"""
-        return self.db.query(User).filter(User.id == user_id).first()
+        return await self.db.get(User, user_id)
 
-    def create(self, user_data: UserCreate) -> User:
+    async def create(self, user_data: UserCreate) -> User:
         """Создать нового пользователя"""
         user = User(
             telegram_id=user_data.telegram_id,
@@ -24,20 +26,19 @@ class UserService:
             first_name=user_data.first_name
         )
         self.db.add(user)
-        self.db.commit()
-        self.db.refresh(user)
+        await self.db.flush()
         return user
 
-    def get_or_create(self, telegram_id: int, username: str = None, first_name: str = None) -> User:
+    async def get_or_create(self, telegram_id: int, username: str = None, first_name: str = None) -> User:
         """Получить или создать пользователя"""
-        user = self.get_by_telegram_id(telegram_id)
+        user = await self.get_by_telegram_id(telegram_id)
         if not user:
             user_data = UserCreate(
                 telegram_id=telegram_id,
                 username=username,
                 first_name=first_name
             )
-            user = self.create(user_data)
+            user = await self.create(user_data)
         else:
             # Обновить данные если изменились
             updated = False
@@ -48,16 +49,26 @@ class UserService:
                 user.first_name = first_name
                 updated = True
             if updated:
-                self.db.commit()
-                self.db.refresh(user)
+                # Имя показывается в прогрессе хатмов - сбрасываем их кэш
+                await self._bump_hatm_versions(user)
+                await self.db.flush()
         return user
 
-    def update(self, user: User, username: str = None, first_name: str = None) -> User:
+    async def update(self, user: User, username: str = None, first_name: str = None) -> User:
         """Обновить данные пользователя"""
         if username:
             user.username = username
         if first_name:
             user.first_name = first_name
-        self.db.commit()
-        self.db.refresh(user)
+        await self._bump_hatm_versions(user)
+        await self.db.flush()
         return user
+
+    async def _bump_hatm_versions(self, user: User) -> None:
+        """Увеличить версию хатмов, в которых у пользователя есть джузы"""
+        await self.db.execute(
+            update(Hatm)
+            .where(Hatm.id.in_(select(JuzAssignment.hatm_id).where(JuzAssignment.user_id == user.id)))
+            .values(version=Hatm.version + 1)
+            .execution_options(synchronize_session=False)
+        )
@@ -0,0 +1,147 @@
+# Профиль SQLite для продакшена: WAL и прагмы на каждом соединении, пул соединений
+# и очередь писателя процесса (SQLite допускает одну пишущую транзакцию на базу)
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.metrics import db_write_queue_wait
+
+logger = logging.getLogger(__name__)
+
+# production - WAL, прагмы, пул и очередь писателя; legacy - прежнее поведение
+# (одно общее соединение, журнал отката, полный fsync) для сравнения в бенчмарках
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "production").lower()
+# Сколько соединение ждёт блокировку записи другого процесса до "database is locked" (мс)
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# Размер отображения файла базы в память (байты, 0 - выключено)
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# Кэш страниц на соединение (КиБ)
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "16384"))
+# Пул соединений асинхронного движка: в WAL читатели не ждут писателя
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "5"))
+SQLITE_MAX_OVERFLOW = int(os.getenv("SQLITE_MAX_OVERFLOW", "10"))
+
+
+def is_file_database(url: str) -> bool:
+    """Файловая база SQLite (для :memory: нужен StaticPool, а WAL невозможен)"""
+    database = make_url(url).database
+    return bool(database) and database != ":memory:" and not database.startswith("file::memory:")
+
+
+def production_profile(url: str) -> bool:
+    return SQLITE_PROFILE == "production" and is_file_database(url)
+
+
+def apply_pragmas(engine: Engine) -> None:
+    """Выполнять прагмы при открытии каждого соединения пула"""
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            # WAL: читатели не блокируют писателя и наоборот; режим хранится в файле базы
+            cursor.execute("PRAGMA journal_mode=WAL")
+            # В WAL fsync только при checkpoint: после сбоя питания теряется
+            # последняя транзакция, но база остаётся целой
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+            cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+            cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+            cursor.execute("PRAGMA temp_store=MEMORY")
+        finally:
+            cursor.close()
+
+
+class WriterQueue:
+    """
+    Очередь писателей процесса: одна пишущая транзакция за раз, остальные ждут
+    по порядку в asyncio, а не опрашивают блокировку в busy-handler SQLite
+    (с паузами до 100 мс и ошибкой по таймауту). Повторный вход той же задачей
+    не блокирует - serialized_writes() вокруг сессии, которая пишет сама.
+    """
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self._owner: Optional[asyncio.Task] = None
+        self._depth = 0
+
+    async def acquire(self) -> bool:
+        """
+        Встать в очередь. False - не дождались за busy_timeout (например, запись
+        ждёт задачу, которая сама ждёт её результата): тогда пишем без очереди,
+        и конфликт разрешит busy_timeout самой SQLite.
+        """
+        task = asyncio.current_task()
+        if self._owner is task:
+            self._depth += 1
+            return True
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._lock.acquire(), SQLITE_BUSY_TIMEOUT_MS / 1000)
+        except asyncio.TimeoutError:
+            logger.warning("SQLite writer queue wait exceeded busy_timeout, writing without the queue")
+            return False
+        finally:
+            db_write_queue_wait.observe(time.perf_counter() - started)
+        self._owner, self._depth = task, 1
+        return True
+
+    def release(self) -> None:
+        self._depth -= 1
+        if self._depth == 0:
+            self._owner = None
+            self._lock.release()
+
+
+writer_queue = WriterQueue()
+
+
+class SerializedWriteSession(AsyncSession):
+    """
+    Сессия, которая занимает очередь писателя перед первой записью транзакции
+    (DML-запрос или flush/commit с изменёнными объектами) и освобождает её,
+    когда транзакция завершена. Чтение очередь не занимает.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._holds_writer = False
+        event.listen(self.sync_session, "after_transaction_end", self._transaction_ended)
+
+    def _transaction_ended(self, session, transaction) -> None:
+        if transaction.parent is None and self._holds_writer:
+            self._holds_writer = False
+            writer_queue.release()
+
+    async def _enter_writer(self) -> None:
+        if not self._holds_writer:
+            self._holds_writer = await writer_queue.acquire()
+
+    def _has_changes(self) -> bool:
+        return bool(self.sync_session.new or self.sync_session.dirty or self.sync_session.deleted)
+
+    async def execute(self, statement, *args, **kwargs):
+        if getattr(statement, "is_dml", False):
+            await self._enter_writer()
+        return await super().execute(statement, *args, **kwargs)
+
+    async def scalar(self, statement, *args, **kwargs):
+        if getattr(statement, "is_dml", False):
+            await self._enter_writer()
+        return await super().scalar(statement, *args, **kwargs)
+
+    async def flush(self, objects=None) -> None:
+        if self._has_changes():
+            await self._enter_writer()
+        await super().flush(objects)
+
+    async def commit(self) -> None:
+        if self._has_changes():
+            await self._enter_writer()
+        await super().commit()
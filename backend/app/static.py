@@ -0,0 +1,110 @@
+# Раздача собранного фронтенда: предсжатые при сборке варианты (.br/.gz), заголовки кэширования
+# и index.html из памяти - на холодное открытие Mini App сервер не тратит CPU на сжатие
+import hashlib
+import mimetypes
+import stat
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.requests import Request
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from app.api.cache import etag_matches
+
+# Предпочтение brotli: JS/CSS на 15-20% меньше, чем gzip
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+# Файлы /assets содержат хэш содержимого в имени и никогда не меняются
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def accepted_encodings(scope: Scope) -> Set[str]:
+    """Кодировки из Accept-Encoding, кроме явно запрещённых (q=0)"""
+    accepted = set()
+    for item in Headers(scope=scope).get("accept-encoding", "").split(","):
+        name, *params = item.split(";")
+        quality = 1.0
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name.strip() and quality > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles, который отдаёт file.br или file.gz из того же каталога,
+    если они собраны и клиент их принимает, и ставит Cache-Control.
+    Без предсжатого варианта файл отдаётся как есть.
+    """
+
+    def __init__(self, *, directory: Path, cache_control: str):
+        super().__init__(directory=directory)
+        self.cache_control = cache_control
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        response = None
+        if scope["method"] in ("GET", "HEAD"):
+            response = await self._precompressed_response(path, scope)
+        if response is None:
+            response = await super().get_response(path, scope)
+        response.headers["Cache-Control"] = self.cache_control
+        response.headers.add_vary_header("Accept-Encoding")
+        return response
+
+    async def _precompressed_response(self, path: str, scope: Scope) -> Optional[Response]:
+        accepted = accepted_encodings(scope)
+        for encoding, suffix in ENCODINGS:
+            if encoding not in accepted:
+                continue
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path + suffix)
+            if not stat_result or not stat.S_ISREG(stat_result.st_mode):
+                continue
+            response = FileResponse(
+                full_path,
+                stat_result=stat_result,
+                media_type=mimetypes.guess_type(path)[0] or "text/plain",
+                headers={"Content-Encoding": encoding}
+            )
+            if self.is_not_modified(response.headers, Headers(scope=scope)):
+                return NotModifiedResponse(response.headers)
+            return response
+        return None
+
+
+class SpaIndex:
+    """
+    index.html в памяти вместе с предсжатыми вариантами. Cache-Control: no-cache -
+    клиент перепроверяет ETag при каждом открытии и после деплоя сразу получает
+    новую версию, а до тех пор - 304 без тела.
+    """
+
+    def __init__(self, path: Path):
+        self.variants: Dict[Optional[str], bytes] = {None: path.read_bytes()}
+        for encoding, suffix in ENCODINGS:
+            compressed = path.with_name(path.name + suffix)
+            if compressed.exists():
+                self.variants[encoding] = compressed.read_bytes()
+        # Слабый ETag: один на все кодировки одного содержимого
+        self.etag = '"' + hashlib.sha256(self.variants[None]).hexdigest()[:20] + '"'
+
+    def response(self, request: Request) -> Response:
+        headers = {"ETag": f"W/{self.etag}", "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if etag_matches(request.headers.get("if-none-match"), self.etag):
+            return Response(status_code=304, headers=headers)
+
+        accepted = accepted_encodings(request.scope)
+        for encoding, _ in ENCODINGS:
+            if encoding in accepted and encoding in self.variants:
+                headers["Content-Encoding"] = encoding
+                return Response(self.variants[encoding], media_type="text/html", headers=headers)
+        return Response(self.variants[None], media_type="text/html", headers=headers)
@@ -0,0 +1,175 @@
+# Фоновый процесс: Telegram-бот, доставка уведомлений и периодические задачи.
+# Запуск отдельно от API: python -m app.worker
+import asyncio
+import logging
+import os
+import signal
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+# Переменные окружения нужны до импорта настроек базы данных
+load_dotenv()
+
+from aiogram import Bot, Dispatcher  # noqa: E402
+
+from app.database import init_db, close_db, async_engine  # noqa: E402
+from app.bot.factory import create_bot, get_dispatcher  # noqa: E402
+from app.bot.notifications import NotificationService  # noqa: E402
+from app.bot.webhook import webhook_enabled, webhook_url, webhook_secret, WEBHOOK_BASE_URL  # noqa: E402
+from app.jobs import OutboxDrainer, ExpirySweeper, ReminderScheduler  # noqa: E402
+from app.leader import LeaderLock  # noqa: E402
+from app.metrics import bind_db_pool, monitor_event_loop, serve_metrics  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+BOT_TOKEN = os.getenv("BOT_TOKEN", "")
+# Как часто лидер проверяет, что блокировка всё ещё его (секунды)
+LEADER_CHECK_INTERVAL = float(os.getenv("LEADER_CHECK_INTERVAL", "15"))
+# Как часто резервный процесс пытается стать лидером (секунды)
+LEADER_RETRY_INTERVAL = float(os.getenv("LEADER_RETRY_INTERVAL", "10"))
+# Порт для /metrics отдельного воркера (0 - не открывать)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+
+class BotRuntime:
+    """
+    Всё, что должно работать в единственном экземпляре: polling Telegram
+    (или регистрация webhook), outbox drainer и периодические задачи.
+    Запускается только процессом-лидером.
+    """
+
+    def __init__(self):
+        self.bot: Optional[Bot] = None
+        self.dp: Optional[Dispatcher] = None
+        self.notification_service: Optional[NotificationService] = None
+        self.tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        # Завершение просроченных хатмов (долги + уведомления через outbox)
+        self.tasks.append(asyncio.create_task(ExpirySweeper().run()))
+
+        # Напоминания о непрочитанных джузах (через outbox, с разбросом по времени)
+        self.tasks.append(asyncio.create_task(ReminderScheduler().run()))
+
+        if not BOT_TOKEN:
+            logger.warning("BOT_TOKEN not set, bot will not start")
+            return
+
+        self.bot = create_bot(BOT_TOKEN)
+        self.dp = get_dispatcher()
+
+        # Инициализация сервиса уведомлений (очередь с пулом воркеров)
+        self.notification_service = NotificationService(self.bot)
+        await self.notification_service.start()
+
+        # Доставка уведомлений из outbox
+        self.tasks.append(asyncio.create_task(OutboxDrainer(self.notification_service).run()))
+
+        if webhook_enabled():
+            # Апдейты принимают веб-воркеры (app.bot.webhook), лидер только регистрирует адрес
+            await self._set_webhook()
+        else:
+            self.tasks.append(asyncio.create_task(self._poll()))
+        logger.info("Bot started")
+
+    async def _set_webhook(self) -> None:
+        if not WEBHOOK_BASE_URL:
+            logger.error("BOT_MODE=webhook requires WEBHOOK_BASE_URL, webhook is not registered")
+            return
+        try:
+            await self.bot.set_webhook(
+                webhook_url(),
+                secret_token=webhook_secret(BOT_TOKEN),
+                allowed_updates=self.dp.resolve_used_update_types()
+            )
+            logger.info(f"Webhook registered: {webhook_url()}")
+        except Exception as e:
+            logger.error(f"Failed to register webhook: {e}")
+
+    async def _poll(self) -> None:
+        try:
+            # getUpdates не работает, пока зарегистрирован webhook (например, после смены режима)
+            await self.bot.delete_webhook()
+            # Сигналы обрабатывает владелец процесса (uvicorn или main ниже), а не aiogram
+            await self.dp.start_polling(self.bot, handle_signals=False)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Bot polling error: {e}")
+
+    async def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks.clear()
+        if self.notification_service:
+            await self.notification_service.stop()
+            self.notification_service = None
+        if self.bot:
+            await self.bot.session.close()
+            self.bot = None
+        self.dp = None
+
+
+async def run_as_leader(runtime: BotRuntime, lock: Optional[LeaderLock] = None) -> None:
+    """
+    Ждать лидерства и держать runtime запущенным, пока блокировка наша.
+    Остальные процессы остаются в резерве и подхватывают работу, если лидер упал.
+    """
+    lock = lock or LeaderLock()
+    try:
+        while True:
+            try:
+                acquired = await lock.acquire()
+            except Exception as e:
+                logger.error(f"Leader election error: {e}")
+                acquired = False
+            if not acquired:
+                await asyncio.sleep(LEADER_RETRY_INTERVAL)
+                continue
+
+            logger.info(f"Process {os.getpid()} became leader, starting bot runtime")
+            try:
+                await runtime.start()
+                while await lock.check():
+                    await asyncio.sleep(LEADER_CHECK_INTERVAL)
+                logger.warning("Leadership lost, stopping bot runtime")
+            finally:
+                await runtime.stop()
+    finally:
+        await lock.release()
+
+
+async def main() -> None:
+    init_db()
+
+    metrics_server = None
+    lag_monitor = None
+    if METRICS_PORT:
+        bind_db_pool(async_engine.sync_engine.pool)
+        metrics_server = await serve_metrics(METRICS_PORT)
+        lag_monitor = asyncio.create_task(monitor_event_loop())
+
+    task = asyncio.create_task(run_as_leader(BotRuntime()))
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, task.cancel)
+
+    try:
+        await task
+    except asyncio.CancelledError:
+        logger.info("Worker stopped")
+    finally:
+        if metrics_server:
+            lag_monitor.cancel()
+            metrics_server.close()
+        await close_db()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    asyncio.run(main())
@@ -0,0 +1,46 @@
+"""
+Общие помощники бенчмарков: окружение, подпись init data, перцентили.
+"""
+import hashlib
+import hmac
+import json
+import os
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+
+BOT_TOKEN = "benchmark:token"
+
+
+def configure_environment(name: str) -> None:
+    """
+    Подготовить окружение до импорта приложения: токен для подписи init data,
+    проверка подписи включена, база - DATABASE_URL или временная SQLite.
+    """
+    os.environ["BOT_TOKEN"] = BOT_TOKEN
+    os.environ["DEV_MODE"] = "false"
+    if "DATABASE_URL" not in os.environ:
+        os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/{name}.db"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def sign_init_data(telegram_id: int, name: str) -> str:
+    """Подписать init data так же, как это делает Telegram"""
+    data = {
+        "auth_date": str(int(time.time())),
+        "user": json.dumps({"id": telegram_id, "first_name": name, "username": name}),
+    }
+    data_check_string = "\n".join(f"{k}={v}" for k, v in sorted(data.items()))
+    secret_key = hmac.new(b"WebAppData", BOT_TOKEN.encode(), hashlib.sha256).digest()
+    data["hash"] = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+    return urlencode(data)
+
+
+def init_data_headers(telegram_id: int) -> dict:
+    return {"X-Telegram-Init-Data": sign_init_data(telegram_id, f"user{telegram_id}")}
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
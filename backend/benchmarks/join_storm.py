@@ -0,0 +1,160 @@
+"""
+Нагрузочная проверка вступления в группу с активным хатмом.
+
+Сотни пользователей одновременно вступают по одному коду приглашения
+(как при публикации ссылки в большом чате). После шторма проверяется,
+что слоты не переполнены, каждый джуз принадлежит не более чем одному
+участнику, размеры порций соответствуют слотам, а счётчики хатма
+совпадают с juz_assignments. Каждое вступление укладывается в бюджет
+SQL-запросов (JOIN_STATEMENT_BUDGET), повторное - в один SELECT.
+
+Запуск из каталога backend:
+    python -m benchmarks.join_storm --joins 300 --participants 30
+По умолчанию используется временная SQLite база; для PostgreSQL
+задайте DATABASE_URL (база должна быть пустой или тестовой).
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import sys
+import time
+from collections import Counter
+
+from benchmarks.common import configure_environment, sign_init_data, init_data_headers, percentile
+
+
+async def run(joins: int, participants: int, concurrency: int) -> bool:
+    import httpx
+    from sqlalchemy import select, func
+
+    from app.database import init_db, AsyncSessionLocal, close_db
+    from app.main import app
+    from app.models.models import JuzAssignment
+    from app.query_stats import track_queries
+    from app.services.group_service import JOIN_STATEMENT_BUDGET
+    from app.services.hatm_service import HatmService
+
+    init_db()
+    # Лог каждого запроса заглушил бы отчёт
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    # Ошибки приложения считаются как 500, а не прерывают прогон
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://storm", timeout=60) as client:
+        creator = {"X-Telegram-Init-Data": sign_init_data(1, "creator")}
+        group = (await client.post("/api/groups", json={"name": "Storm"}, headers=creator)).json()
+        hatm = (await client.post(
+            f"/api/groups/{group['id']}/hatms",
+            json={"duration_days": 7, "participants_count": participants},
+            headers=creator
+        )).json()
+        response = await client.post(f"/api/hatms/{hatm['id']}/start", headers=creator)
+        response.raise_for_status()
+
+        # Пользователи сначала открывают Mini App (создание пользователя),
+        # затем одновременно переходят по ссылке-приглашению
+        headers_by_user = {telegram_id: init_data_headers(telegram_id) for telegram_id in range(1000, 1000 + joins)}
+        for headers in headers_by_user.values():
+            (await client.get("/api/users/me", headers=headers)).raise_for_status()
+
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+        statuses = Counter()
+        statements = Counter()
+        budget_errors = []
+
+        async def join(telegram_id: int, budget: int, label: str) -> None:
+            headers = headers_by_user[telegram_id]
+            async with semaphore:
+                started = time.perf_counter()
+                # Запросы считаются в задаче вступления: ASGITransport вызывает приложение в ней же
+                with track_queries(f"{label} {telegram_id}") as stats:
+                    r = await client.post(
+                        "/api/groups/join", json={"invite_code": group["invite_code"]}, headers=headers
+                    )
+                latencies.append(time.perf_counter() - started)
+                statuses[r.status_code] += 1
+                statements[stats.statements] += 1
+                try:
+                    stats.assert_budget(budget, max_repeats=1)
+                except AssertionError as e:
+                    budget_errors.append(str(e))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            join(telegram_id, JOIN_STATEMENT_BUDGET, "join") for telegram_id in headers_by_user
+        ))
+        elapsed = time.perf_counter() - started
+        join_statements = dict(sorted(statements.items()))
+
+        # Повторный тап уже вступившего: только чтение
+        statements.clear()
+        await asyncio.gather(*(join(telegram_id, 1, "rejoin") for telegram_id in list(headers_by_user)[:20]))
+        rejoin_statements = dict(sorted(statements.items()))
+
+    print(f"joins: {joins}, concurrency: {concurrency}, elapsed: {elapsed:.2f}s, "
+          f"throughput: {joins / elapsed:.1f} joins/s")
+    print(f"latency ms: p50={percentile(latencies, 0.5) * 1000:.1f} "
+          f"p95={percentile(latencies, 0.95) * 1000:.1f} "
+          f"p99={percentile(latencies, 0.99) * 1000:.1f} "
+          f"mean={statistics.mean(latencies) * 1000:.1f}")
+    print(f"statuses: {dict(statuses)}")
+    print(f"statements per join: {join_statements} (budget {JOIN_STATEMENT_BUDGET}), "
+          f"per repeated join: {rejoin_statements}")
+
+    failures = []
+    if set(statuses) != {200}:
+        failures.append(f"unexpected statuses {dict(statuses)}")
+    failures.extend(budget_errors[:5])
+
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(
+            select(JuzAssignment.user_id, func.count(), func.count(func.distinct(JuzAssignment.juz_number)))
+            .where(JuzAssignment.hatm_id == hatm["id"])
+            .group_by(JuzAssignment.user_id)
+        )).all()
+        total_rows = sum(count for _, count, _ in rows)
+        distinct_numbers = await db.scalar(
+            select(func.count(func.distinct(JuzAssignment.juz_number)))
+            .where(JuzAssignment.hatm_id == hatm["id"])
+        )
+        mismatches = await HatmService(db).verify_counters([hatm["id"]])
+    await close_db()
+
+    owners = {user_id: count for user_id, count, _ in rows if user_id is not None}
+    expected_owners = min(participants, joins + 1)
+    # Слоты заполняются по порядку: первые remainder слотов получают на джуз больше
+    base, remainder = divmod(30, participants)
+    expected_sizes = [base + (1 if slot < remainder else 0) for slot in range(expected_owners)]
+
+    if total_rows != 30 or distinct_numbers != 30:
+        failures.append(f"expected 30 distinct juzs, got {total_rows} rows / {distinct_numbers} numbers")
+    if len(owners) != expected_owners:
+        failures.append(f"expected {expected_owners} participants with juzs, got {len(owners)}")
+    if sorted(owners.values()) != sorted(expected_sizes):
+        failures.append(f"portion sizes {sorted(owners.values())} != {sorted(expected_sizes)}")
+    if mismatches:
+        failures.append(f"counter mismatches: {mismatches}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print(f"OK: {len(owners)} participants, 30 juzs, counters consistent")
+    return not failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--joins", type=int, default=300, help="Сколько пользователей вступает")
+    parser.add_argument("--participants", type=int, default=30, help="participants_count хатма (1-30)")
+    parser.add_argument("--concurrency", type=int, default=300, help="Одновременных запросов")
+    args = parser.parse_args()
+
+    configure_environment("join_storm")
+
+    ok = asyncio.run(run(args.joins, args.participants, args.concurrency))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
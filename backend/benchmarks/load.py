@@ -0,0 +1,239 @@
+"""
+Нагрузочный тест горячих эндпоинтов API на сгенерированных данных.
+
+База заполняется benchmarks.seed, затем для каждого сценария выполняется
+заданное число запросов с ограниченной параллельностью (приложение
+вызывается в процессе через ASGI, без сети). Для каждого сценария
+печатаются p50/p95/p99, пропускная способность, число SQL-запросов
+и время в БД на HTTP-запрос (app.query_stats).
+
+Запуск из каталога backend:
+    python -m benchmarks.load --requests 2000 --concurrency 50
+    python -m benchmarks.load --scenario progress --scenario complete --json result.json
+    python -m benchmarks.load --baseline result.json   # код возврата 1 при регрессии
+    SQLITE_PROFILE=legacy python -m benchmarks.load --scenario mixed   # см. benchmarks.sqlite_profile
+По умолчанию используется временная SQLite база; для PostgreSQL задайте
+DATABASE_URL (база должна быть пустой).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from benchmarks.common import configure_environment, init_data_headers, percentile
+from benchmarks.seed import Dataset, add_arguments as add_seed_arguments, seed_database
+
+
+@dataclass
+class Call:
+    method: str
+    path: str
+    telegram_id: int
+    json: Optional[dict] = None
+
+
+def _member_call(dataset: Dataset, rng: random.Random, path: Callable[[int], str]) -> Call:
+    group_id = rng.choice(list(dataset.members))
+    return Call("GET", path(group_id), rng.choice(dataset.members[group_id]))
+
+
+def plan_groups(dataset: Dataset, rng: random.Random, count: int) -> List[Call]:
+    return [_member_call(dataset, rng, lambda group_id: "/api/groups") for _ in range(count)]
+
+
+def plan_group(dataset: Dataset, rng: random.Random, count: int) -> List[Call]:
+    return [_member_call(dataset, rng, lambda group_id: f"/api/groups/{group_id}") for _ in range(count)]
+
+
+def plan_progress(dataset: Dataset, rng: random.Random, count: int) -> List[Call]:
+    return [
+        _member_call(dataset, rng, lambda group_id: f"/api/hatms/{dataset.active_hatms[group_id]}/progress")
+        for _ in range(count)
+    ]
+
+
+def plan_complete(dataset: Dataset, rng: random.Random, count: int) -> List[Call]:
+    # Каждый джуз отмечается один раз: запросов не больше, чем непрочитанных джузов,
+    # и взятые джузы не достаются следующим сценариям
+    juzs = rng.sample(dataset.pending_juzs, min(count, len(dataset.pending_juzs)))
+    taken = set(juzs)
+    dataset.pending_juzs = [juz for juz in dataset.pending_juzs if juz not in taken]
+    return [Call("POST", f"/api/juzs/{juz_id}/complete", telegram_id) for telegram_id, juz_id in juzs]
+
+
+def plan_mixed(dataset: Dataset, rng: random.Random, count: int) -> List[Call]:
+    # Чтение и запись одновременно: на каждую отметку джуза - четыре чтения прогресса
+    calls = plan_complete(dataset, rng, count // 5)
+    calls += plan_progress(dataset, rng, count - len(calls))
+    rng.shuffle(calls)
+    return calls
+
+
+def plan_join(dataset: Dataset, rng: random.Random, count: int) -> List[Call]:
+    # Каждый пользователь без групп вступает в одну случайную группу
+    joiners = rng.sample(dataset.outsiders, min(count, len(dataset.outsiders)))
+    return [
+        Call("POST", "/api/groups/join", telegram_id,
+             {"invite_code": dataset.invite_codes[rng.choice(list(dataset.invite_codes))]})
+        for telegram_id in joiners
+    ]
+
+
+# Порядок важен: сценарии с записью идут после чтения и меняют данные
+SCENARIOS: Dict[str, Callable[[Dataset, random.Random, int], List[Call]]] = {
+    "groups": plan_groups,
+    "group": plan_group,
+    "progress": plan_progress,
+    "complete": plan_complete,
+    "mixed": plan_mixed,
+    "join": plan_join,
+}
+
+
+async def run_scenario(client, calls: List[Call], concurrency: int, headers: Dict[int, dict]) -> dict:
+    from app.query_stats import track_queries
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    statements: List[int] = []
+    db_times: List[float] = []
+    statuses: Counter = Counter()
+
+    async def execute(call: Call) -> None:
+        async with semaphore:
+            # ASGITransport вызывает приложение в этой же задаче - запросы попадают в трекер
+            with track_queries() as stats:
+                started = time.perf_counter()
+                response = await client.request(
+                    call.method, call.path, json=call.json, headers=headers[call.telegram_id]
+                )
+                latencies.append(time.perf_counter() - started)
+            statements.append(stats.statements)
+            db_times.append(stats.db_time)
+            statuses[response.status_code] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(execute(call) for call in calls))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(calls),
+        "errors": sum(count for status, count in statuses.items() if status >= 400),
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "throughput": len(calls) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "sql_mean": statistics.mean(statements),
+        "sql_max": max(statements),
+        "db_ms": statistics.mean(db_times) * 1000,
+    }
+
+
+def print_report(results: Dict[str, dict]) -> None:
+    print(f"{'scenario':<10} {'requests':>8} {'errors':>6} {'req/s':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'sql/req':>8} {'sql max':>7} {'db ms':>7}")
+    for name, r in results.items():
+        print(f"{name:<10} {r['requests']:>8} {r['errors']:>6} {r['throughput']:>8.1f} "
+              f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['sql_mean']:>8.2f} {r['sql_max']:>7} {r['db_ms']:>7.1f}")
+    for name, r in results.items():
+        if r["errors"]:
+            print(f"{name}: statuses {r['statuses']}")
+
+
+def compare_with_baseline(results: Dict[str, dict], baseline: Dict[str, dict], max_slowdown: float) -> List[str]:
+    """
+    Регрессия: выросло число SQL-запросов на HTTP-запрос (оно детерминировано)
+    или p95 вырос больше чем в (1 + max_slowdown) раз.
+    """
+    regressions = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if r["sql_mean"] > base["sql_mean"] + 0.05:
+            regressions.append(f"{name}: sql/req {base['sql_mean']:.2f} -> {r['sql_mean']:.2f}")
+        if r["p95_ms"] > base["p95_ms"] * (1 + max_slowdown):
+            regressions.append(f"{name}: p95 {base['p95_ms']:.1f}ms -> {r['p95_ms']:.1f}ms")
+        if r["errors"] > base["errors"]:
+            regressions.append(f"{name}: errors {base['errors']} -> {r['errors']}")
+    return regressions
+
+
+async def run(args) -> Dict[str, dict]:
+    import httpx
+
+    from app.database import close_db
+    from app.main import app
+
+    # Лог каждого запроса заглушил бы отчёт
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    started = time.perf_counter()
+    dataset = await seed_database(args)
+    print(f"seeded {args.users} users, {len(dataset.members)} groups, {len(dataset.active_hatms)} active hatms "
+          f"in {time.perf_counter() - started:.1f}s")
+
+    rng = random.Random(args.seed)
+    # Заголовки подписываются заранее: подпись - работа клиента, а не сервера
+    telegram_ids = {telegram_id for members in dataset.members.values() for telegram_id in members}
+    headers = {telegram_id: init_data_headers(telegram_id) for telegram_id in telegram_ids | set(dataset.outsiders)}
+
+    results = {}
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        for name in args.scenarios or list(SCENARIOS):
+            calls = SCENARIOS[name](dataset, rng, args.requests)
+            if not calls:
+                print(f"{name}: nothing to request, skipped")
+                continue
+            if args.warmup and SCENARIOS[name] in (plan_groups, plan_group, plan_progress):
+                await run_scenario(client, SCENARIOS[name](dataset, rng, args.warmup), args.concurrency, headers)
+            results[name] = await run_scenario(client, calls, args.concurrency, headers)
+
+    await close_db()
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_seed_arguments(parser)
+    parser.add_argument("--requests", type=int, default=1000, help="Запросов на сценарий")
+    parser.add_argument("--concurrency", type=int, default=50, help="Одновременных запросов")
+    parser.add_argument("--warmup", type=int, default=50, help="Прогревочных запросов для сценариев чтения")
+    parser.add_argument("--scenario", action="append", dest="scenarios", choices=list(SCENARIOS),
+                        help="Запустить только этот сценарий (можно несколько)")
+    parser.add_argument("--json", dest="json_path", help="Сохранить результаты в JSON")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--max-slowdown", type=float, default=0.5,
+                        help="Допустимый рост p95 относительно baseline (доля)")
+    args = parser.parse_args()
+    configure_environment("load")
+
+    results = asyncio.run(run(args))
+    print_report(results)
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_with_baseline(results, json.load(f), args.max_slowdown)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
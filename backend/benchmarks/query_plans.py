@@ -0,0 +1,330 @@
+"""
+Аудит индексов по планам запросов.
+
+На сгенерированных данных (benchmarks.seed) выполняется типичная нагрузка:
+HTTP-сценарии benchmarks.load и остальные маршруты API, вступление в хатм
+с нераспределёнными джузами, запросы бота и итерации фоновых задач. Каждый
+различный SQL-запрос (с точностью до параметров) перехватывается, для него
+снимается план (EXPLAIN QUERY PLAN / EXPLAIN) с теми же параметрами.
+
+Отчёт: план каждого запроса, полные сканирования таблиц, использованные
+индексы, избыточные индексы (дублируют первичный ключ или являются префиксом
+другого индекса - только замедляют запись) и индексы, не понадобившиеся нагрузке.
+
+С --check код возврата 1, если запрос сканирует таблицу целиком, ожидаемый
+индекс (EXPECTED_INDEXES) не используется или в схеме есть избыточные индексы -
+проверка регрессий планов перед деплоем (та же проверка на небольших данных -
+tests/test_query_plans.py).
+
+Запуск из каталога backend:
+    python -m benchmarks.query_plans
+    python -m benchmarks.query_plans --check --quiet
+По умолчанию используется временная SQLite база; для PostgreSQL задайте
+DATABASE_URL (база должна быть пустой, планы снимаются после ANALYZE).
+"""
+import argparse
+import asyncio
+import logging
+import random
+import re
+import sys
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from benchmarks.common import configure_environment, init_data_headers
+from benchmarks.seed import add_arguments as add_seed_arguments, seed_database
+
+# Таблицы, которые растут вместе с числом пользователей и хатмов: их полное сканирование - регрессия
+AUDITED_TABLES = {"users", "groups", "group_members", "hatms", "juz_assignments", "notification_outbox"}
+
+# Запрос (по фрагменту SQL) -> индекс, который он обязан использовать
+EXPECTED_INDEXES = {
+    # Пул нераспределённых джузов при вступлении в хатм: (hatm_id=? AND user_id IS NULL)
+    "juz_assignments.user_id IS NULL": "idx_juz_hatm_user",
+    # Просроченные хатмы
+    "hatms.ends_at < ?": "idx_hatm_status_ends",
+    # Прогресс хатма: джузы по порядку номеров
+    "WHERE juz_assignments.hatm_id = ? ORDER BY juz_assignments.juz_number": "uq_juz_hatm_number",
+    # Членство в группе: проверка доступа и вступление
+    "group_members.group_id = ? AND group_members.user_id = ?": "uq_group_member_group_user",
+    "group_members.group_id = groups.id AND group_members.user_id = ?": "uq_group_member_group_user",
+    # Outbox: зависшие в PROCESSING
+    "notification_outbox.claimed_at < ?": "idx_outbox_status_claimed",
+}
+
+_SQLITE_INDEX_RE = re.compile(r"USING (?:COVERING )?INDEX (\w+)")
+_SQLITE_SCAN_RE = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+_PG_INDEX_RE = re.compile(r"(?:Index Scan|Index Only Scan|Bitmap Index Scan)(?: Backward)? (?:using|on) (\w+)")
+_PG_SCAN_RE = re.compile(r"Seq Scan on (\w+)")
+
+
+@dataclass
+class CapturedQuery:
+    statement: str
+    parameters: object
+    count: int = 0
+    plan: List[str] = field(default_factory=list)
+    indexes: Set[str] = field(default_factory=set)
+    full_scans: Set[str] = field(default_factory=set)
+
+
+@dataclass
+class IndexInfo:
+    table: str
+    name: str
+    columns: Tuple[str, ...]
+    unique: bool
+    partial: bool
+
+
+@contextmanager
+def capture_statements(engine) -> Iterator[Dict[str, CapturedQuery]]:
+    """Перехватывать запросы движка внутри блока: форма запроса -> первый экземпляр с параметрами"""
+    from sqlalchemy import event
+
+    from app.query_stats import statement_shape
+
+    captured: Dict[str, CapturedQuery] = {}
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if executemany or not statement.lstrip().upper().startswith(("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")):
+            return
+        query = captured.setdefault(statement_shape(statement), CapturedQuery(statement, parameters))
+        query.count += 1
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        yield captured
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+
+async def run_workload(dataset, rng: random.Random, requests: int) -> None:
+    """Все пути кода, которые обращаются к базе: API, бот, фоновые задачи"""
+    import httpx
+
+    from app.database import AsyncSessionLocal, unit_of_work
+    from app.main import app
+    from app.services.juz_service import JuzService
+    from app.services.outbox_service import OutboxService
+    from app.services.user_service import UserService
+    from app.jobs.expiry_sweeper import ExpirySweeper
+    from app.jobs.reminder_scheduler import ReminderScheduler
+    from benchmarks.load import SCENARIOS, run_scenario
+
+    telegram_ids = {telegram_id for members in dataset.members.values() for telegram_id in members}
+    headers = {telegram_id: init_data_headers(telegram_id) for telegram_id in telegram_ids | set(dataset.outsiders)}
+    group_id = rng.choice(list(dataset.members))
+    member = dataset.members[group_id][0]
+    hatm_id = dataset.active_hatms[group_id]
+
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://plans", timeout=60) as client:
+        for name, plan in SCENARIOS.items():
+            await run_scenario(client, plan(dataset, rng, requests), 1, headers)
+
+        async def request(method: str, path: str, telegram_id: int, json: Optional[dict] = None):
+            response = await client.request(method, path, json=json, headers=headers[telegram_id])
+            if response.status_code >= 400:
+                print(f"{method} {path}: {response.status_code} {response.text[:200]}")
+            return response
+
+        async def call(method: str, path: str, telegram_id: int, json: Optional[dict] = None) -> dict:
+            response = await request(method, path, telegram_id, json)
+            return response.json() if response.content else {}
+
+        # Чтение: профиль, история, долги, группа, участники, хатмы
+        page = await call("GET", "/api/users/me/juzs?limit=5", member)
+        if page.get("next_cursor"):
+            await call("GET", f"/api/users/me/juzs?limit=5&cursor={page['next_cursor']}", member)
+        await call("GET", "/api/users/me", member)
+        await call("GET", "/api/users/me/debts", member)
+        await call("GET", f"/api/groups/{group_id}/members", member)
+        hatms = await request("GET", f"/api/groups/{group_id}/hatms?limit=1", member)
+        if hatms.headers.get("X-Next-Cursor"):
+            await call("GET", f"/api/groups/{group_id}/hatms?limit=1&cursor={hatms.headers['X-Next-Cursor']}", member)
+        await call("GET", f"/api/hatms/{hatm_id}", member)
+
+        # Новый хатм со свободными слотами: вступающие получают джузы из нераспределённого пула
+        creator, *joiners = dataset.outsiders[-4:]
+        group = await call("POST", "/api/groups", creator, {"name": "Plans"})
+        hatm = await call("POST", f"/api/groups/{group['id']}/hatms", creator,
+                          {"duration_days": 7, "participants_count": 30})
+        await call("POST", f"/api/hatms/{hatm['id']}/start", creator)
+        for telegram_id in joiners:
+            await call("POST", "/api/groups/join", telegram_id, {"invite_code": group["invite_code"]})
+        await call("POST", f"/api/hatms/{hatm['id']}/complete", creator)
+        await call("DELETE", f"/api/groups/{group['id']}/leave", joiners[-1])
+
+    # Команды бота
+    async with AsyncSessionLocal() as db:
+        user = await UserService(db).get_by_telegram_id(member)
+        juz_service = JuzService(db)
+        juzs = await juz_service.get_user_active_juzs(user) + await juz_service.get_user_debts(user)
+        await juz_service.get_hatm_info({juz.hatm_id for juz in juzs})
+
+    # Фоновые задачи: просроченные хатмы, напоминания, outbox
+    await ExpirySweeper().sweep_once()
+    await ReminderScheduler().schedule_once()
+    async with unit_of_work() as db:
+        outbox = OutboxService(db)
+        batch = await outbox.claim_batch(50, timedelta(minutes=5))
+        ids = [outbox_id for outbox_id, *_ in batch]
+        await outbox.mark_sent(ids[:len(ids) // 2])
+        await outbox.mark_failed(ids[len(ids) // 2:], "query plans")
+        await outbox.purge_sent(timedelta(days=7))
+
+
+async def explain(captured: Dict[str, CapturedQuery]) -> None:
+    """План каждого перехваченного запроса с его параметрами"""
+    from app.database import async_engine
+
+    sqlite = async_engine.dialect.name == "sqlite"
+    async with async_engine.connect() as conn:
+        await conn.exec_driver_sql("ANALYZE")
+        for query in captured.values():
+            prefix = "EXPLAIN QUERY PLAN " if sqlite else "EXPLAIN "
+            rows = (await conn.exec_driver_sql(prefix + query.statement, query.parameters)).all()
+            # SQLite: (id, parent, notused, detail); PostgreSQL: одна строка текста плана
+            query.plan = [row[-1] for row in rows]
+            for line in query.plan:
+                if sqlite:
+                    query.indexes.update(_SQLITE_INDEX_RE.findall(line))
+                    scan = _SQLITE_SCAN_RE.match(line.strip())
+                    if scan:
+                        query.full_scans.add(scan.group(1))
+                else:
+                    query.indexes.update(_PG_INDEX_RE.findall(line))
+                    query.full_scans.update(_PG_SCAN_RE.findall(line))
+        await conn.rollback()
+
+
+def index_inventory() -> List[IndexInfo]:
+    """Индексы audited-таблиц по данным самой базы (не моделей)"""
+    from sqlalchemy import inspect
+
+    from app.database import engine
+
+    inspector = inspect(engine)
+    indexes = []
+    for table in sorted(AUDITED_TABLES):
+        for index in inspector.get_indexes(table):
+            options = index.get("dialect_options", {})
+            indexes.append(IndexInfo(
+                table=table,
+                name=index["name"],
+                columns=tuple(index["column_names"]),
+                unique=bool(index["unique"]),
+                partial=options.get("sqlite_where") is not None or options.get("postgresql_where") is not None,
+            ))
+        primary_key = tuple(inspector.get_pk_constraint(table)["constrained_columns"])
+        indexes.append(IndexInfo(table, f"{table}_pkey", primary_key, unique=True, partial=False))
+    return indexes
+
+
+def redundant_indexes(indexes: List[IndexInfo]) -> List[Tuple[IndexInfo, IndexInfo]]:
+    """
+    Неуникальный индекс избыточен, если его колонки - префикс другого полного индекса
+    той же таблицы (в том числе первичного ключа): поиск по нему обслужит более длинный индекс
+    """
+    redundant = []
+    for index in indexes:
+        if index.unique or index.partial:
+            continue
+        for other in indexes:
+            if other is index or other.table != index.table or other.partial:
+                continue
+            if other.columns[:len(index.columns)] == index.columns and (
+                len(other.columns) > len(index.columns) or other.unique or other.name < index.name
+            ):
+                redundant.append((index, other))
+                break
+    return redundant
+
+
+def plan_problems(captured: Dict[str, CapturedQuery], indexes: List[IndexInfo]) -> List[str]:
+    """
+    Регрессии планов: полное сканирование audited-таблицы, ожидаемый индекс
+    (EXPECTED_INDEXES) не использован или не покрыт нагрузкой, избыточный индекс в схеме
+    """
+    problems = []
+    for shape, query in captured.items():
+        for table in sorted(query.full_scans & AUDITED_TABLES):
+            problems.append(f"full scan of {table}: {shape[:200]}")
+        for fragment, index in EXPECTED_INDEXES.items():
+            if fragment in shape and index not in query.indexes:
+                problems.append(f"{index} not used: {shape[:200]}")
+    for fragment, index in EXPECTED_INDEXES.items():
+        if not any(fragment in shape for shape in captured):
+            problems.append(f"no query with '{fragment}' captured: the workload does not cover it")
+    for index, covering in redundant_indexes(indexes):
+        problems.append(f"redundant index {index.name} ({', '.join(index.columns)}): covered by {covering.name}")
+    return problems
+
+
+def print_report(captured: Dict[str, CapturedQuery], indexes: List[IndexInfo], quiet: bool) -> List[str]:
+    if not quiet:
+        for shape, query in captured.items():
+            print(f"-- x{query.count} {shape}")
+            for line in query.plan:
+                print(f"     {line}")
+            print()
+
+    used = set().union(*(query.indexes for query in captured.values()))
+    by_table = defaultdict(list)
+    for index in indexes:
+        by_table[index.table].append(index)
+
+    print(f"{len(captured)} distinct statements, {sum(q.count for q in captured.values())} executions")
+    print(f"\n{'table':<20} {'index':<36} {'columns':<36} {'used':>4}")
+    for table, table_indexes in sorted(by_table.items()):
+        for index in table_indexes:
+            flags = ("unique " if index.unique else "") + ("partial" if index.partial else "")
+            print(f"{table:<20} {index.name:<36} {', '.join(index.columns):<36} "
+                  f"{'yes' if index.name in used else '-':>4} {flags}")
+
+    unused = [i.name for i in indexes if not i.unique and i.name not in used]
+    if unused:
+        print(f"\nnot used by the workload (review before dropping): {', '.join(unused)}")
+
+    problems = plan_problems(captured, indexes)
+    print()
+    for problem in problems:
+        print(f"PROBLEM: {problem}")
+    if not problems:
+        print("No full scans, expected indexes used, no redundant indexes")
+    return problems
+
+
+async def run(args) -> List[str]:
+    from app.database import async_engine, close_db
+
+    # Лог каждого запроса заглушил бы отчёт
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    dataset = await seed_database(args)
+    with capture_statements(async_engine.sync_engine) as captured:
+        await run_workload(dataset, random.Random(args.seed), args.requests)
+    await explain(captured)
+    await close_db()
+    return print_report(captured, index_inventory(), args.quiet)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_seed_arguments(parser)
+    parser.add_argument("--requests", type=int, default=20, help="Запросов на сценарий benchmarks.load")
+    parser.add_argument("--check", action="store_true", help="Код возврата 1 при найденных проблемах")
+    parser.add_argument("--quiet", action="store_true", help="Не печатать планы запросов")
+    args = parser.parse_args()
+    configure_environment("query_plans")
+
+    problems = asyncio.run(run(args))
+    return 1 if args.check and problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
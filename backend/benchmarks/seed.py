@@ -0,0 +1,202 @@
+"""
+Генератор реалистичных данных для бенчмарков: пользователи, группы с
+участниками, история завершённых хатмов (с долгами) и один активный хатм
+на группу с частично прочитанными джузами. Счётчики хатмов заполняются
+по juz_assignments, как это делает миграция.
+
+Запуск из каталога backend (база без ранее сгенерированных данных):
+    python -m benchmarks.seed --users 2000 --groups 200 --members 12
+Без DATABASE_URL создаётся временная SQLite база, путь печатается.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+from benchmarks.common import configure_environment
+
+# Синтетические telegram_id начинаются отсюда, чтобы не пересекаться с реальными
+TELEGRAM_ID_BASE = 10_000_000
+
+
+@dataclass
+class Dataset:
+    """Что нужно нагрузочному тесту, чтобы строить корректные запросы"""
+    members: Dict[int, List[int]] = field(default_factory=dict)      # group_id -> telegram_id участников
+    invite_codes: Dict[int, str] = field(default_factory=dict)       # group_id -> invite_code
+    active_hatms: Dict[int, int] = field(default_factory=dict)       # group_id -> id активного хатма
+    pending_juzs: List[Tuple[int, int]] = field(default_factory=list)  # (telegram_id, juz_id) непрочитанных
+    outsiders: List[int] = field(default_factory=list)               # telegram_id без групп (для join)
+
+
+async def seed(
+    db,
+    users: int,
+    groups: int,
+    members_per_group: int,
+    history_hatms: int = 2,
+    completed_share: float = 0.3,
+    random_seed: int = 42
+) -> Dataset:
+    """
+    Заполнить базу синтетическими данными (telegram_id от TELEGRAM_ID_BASE), в том числе
+    базу тестов с другими строками. Все вставки - пачками через executemany
+    """
+    from sqlalchemy import select, insert, update
+
+    from app.models.models import User, Group, GroupMember, Hatm, HatmStatus, JuzAssignment, JuzStatus
+    from app.services.hatm_service import hatm_counter_expressions
+
+    if await db.scalar(select(User.id).where(User.telegram_id >= TELEGRAM_ID_BASE).limit(1)):
+        raise SystemExit("Database is already seeded: seed needs a database without synthetic users")
+
+    # Core-вставки пачками (insertmanyvalues). RETURNING без sort_by_parameter_order:
+    # на SQLite сортировка отключает пачки, поэтому строки сопоставляются по ключам
+    conn = await db.connection()
+    users_table, groups_table, hatms_table, juzs_table = (
+        User.__table__, Group.__table__, Hatm.__table__, JuzAssignment.__table__
+    )
+
+    rng = random.Random(random_seed)
+    now = datetime.utcnow()
+    members_per_group = min(members_per_group, users)
+
+    user_rows = (await conn.execute(
+        insert(users_table).returning(users_table.c.id, users_table.c.telegram_id),
+        [
+            # Имена совпадают с подписанными init data, иначе первый запрос обновлял бы профиль
+            {"telegram_id": TELEGRAM_ID_BASE + i, "username": f"user{TELEGRAM_ID_BASE + i}",
+             "first_name": f"user{TELEGRAM_ID_BASE + i}", "created_at": now}
+            for i in range(users)
+        ]
+    )).all()
+    telegram_by_user = {user_id: telegram_id for user_id, telegram_id in user_rows}
+    user_ids = [user_id for user_id, _ in sorted(user_rows, key=lambda row: row[1])]
+
+    # Последняя десятая часть пользователей не состоит в группах - они вступают во время теста
+    insiders = user_ids[:max(members_per_group, users - users // 10)]
+    group_members = [rng.sample(insiders, members_per_group) for _ in range(groups)]
+
+    group_by_code = dict((await conn.execute(
+        insert(groups_table).returning(groups_table.c.invite_code, groups_table.c.id),
+        [
+            {"name": f"Group {i}", "invite_code": f"B{i:07d}", "creator_id": members[0],
+             "hatm_sequence": history_hatms + 1, "created_at": now}
+            for i, members in enumerate(group_members)
+        ]
+    )).all())
+    group_ids = [group_by_code[f"B{i:07d}"] for i in range(groups)]
+
+    await conn.execute(insert(GroupMember.__table__), [
+        {"group_id": group_id, "user_id": user_id, "joined_at": now}
+        for group_id, members in zip(group_ids, group_members)
+        for user_id in members
+    ])
+
+    hatm_rows = []
+    for group_id, members in zip(group_ids, group_members):
+        participants = min(len(members), 30)
+        for index in range(history_hatms):
+            started_at = now - timedelta(days=30 * (history_hatms - index))
+            hatm_rows.append({
+                "group_id": group_id, "sequence_number": index + 1, "duration_days": 7,
+                "participants_count": participants, "status": HatmStatus.COMPLETED, "started_at": started_at,
+                "ends_at": started_at + timedelta(days=7), "created_at": started_at
+            })
+        started_at = now - timedelta(days=2)
+        hatm_rows.append({
+            "group_id": group_id, "sequence_number": history_hatms + 1, "duration_days": 7,
+            "participants_count": participants, "status": HatmStatus.ACTIVE, "started_at": started_at,
+            "ends_at": started_at + timedelta(days=7), "created_at": started_at
+        })
+    hatms = sorted((await conn.execute(
+        insert(hatms_table).returning(hatms_table.c.id, hatms_table.c.group_id, hatms_table.c.status),
+        hatm_rows
+    )).all())
+
+    members_by_group = dict(zip(group_ids, group_members))
+    juz_rows = []
+    for hatm_id, group_id, status in hatms:
+        participants = members_by_group[group_id][:30]
+        active = status == HatmStatus.ACTIVE
+        for juz_number in range(1, 31):
+            user_id = participants[(juz_number - 1) % len(participants)]
+            if active:
+                juz_status = JuzStatus.COMPLETED if rng.random() < completed_share else JuzStatus.PENDING
+            else:
+                # В истории большинство прочитано, часть осталась долгами
+                juz_status = JuzStatus.DEBT if rng.random() < 0.1 else JuzStatus.COMPLETED
+            juz_rows.append({
+                "hatm_id": hatm_id, "user_id": user_id, "juz_number": juz_number, "status": juz_status,
+                "completed_at": now if juz_status == JuzStatus.COMPLETED else None,
+                "is_debt": juz_status == JuzStatus.DEBT
+            })
+    juzs = (await conn.execute(
+        insert(juzs_table).returning(
+            juzs_table.c.id, juzs_table.c.hatm_id, juzs_table.c.user_id, juzs_table.c.status
+        ),
+        juz_rows
+    )).all()
+
+    await conn.execute(update(Hatm).values(**hatm_counter_expressions()))
+    await db.commit()
+
+    active_hatms = {group_id: hatm_id for hatm_id, group_id, status in hatms if status == HatmStatus.ACTIVE}
+    active_ids = set(active_hatms.values())
+    return Dataset(
+        members={
+            group_id: [telegram_by_user[user_id] for user_id in members]
+            for group_id, members in members_by_group.items()
+        },
+        invite_codes={group_id: code for code, group_id in group_by_code.items()},
+        active_hatms=active_hatms,
+        pending_juzs=[
+            (telegram_by_user[user_id], juz_id)
+            for juz_id, hatm_id, user_id, status in juzs
+            if hatm_id in active_ids and status == JuzStatus.PENDING
+        ],
+        outsiders=[telegram_by_user[user_id] for user_id in user_ids[len(insiders):]]
+    )
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--users", type=int, default=2000, help="Пользователей")
+    parser.add_argument("--groups", type=int, default=200, help="Групп")
+    parser.add_argument("--members", type=int, default=12, help="Участников в группе")
+    parser.add_argument("--history", type=int, default=2, help="Завершённых хатмов на группу")
+    parser.add_argument("--seed", type=int, default=42, help="Seed генератора случайных чисел")
+
+
+async def seed_database(args) -> Dataset:
+    from app.database import init_db, AsyncSessionLocal
+
+    init_db()
+    async with AsyncSessionLocal() as db:
+        return await seed(db, args.users, args.groups, args.members, args.history, random_seed=args.seed)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    args = parser.parse_args()
+    configure_environment("seed")
+
+    async def run():
+        from app.database import close_db
+
+        dataset = await seed_database(args)
+        await close_db()
+        return dataset
+
+    dataset = asyncio.run(run())
+    print(f"Seeded {os.environ['DATABASE_URL']}: {args.users} users, {len(dataset.members)} groups, "
+          f"{len(dataset.active_hatms)} active hatms, {len(dataset.pending_juzs)} pending juzs")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
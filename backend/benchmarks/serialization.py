@@ -0,0 +1,141 @@
+"""
+Микробенчмарк сериализации ответов горячих маршрутов.
+
+Сравнивает прежний путь (FastAPI: повторная валидация по response_model,
+jsonable-сериализация и stdlib json в JSONResponse) с тем же путём на orjson
+(default_response_class) и с PrebuiltJSONResponse (сериализация уже собранных
+схем без валидации), а также стоимость gzip на уровне 9
+(по умолчанию в Starlette) и GZIP_LEVEL. Заодно проверяется, что все пути
+дают одинаковый JSON.
+
+Запуск из каталога backend:
+    python -m benchmarks.serialization
+    python -m benchmarks.serialization --groups 50 --juzs 200 --number 5000
+"""
+import argparse
+import gzip
+import json
+import sys
+import timeit
+from datetime import datetime, timedelta
+from typing import Any, Callable, List
+
+from benchmarks.common import configure_environment
+
+
+def build_payloads(groups: int, juzs: int) -> dict:
+    """Типичные ответы get_my_groups, get_my_juzs и get_hatm_progress"""
+    from app.models.models import JuzStatus
+    from app.schemas.schemas import GroupResponse, HatmProgress, JuzResponse, UserJuzStats
+
+    now = datetime.utcnow()
+    statuses = [JuzStatus.COMPLETED, JuzStatus.PENDING, JuzStatus.DEBT]
+
+    def juz(i: int) -> JuzResponse:
+        status = statuses[i % 3]
+        return JuzResponse(
+            id=i, juz_number=i % 30 + 1, status=status, user_id=1000 + i % 30,
+            username=f"user{i % 30}", first_name=f"Имя {i % 30}",
+            completed_at=now - timedelta(minutes=i) if status == JuzStatus.COMPLETED else None,
+            is_debt=status == JuzStatus.DEBT, group_name="Группа", hatm_number=i // 30 + 1, group_id=7
+        )
+
+    return {
+        "get_my_groups": [
+            GroupResponse(
+                id=i, name=f"Группа {i}", invite_code=f"B{i:07d}", creator_id=1,
+                created_at=now, members_count=12, has_active_hatm=i % 2 == 0
+            )
+            for i in range(groups)
+        ],
+        "get_my_juzs": UserJuzStats(
+            total_assigned=juzs * 4, completed=juzs * 2, pending=juzs, debts=juzs,
+            juzs=[juz(i) for i in range(juzs)], next_cursor="WyIyMDI2LTAxLTAxIiwgMV0"
+        ),
+        "get_hatm_progress": HatmProgress(
+            completed_juzs=10, pending_juzs=15, debt_juzs=5, progress_percent=33.3,
+            juz_assignments=[juz(i) for i in range(30)]
+        ),
+    }
+
+
+def route_response_model(name: str) -> Any:
+    from app.schemas.schemas import GroupResponse, HatmProgress, UserJuzStats
+
+    return {
+        "get_my_groups": List[GroupResponse],
+        "get_my_juzs": UserJuzStats,
+        "get_hatm_progress": HatmProgress,
+    }[name]
+
+
+def fastapi_path(name: str, content: Any, response_class) -> Callable[[], bytes]:
+    """То, что делает FastAPI с возвращённым значением при response_model"""
+    import asyncio
+
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_response_field
+
+    field = create_response_field(name=f"Response_{name}", type_=route_response_model(name))
+    loop = asyncio.new_event_loop()
+
+    def render() -> bytes:
+        data = loop.run_until_complete(serialize_response(field=field, response_content=content))
+        return response_class(data).body
+
+    return render
+
+
+def prebuilt_path(content: Any) -> Callable[[], bytes]:
+    from app.api.responses import PrebuiltJSONResponse
+
+    return lambda: PrebuiltJSONResponse(content).body
+
+
+def measure(function: Callable[[], Any], number: int) -> float:
+    """Лучшее из трёх повторов, микросекунды на вызов"""
+    return min(timeit.repeat(function, number=number, repeat=3)) / number * 1e6
+
+
+def run(args) -> bool:
+    from fastapi.responses import JSONResponse, ORJSONResponse
+
+    from app.main import GZIP_LEVEL
+
+    payloads = build_payloads(args.groups, args.juzs)
+    identical = True
+
+    print(f"{'route':<18} {'bytes':>7} {'before us':>10} {'orjson us':>10} {'after us':>9} {'speedup':>8} "
+          f"{'gzip9 us':>9} {f'gzip{GZIP_LEVEL} us':>9} {'gzip9 B':>8} {f'gzip{GZIP_LEVEL} B':>8}")
+    for name, content in payloads.items():
+        before = fastapi_path(name, content, JSONResponse)
+        with_orjson = fastapi_path(name, content, ORJSONResponse)
+        after = prebuilt_path(content)
+        if not json.loads(before()) == json.loads(with_orjson()) == json.loads(after()):
+            identical = False
+            print(f"{name}: JSON differs from the response_model output")
+
+        body = after()
+        before_us, after_us = measure(before, args.number), measure(after, args.number)
+        orjson_us = measure(with_orjson, args.number)
+        gzip9_us = measure(lambda: gzip.compress(body, compresslevel=9), args.number)
+        gzip_level_us = measure(lambda: gzip.compress(body, compresslevel=GZIP_LEVEL), args.number)
+        print(f"{name:<18} {len(body):>7} {before_us:>10.1f} {orjson_us:>10.1f} {after_us:>9.1f} "
+              f"{before_us / after_us:>7.1f}x "
+              f"{gzip9_us:>9.1f} {gzip_level_us:>9.1f} {len(gzip.compress(body, 9)):>8} "
+              f"{len(gzip.compress(body, GZIP_LEVEL)):>8}")
+    return identical
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--groups", type=int, default=20, help="Групп в ответе get_my_groups")
+    parser.add_argument("--juzs", type=int, default=50, help="Джузов на странице get_my_juzs")
+    parser.add_argument("--number", type=int, default=2000, help="Вызовов на замер")
+    args = parser.parse_args()
+    configure_environment("serialization")
+    return 0 if run(args) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""
+Сравнение профилей SQLite под одновременным чтением и записью.
+
+Для каждого профиля (SQLITE_PROFILE=legacy - одно общее соединение, журнал
+отката и полный fsync; production - WAL, прагмы, пул и очередь писателя)
+в отдельном процессе на новой временной базе запускается benchmarks.load
+со сценариями чтения, записи и смешанной нагрузки. Печатаются req/s, p95,
+p99 и ошибки (например, 500 из-за "database is locked") по каждому профилю.
+
+Запуск из каталога backend:
+    python -m benchmarks.sqlite_profile
+    python -m benchmarks.sqlite_profile --requests 2000 --concurrency 100 --scenario mixed
+Код возврата 1, если в профиле production есть ошибки.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+PROFILES = ("legacy", "production")
+
+
+def run_profile(profile: str, args) -> dict:
+    """benchmarks.load в отдельном процессе: движок создаётся при импорте app.database"""
+    directory = tempfile.mkdtemp()
+    result_path = os.path.join(directory, "result.json")
+    command = [
+        sys.executable, "-m", "benchmarks.load",
+        "--requests", str(args.requests), "--concurrency", str(args.concurrency),
+        "--users", str(args.users), "--groups", str(args.groups), "--json", result_path,
+    ]
+    for scenario in args.scenarios:
+        command += ["--scenario", scenario]
+    env = dict(os.environ, SQLITE_PROFILE=profile, DATABASE_URL=f"sqlite:///{directory}/{profile}.db")
+    subprocess.run(command, env=env, check=True, stdout=subprocess.DEVNULL)
+    with open(result_path) as f:
+        return json.load(f)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000, help="Запросов на сценарий")
+    parser.add_argument("--concurrency", type=int, default=50, help="Одновременных запросов")
+    parser.add_argument("--users", type=int, default=2000, help="Пользователей")
+    parser.add_argument("--groups", type=int, default=200, help="Групп")
+    parser.add_argument("--scenario", action="append", dest="scenarios",
+                        help="Сценарий benchmarks.load (по умолчанию progress, complete и mixed)")
+    args = parser.parse_args()
+    args.scenarios = args.scenarios or ["progress", "complete", "mixed"]
+
+    results = {profile: run_profile(profile, args) for profile in PROFILES}
+
+    print(f"{'scenario':<10} {'profile':<11} {'req/s':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6}")
+    for scenario in args.scenarios:
+        for profile in PROFILES:
+            r = results[profile].get(scenario)
+            if r:
+                print(f"{scenario:<10} {profile:<11} {r['throughput']:>8.1f} {r['p95_ms']:>8.1f} "
+                      f"{r['p99_ms']:>8.1f} {r['errors']:>6}")
+    return 1 if any(r["errors"] for r in results["production"].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
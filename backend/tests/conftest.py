@@ -0,0 +1,30 @@
+"""
+Общая настройка тестов: окружение задаётся до импорта приложения
+(настройки читаются из переменных окружения при импорте модулей),
+база - временная SQLite со схемой последней версии.
+"""
+import os
+import tempfile
+
+from benchmarks.common import BOT_TOKEN
+
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/test.db"
+# Токен, которым benchmarks.common подписывает init data
+os.environ["BOT_TOKEN"] = BOT_TOKEN
+os.environ["DEV_MODE"] = "false"
+
+import pytest
+
+from app.database import close_db, init_db
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    init_db()
+
+
+@pytest.fixture(autouse=True)
+async def dispose_engine():
+    # Соединения пула привязаны к циклу событий теста
+    yield
+    await close_db()
@@ -0,0 +1,35 @@
+"""
+Данные для тестов: пользователи, группы и хатмы создаются через сервисы,
+каждый вызов - своя единица работы (как отдельный запрос API).
+"""
+from itertools import count
+from typing import List, Optional, Tuple
+
+from app.database import unit_of_work
+from app.models.models import Group, Hatm, User
+from app.schemas.schemas import GroupCreate, HatmCreate
+from app.services.group_service import GroupService
+from app.services.hatm_service import HatmService
+
+_telegram_ids = count(1)
+
+
+async def create_users(number: int) -> List[User]:
+    async with unit_of_work() as db:
+        users = [User(telegram_id=next(_telegram_ids), first_name="user") for _ in range(number)]
+        db.add_all(users)
+        await db.flush()
+    return users
+
+
+async def create_group(participants_count: Optional[int] = None) -> Tuple[Group, Optional[Hatm]]:
+    """Группа с создателем; при participants_count - с запущенным хатмом на столько участников"""
+    creator, = await create_users(1)
+    async with unit_of_work() as db:
+        group = await GroupService(db).create(creator, GroupCreate(name="Test"))
+        hatm = None
+        if participants_count is not None:
+            service = HatmService(db)
+            hatm = await service.create(group, HatmCreate(duration_days=7, participants_count=participants_count))
+            await service.start(hatm, [creator])
+    return group, hatm
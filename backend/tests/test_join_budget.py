@@ -0,0 +1,44 @@
+"""
+Бюджет SQL-запросов вступления в группу (JOIN_STATEMENT_BUDGET): вступление
+при активном хатме и без него, повторное вступление - один SELECT.
+"""
+from app.database import unit_of_work
+from app.query_stats import track_queries
+from app.services.group_service import GroupService, JOIN_STATEMENT_BUDGET
+from tests.factories import create_group, create_users
+
+
+async def tracked_join(user, invite_code: str):
+    async with unit_of_work() as db:
+        with track_queries("join") as stats:
+            result = await GroupService(db).join(user, invite_code)
+    assert result is not None
+    return stats
+
+
+async def test_join_with_active_hatm_fits_budget():
+    group, _ = await create_group(participants_count=30)
+    user, = await create_users(1)
+
+    stats = await tracked_join(user, group.invite_code)
+
+    stats.assert_budget(JOIN_STATEMENT_BUDGET, max_repeats=1)
+
+
+async def test_join_without_active_hatm_fits_budget():
+    group, _ = await create_group()
+    user, = await create_users(1)
+
+    stats = await tracked_join(user, group.invite_code)
+
+    stats.assert_budget(JOIN_STATEMENT_BUDGET, max_repeats=1)
+
+
+async def test_repeated_join_is_one_statement():
+    group, _ = await create_group(participants_count=30)
+    user, = await create_users(1)
+    await tracked_join(user, group.invite_code)
+
+    stats = await tracked_join(user, group.invite_code)
+
+    stats.assert_budget(1)
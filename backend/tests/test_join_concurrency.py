@@ -0,0 +1,65 @@
+"""
+Параллельное вступление сотен участников в группу с активным хатмом: слоты
+не переполняются, джуз не достаётся двоим, повторный тап не создаёт второго
+членства, счётчики хатма совпадают с juz_assignments, а весь шторм укладывается
+в щедрый бюджет времени (регрессия к блокировкам на каждое вступление или
+взаимоблокировка очереди писателя SQLite роняет тест, а не только бенчмарк).
+Подробный отчёт о пропускной способности - python -m benchmarks.join_storm.
+"""
+import asyncio
+import time
+
+from sqlalchemy import func, select
+
+from app.database import unit_of_work
+from app.models.models import GroupMember, JuzAssignment
+from app.services.group_service import GroupService
+from app.services.hatm_service import HatmService
+from tests.factories import create_group, create_users
+
+JOINS = 300
+# Повторных тапов тех же пользователей одновременно с первыми
+DOUBLE_TAPS = 100
+# Весь шторм, секунды: на порядок больше обычного времени, чтобы не зависеть от машины
+STORM_TIME_BUDGET = 30.0
+
+
+async def join(user, invite_code: str):
+    async with unit_of_work() as db:
+        return await GroupService(db).join(user, invite_code)
+
+
+async def test_concurrent_joins_assign_each_juz_once():
+    group, hatm = await create_group(participants_count=30)
+    users = await create_users(JOINS)
+
+    # Часть пользователей вступает дважды одновременно (двойной тап по ссылке)
+    started = time.perf_counter()
+    results = await asyncio.wait_for(
+        asyncio.gather(*(join(user, group.invite_code) for user in users + users[:DOUBLE_TAPS])),
+        timeout=STORM_TIME_BUDGET
+    )
+    elapsed = time.perf_counter() - started
+    assert all(result is not None for result in results)
+    assert elapsed < STORM_TIME_BUDGET
+
+    async with unit_of_work() as db:
+        juzs = (await db.execute(
+            select(JuzAssignment.juz_number, JuzAssignment.user_id).where(JuzAssignment.hatm_id == hatm.id)
+        )).all()
+        duplicate_members = (await db.execute(
+            select(GroupMember.user_id)
+            .where(GroupMember.group_id == group.id)
+            .group_by(GroupMember.user_id)
+            .having(func.count() > 1)
+        )).scalars().all()
+        members = await db.scalar(select(func.count()).where(GroupMember.group_id == group.id))
+        mismatches = await HatmService(db).verify_counters([hatm.id])
+
+    assert sorted(number for number, _ in juzs) == list(range(1, 31))
+    # 30 участников по одному джузу: создатель и первые 29 вступивших
+    assert len({user_id for _, user_id in juzs}) == 30
+    assert None not in {user_id for _, user_id in juzs}
+    assert duplicate_members == []
+    assert members == JOINS + 1
+    assert mismatches == []
@@ -0,0 +1,32 @@
+"""
+Шаги миграций на базе старой схемы: шаг выполняется на отдельной SQLite базе
+с таблицами в том виде, в каком они были до шага.
+"""
+from sqlalchemy import create_engine, text
+
+from app.migrations import add_hatm_counters
+
+
+def test_hatm_counters_backfilled_from_juz_assignments(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/legacy.db")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE hatms (id INTEGER PRIMARY KEY, group_id INTEGER, status VARCHAR(9))"))
+        conn.execute(text(
+            "CREATE TABLE juz_assignments (id INTEGER PRIMARY KEY, hatm_id INTEGER, user_id INTEGER, "
+            "juz_number INTEGER, status VARCHAR(9))"
+        ))
+        conn.execute(text("INSERT INTO hatms (id, group_id, status) VALUES (1, 1, 'ACTIVE'), (2, 1, 'PENDING')"))
+        conn.execute(text("""
+            INSERT INTO juz_assignments (hatm_id, user_id, juz_number, status) VALUES
+                (1, 10, 1, 'COMPLETED'), (1, 10, 2, 'PENDING'), (1, 11, 3, 'DEBT'),
+                (1, 11, 4, 'PENDING'), (1, NULL, 5, 'PENDING')
+        """))
+
+        add_hatm_counters(conn)
+
+        rows = conn.execute(text(
+            "SELECT id, completed_juzs, pending_juzs, debt_juzs, assigned_participants FROM hatms ORDER BY id"
+        )).all()
+    engine.dispose()
+
+    assert [tuple(row) for row in rows] == [(1, 1, 3, 1, 2), (2, 0, 0, 0, 0)]
@@ -0,0 +1,22 @@
+"""
+Регрессии планов запросов: на сгенерированных данных выполняется нагрузка
+benchmarks.query_plans (API, бот, фоновые задачи), для каждого запроса снимается
+EXPLAIN QUERY PLAN. Тест падает на полном сканировании таблицы, неиспользованном
+ожидаемом индексе (EXPECTED_INDEXES) и избыточном индексе в схеме.
+"""
+import random
+
+from app.database import AsyncSessionLocal, async_engine
+from benchmarks.query_plans import capture_statements, explain, index_inventory, plan_problems, run_workload
+from benchmarks.seed import seed
+
+
+async def test_hot_queries_use_indexes():
+    async with AsyncSessionLocal() as db:
+        dataset = await seed(db, users=300, groups=20, members_per_group=10)
+
+    with capture_statements(async_engine.sync_engine) as captured:
+        await run_workload(dataset, random.Random(42), requests=5)
+    await explain(captured)
+
+    assert plan_problems(captured, index_inventory()) == []
@@ -0,0 +1,59 @@
+"""
+Сверка версий хатмов для подписчиков SSE (VersionPoller): изменения других
+процессов дают resync, завершённая история группы не перечитывается.
+"""
+from app.database import unit_of_work
+from app.models.models import Group, Hatm
+from app.realtime import RESYNC_MESSAGE, EventHub, VersionPoller, group_topic
+from app.schemas.schemas import HatmCreate
+from app.services.hatm_service import HatmService
+from tests.factories import create_group
+
+
+async def create_hatm(group_id: int) -> int:
+    async with unit_of_work() as db:
+        group = await db.get(Group, group_id)
+        hatm = await HatmService(db).create(group, HatmCreate(duration_days=7, participants_count=30))
+    return hatm.id
+
+
+async def complete_hatm(hatm_id: int) -> None:
+    async with unit_of_work() as db:
+        service = HatmService(db)
+        hatm = await db.get(Hatm, hatm_id)
+        if hatm.started_at is None:
+            await service.start(hatm, [])
+        await service.complete(hatm)
+
+
+async def test_poller_resyncs_group_without_rereading_history():
+    group, history = await create_group(participants_count=30)
+    await complete_hatm(history.id)
+
+    # Отдельный hub: события сервисов публикуются в hub процесса, для этого
+    # поллера все изменения пришли из другого процесса
+    hub = EventHub()
+    queue = hub.subscribe(group_topic(group.id))
+    poller = VersionPoller(hub)
+
+    async def resynced() -> bool:
+        await poller.poll_once()
+        messages = [queue.get_nowait() for _ in range(queue.qsize())]
+        return RESYNC_MESSAGE in messages
+
+    assert not await resynced()
+    assert history.id not in poller._group_hatms[group.id]
+
+    # Новый хатм, созданный и завершённый между сверками
+    finished = await create_hatm(group.id)
+    await complete_hatm(finished)
+    assert await resynced()
+    assert not await resynced()
+    assert finished not in poller._group_hatms[group.id]
+
+    # Новый хатм, затем его завершение: версия открытого хатма выросла
+    pending = await create_hatm(group.id)
+    assert await resynced()
+    await complete_hatm(pending)
+    assert await resynced()
+    assert not await resynced()
@@ -0,0 +1,142 @@
+"""
+Webhook бота от регистрации до базы: воркер регистрирует адрес и секрет
+(setWebhook), API проверяет секрет, передаёт апдейт в Dispatcher, обработчик
+отвечает (sendMessage) и его записи фиксируются единицей работы на апдейт.
+Bot API - локальный сервер в процессе теста (TELEGRAM_API_URL).
+"""
+import time
+
+import httpx
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from fastapi import FastAPI
+from sqlalchemy import select
+
+from app import worker
+from app.bot import factory, webhook
+from app.bot.factory import create_bot, get_dispatcher
+from app.bot.webhook import SECRET_HEADER, WEBHOOK_PATH, WebhookHandler, webhook_secret
+from app.database import unit_of_work
+from app.models.models import User
+
+TOKEN = "42:TEST"
+WEBHOOK_BASE_URL = "https://hatm.example"
+TELEGRAM_ID = 770001
+
+
+class FakeBotAPI:
+    """Bot API, который запоминает вызовы и отвечает как Telegram"""
+
+    def __init__(self):
+        self.requests = []
+        self.app = web.Application()
+        self.app.router.add_post("/bot{token}/{method}", self.handle)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        data = dict(await request.post())
+        self.requests.append((method, data))
+        if method == "sendMessage":
+            result = {
+                "message_id": len(self.requests),
+                "date": int(time.time()),
+                "chat": {"id": int(data["chat_id"]), "type": "private"},
+                "text": data["text"],
+            }
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    def calls(self, method: str) -> list:
+        return [data for name, data in self.requests if name == method]
+
+
+@pytest.fixture
+async def bot_api(monkeypatch):
+    api = FakeBotAPI()
+    server = TestServer(api.app)
+    await server.start_server()
+    monkeypatch.setattr(factory, "TELEGRAM_API_URL", str(server.make_url("")).rstrip("/"))
+    monkeypatch.setattr(webhook, "WEBHOOK_BASE_URL", WEBHOOK_BASE_URL)
+    monkeypatch.setattr(worker, "WEBHOOK_BASE_URL", WEBHOOK_BASE_URL)
+    monkeypatch.setattr(worker, "BOT_TOKEN", TOKEN)
+    yield api
+    await server.close()
+
+
+def start_update(telegram_id: int) -> dict:
+    return {
+        "update_id": 1,
+        "message": {
+            "message_id": 1,
+            "date": int(time.time()),
+            "chat": {"id": telegram_id, "type": "private"},
+            "from": {"id": telegram_id, "is_bot": False, "first_name": "Ali"},
+            "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        },
+    }
+
+
+def webhook_client(handler: WebhookHandler) -> httpx.AsyncClient:
+    # Маршрут подключается так же, как в app.main
+    app = FastAPI()
+    app.add_api_route(WEBHOOK_PATH, handler.handle, methods=["POST"])
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://telegram")
+
+
+async def register_webhook() -> None:
+    """Регистрация адреса лидером-воркером (BOT_MODE=webhook)"""
+    runtime = worker.BotRuntime()
+    runtime.bot = create_bot(TOKEN)
+    runtime.dp = get_dispatcher()
+    await runtime._set_webhook()
+    await runtime.bot.session.close()
+
+
+async def test_webhook_end_to_end(bot_api):
+    await register_webhook()
+
+    registered, = bot_api.calls("setWebhook")
+    assert registered["url"] == f"{WEBHOOK_BASE_URL}{WEBHOOK_PATH}"
+    assert registered["secret_token"] == webhook_secret(TOKEN)
+
+    # Веб-воркер создаёт обработчик так же, как app.main
+    handler = WebhookHandler(create_bot(TOKEN), get_dispatcher(), webhook_secret(TOKEN))
+    async with webhook_client(handler) as client:
+        rejected = await client.post(
+            WEBHOOK_PATH, json=start_update(TELEGRAM_ID), headers={SECRET_HEADER: "wrong"}
+        )
+        assert rejected.status_code == 401
+        assert handler.pending == 0
+
+        # Telegram присылает секрет, полученный в setWebhook
+        accepted = await client.post(
+            WEBHOOK_PATH, json=start_update(TELEGRAM_ID), headers={SECRET_HEADER: registered["secret_token"]}
+        )
+        assert accepted.status_code == 200
+    # Дождаться фоновой обработки апдейта и закрыть сессию бота
+    await handler.close()
+
+    replies = bot_api.calls("sendMessage")
+    assert [reply["chat_id"] for reply in replies] == [str(TELEGRAM_ID)]
+    assert "Ali" in replies[0]["text"]
+
+    async with unit_of_work() as db:
+        user = await db.scalar(select(User).where(User.telegram_id == TELEGRAM_ID))
+    assert user is not None
+    assert user.first_name == "Ali"
+
+
+async def test_webhook_rejects_invalid_update(bot_api):
+    handler = WebhookHandler(create_bot(TOKEN), get_dispatcher(), webhook_secret(TOKEN))
+
+    async with webhook_client(handler) as client:
+        response = await client.post(
+            WEBHOOK_PATH, json={"message": "not an update"}, headers={SECRET_HEADER: webhook_secret(TOKEN)}
+        )
+    await handler.close()
+
+    assert response.status_code == 400
+    assert bot_api.requests == []
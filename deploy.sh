@@ -31,6 +31,8 @@ VITE_API_URL=http://46.19.66.253:8000 npm run build
 cd /var/www/hatm-bot/backend
 source venv/bin/activate
 pip install -r requirements.txt
+# Миграции схемы до перезапуска: воркеры стартуют без ALTER TABLE
+python -m app.manage migrate
 deactivate
 
 chown -R www-data:www-data /var/www/hatm-bot
@@ -0,0 +1,44 @@
+// Предсжатие сборки: рядом с каждым текстовым файлом dist кладутся .br и .gz,
+// backend (app/static.py) или nginx (brotli_static/gzip_static) отдают их без сжатия на лету
+import { readdir, readFile, stat, writeFile } from 'node:fs/promises'
+import { join, extname } from 'node:path'
+import { brotliCompressSync, gzipSync, constants } from 'node:zlib'
+
+const DIST = new URL('../dist/', import.meta.url).pathname
+const EXTENSIONS = new Set(['.html', '.js', '.mjs', '.css', '.svg', '.json', '.txt', '.webmanifest'])
+// Меньшие файлы умещаются в один TCP-пакет и без сжатия
+const MIN_SIZE = 1024
+
+async function* walk(dir) {
+  for (const entry of await readdir(dir, { withFileTypes: true })) {
+    const path = join(dir, entry.name)
+    if (entry.isDirectory()) yield* walk(path)
+    else if (EXTENSIONS.has(extname(entry.name))) yield path
+  }
+}
+
+let files = 0
+let original = 0
+let brotli = 0
+for await (const path of walk(DIST)) {
+  if ((await stat(path)).size < MIN_SIZE) continue
+  const content = await readFile(path)
+  const variants = {
+    '.br': brotliCompressSync(content, {
+      params: {
+        [constants.BROTLI_PARAM_QUALITY]: constants.BROTLI_MAX_QUALITY,
+        [constants.BROTLI_PARAM_SIZE_HINT]: content.length,
+      },
+    }),
+    '.gz': gzipSync(content, { level: 9 }),
+  }
+  for (const [suffix, compressed] of Object.entries(variants)) {
+    // Сжатый вариант без выигрыша не нужен: сервер отдаст оригинал
+    if (compressed.length < content.length) await writeFile(path + suffix, compressed)
+  }
+  files += 1
+  original += content.length
+  brotli += Math.min(variants['.br'].length, content.length)
+}
+
+console.log(`compressed ${files} files: ${(original / 1024).toFixed(1)} KiB -> ${(brotli / 1024).toFixed(1)} KiB brotli`)
@@ -6,10 +6,7 @@ interface RequestOptions {
   initData?: string
 }
 
-export async function apiRequest<T>(
-  endpoint: string,
-  options: RequestOptions = {}
-): Promise<T> {
+async function apiFetch(endpoint: string, options: RequestOptions = {}): Promise<Response> {
   const { method = 'GET', body, initData } = options
 
   const headers: Record<string, string> = {
@@ -31,9 +28,71 @@ export async function apiRequest<T>(
     throw new Error(error.detail || 'Request failed')
   }
 
+  return response
+}
+
+export async function apiRequest<T>(
+  endpoint: string,
+  options: RequestOptions = {}
+): Promise<T> {
+  const response = await apiFetch(endpoint, options)
   return response.json()
 }
 
+// Live events (Server-Sent Events через fetch, чтобы передать init data в заголовке)
+export function subscribeEvents<E>(
+  endpoint: string,
+  initData: string,
+  onEvent: (event: E) => void
+): () => void {
+  const controller = new AbortController()
+  let retryDelay = 1000
+
+  const connect = async () => {
+    while (!controller.signal.aborted) {
+      try {
+        const response = await fetch(`${API_URL}${endpoint}`, {
+          headers: { 'X-Telegram-Init-Data': initData, Accept: 'text/event-stream' },
+          signal: controller.signal,
+        })
+        if (!response.ok || !response.body) {
+          // 401/403/404 - переподключаться бессмысленно
+          if (response.status >= 400 && response.status < 500) return
+          throw new Error('Event stream failed')
+        }
+
+        retryDelay = 1000
+        const reader = response.body.pipeThrough(new TextDecoderStream()).getReader()
+        let buffer = ''
+        for (;;) {
+          const { value, done } = await reader.read()
+          if (done) break
+          buffer += value
+          let boundary = buffer.indexOf('\n\n')
+          while (boundary !== -1) {
+            const data = buffer
+              .slice(0, boundary)
+              .split('\n')
+              .filter(line => line.startsWith('data:'))
+              .map(line => line.slice(5))
+              .join('\n')
+            buffer = buffer.slice(boundary + 2)
+            if (data) onEvent(JSON.parse(data) as E)
+            boundary = buffer.indexOf('\n\n')
+          }
+        }
+      } catch {
+        if (controller.signal.aborted) return
+      }
+      await new Promise(resolve => setTimeout(resolve, retryDelay))
+      retryDelay = Math.min(retryDelay * 2, 30000)
+    }
+  }
+
+  connect()
+  return () => controller.abort()
+}
+
 // Types
 export interface User {
   id: number
@@ -68,12 +127,17 @@ export interface Member {
 export interface HatmResponse {
   id: number
   group_id: number
+  sequence_number: number | null
   duration_days: number
   participants_count: number
   status: 'pending' | 'active' | 'completed'
   started_at: string | null
   ends_at: string | null
   created_at: string
+  completed_juzs: number
+  pending_juzs: number
+  debt_juzs: number
+  assigned_participants: number
 }
 
 export interface JuzAssignment {
@@ -99,12 +163,72 @@ export interface HatmProgress {
   juz_assignments: JuzAssignment[]
 }
 
+export interface HatmCounters {
+  completed_juzs: number
+  pending_juzs: number
+  debt_juzs: number
+  assigned_participants: number
+}
+
+interface HatmDelta {
+  hatm_id: number
+  version: number
+  counters: HatmCounters
+}
+
+export type HatmEvent =
+  | { type: 'hello'; hatm_id?: number; group_id?: number; version?: number }
+  | { type: 'resync' }
+  | (HatmDelta & {
+      type: 'juz'
+      juz: Pick<JuzAssignment, 'id' | 'juz_number' | 'status' | 'user_id' | 'completed_at' | 'is_debt'>
+    })
+  | (HatmDelta & {
+      type: 'assigned'
+      user: Pick<JuzAssignment, 'username' | 'first_name'> & { id: number }
+      juzs: Pick<JuzAssignment, 'id' | 'juz_number'>[]
+    })
+  | (HatmDelta & { type: 'status'; status: HatmResponse['status'] })
+
+// Применить дельту из потока событий к загруженному прогрессу
+export function applyHatmEvent(progress: HatmProgress, event: HatmEvent): HatmProgress {
+  if (event.type !== 'juz' && event.type !== 'assigned') return progress
+
+  let assignments = progress.juz_assignments
+  if (event.type === 'juz') {
+    assignments = assignments.map(a => (a.id === event.juz.id ? { ...a, ...event.juz } : a))
+  } else {
+    const assigned = new Set(event.juzs.map(j => j.id))
+    assignments = assignments.map(a =>
+      assigned.has(a.id)
+        ? { ...a, user_id: event.user.id, username: event.user.username, first_name: event.user.first_name }
+        : a
+    )
+  }
+
+  const { completed_juzs, pending_juzs, debt_juzs } = event.counters
+  return {
+    ...progress,
+    completed_juzs,
+    pending_juzs,
+    debt_juzs,
+    progress_percent: Math.round((completed_juzs / progress.total_juzs) * 100 * 10) / 10,
+    juz_assignments: assignments,
+  }
+}
+
 export interface UserJuzStats {
   total_assigned: number
   completed: number
   pending: number
   debts: number
   juzs: JuzAssignment[]
+  next_cursor: string | null
+}
+
+export interface HatmPage {
+  hatms: HatmResponse[]
+  next_cursor: string | null
 }
 
 // API functions
@@ -113,8 +237,11 @@ export const api = {
   getMe: (initData: string) =>
     apiRequest<User>('/api/users/me', { initData }),
 
-  getMyJuzs: (initData: string) =>
-    apiRequest<UserJuzStats>('/api/users/me/juzs', { initData }),
+  getMyJuzs: (initData: string, cursor?: string | null) =>
+    apiRequest<UserJuzStats>(
+      `/api/users/me/juzs${cursor ? `?cursor=${encodeURIComponent(cursor)}` : ''}`,
+      { initData }
+    ),
 
   getMyDebts: (initData: string) =>
     apiRequest<{ debts: JuzAssignment[]; total_debts: number }>('/api/users/me/debts', { initData }),
@@ -136,8 +263,14 @@ export const api = {
     apiRequest<{ message: string }>(`/api/groups/${groupId}/leave`, { method: 'DELETE', initData }),
 
   // Hatms
-  getGroupHatms: (groupId: number, initData: string) =>
-    apiRequest<HatmResponse[]>(`/api/groups/${groupId}/hatms`, { initData }),
+  // Тело - список хатмов, курсор следующей страницы - в заголовке X-Next-Cursor
+  getGroupHatms: async (groupId: number, initData: string, cursor?: string | null): Promise<HatmPage> => {
+    const response = await apiFetch(
+      `/api/groups/${groupId}/hatms${cursor ? `?cursor=${encodeURIComponent(cursor)}` : ''}`,
+      { initData }
+    )
+    return { hatms: await response.json(), next_cursor: response.headers.get('X-Next-Cursor') }
+  },
 
   createHatm: (groupId: number, duration_days: number, participants_count: number, initData: string) =>
     apiRequest<HatmResponse>(`/api/groups/${groupId}/hatms`, {
@@ -155,6 +288,12 @@ export const api = {
   getHatmProgress: (id: number, initData: string) =>
     apiRequest<HatmProgress>(`/api/hatms/${id}/progress`, { initData }),
 
+  subscribeHatmEvents: (id: number, initData: string, onEvent: (event: HatmEvent) => void) =>
+    subscribeEvents<HatmEvent>(`/api/hatms/${id}/events`, initData, onEvent),
+
+  subscribeGroupEvents: (id: number, initData: string, onEvent: (event: HatmEvent) => void) =>
+    subscribeEvents<HatmEvent>(`/api/groups/${id}/events`, initData, onEvent),
+
   // Juz
   completeJuz: (juzId: number, initData: string) =>
     apiRequest<JuzAssignment>(`/api/juzs/${juzId}/complete`, { method: 'POST', initData }),
@@ -1,8 +1,8 @@
-import { useEffect, useState } from 'react'
+import { useEffect, useRef, useState } from 'react'
 import { useParams, useNavigate } from 'react-router-dom'
 import { motion } from 'framer-motion'
 import { useTelegram } from '../hooks/useTelegram'
-import { api, GroupDetail, HatmProgress } from '../api/client'
+import { api, applyHatmEvent, GroupDetail, HatmProgress } from '../api/client'
 import Header from '../components/Header'
 import CircularTracker from '../components/CircularTracker'
 import LoadingSpinner from '../components/LoadingSpinner'
@@ -19,6 +19,7 @@ export default function Group() {
   const [copied, setCopied] = useState(false)
   const [leaving, setLeaving] = useState(false)
   const [leaveError, setLeaveError] = useState<string | null>(null)
+  const activeHatmId = useRef<number | null>(null)
 
   const copyInviteCode = () => {
     if (group) {
@@ -52,22 +53,41 @@ export default function Group() {
     loadGroup()
   }, [id, initData])
 
-  const loadGroup = async () => {
+  // Живые обновления хатмов группы
+  useEffect(() => {
+    if (!initData || !id) return
+
+    return api.subscribeGroupEvents(parseInt(id), initData, event => {
+      if (event.type === 'juz' || event.type === 'assigned') {
+        // Дельты других (завершённых) хатмов группы к прогрессу не относятся
+        if (event.hatm_id === activeHatmId.current) {
+          setProgress(prev => (prev ? applyHatmEvent(prev, event) : prev))
+        }
+      } else {
+        loadGroup(true)
+      }
+    })
+  }, [id, initData])
+
+  const loadGroup = async (silent = false) => {
     if (!initData || !id) return
 
     try {
-      setLoading(true)
+      if (!silent) setLoading(true)
       const groupData = await api.getGroup(parseInt(id), initData)
       setGroup(groupData)
+      activeHatmId.current = groupData.active_hatm?.id ?? null
 
       if (groupData.active_hatm) {
         const progressData = await api.getHatmProgress(groupData.active_hatm.id, initData)
         setProgress(progressData)
+      } else {
+        setProgress(null)
       }
     } catch (err) {
-      setError(err instanceof Error ? err.message : 'Ошибка загрузки')
+      if (!silent) setError(err instanceof Error ? err.message : 'Ошибка загрузки')
     } finally {
-      setLoading(false)
+      if (!silent) setLoading(false)
     }
   }
 
@@ -2,7 +2,7 @@ import { useEffect, useState, useCallback } from 'react'
 import { useParams } from 'react-router-dom'
 import { motion } from 'framer-motion'
 import { useTelegram } from '../hooks/useTelegram'
-import { api, HatmProgress, JuzAssignment, HatmResponse, User } from '../api/client'
+import { api, applyHatmEvent, HatmProgress, JuzAssignment, HatmResponse, User } from '../api/client'
 import Header from '../components/Header'
 import CircularTracker from '../components/CircularTracker'
 import JuzList from '../components/JuzList'
@@ -45,6 +45,36 @@ export default function Hatm() {
     loadHatm()
   }, [loadHatm])
 
+  // Тихое обновление без спиннера - по событиям из потока
+  const refreshHatm = useCallback(async () => {
+    if (!initData || !id) return
+
+    try {
+      const [hatmData, progressData] = await Promise.all([
+        api.getHatm(parseInt(id), initData),
+        api.getHatmProgress(parseInt(id), initData),
+      ])
+      setHatm(hatmData)
+      setProgress(progressData)
+    } catch {
+      // Следующее событие или переподключение повторит попытку
+    }
+  }, [id, initData])
+
+  // Живые обновления: дельты по джузам применяются на месте,
+  // смена статуса, (пере)подключение и resync - перезагрузка снимка
+  useEffect(() => {
+    if (!initData || !id) return
+
+    return api.subscribeHatmEvents(parseInt(id), initData, event => {
+      if (event.type === 'juz' || event.type === 'assigned') {
+        setProgress(prev => (prev ? applyHatmEvent(prev, event) : prev))
+      } else {
+        refreshHatm()
+      }
+    })
+  }, [id, initData, refreshHatm])
+
   const startHatm = async () => {
     if (!initData || !id || !hatm) return
 
@@ -12,6 +12,7 @@ export default function Profile() {
   const [stats, setStats] = useState<UserJuzStats | null>(null)
   const [loading, setLoading] = useState(true)
   const [completing, setCompleting] = useState<number | null>(null)
+  const [loadingMore, setLoadingMore] = useState(false)
 
   useEffect(() => {
     loadStats()
@@ -31,6 +32,21 @@ export default function Profile() {
     }
   }
 
+  // Следующая страница истории джузов (сводка в stats уже по всем джузам)
+  const loadMore = async () => {
+    if (!initData || !stats?.next_cursor || loadingMore) return
+
+    try {
+      setLoadingMore(true)
+      const data = await api.getMyJuzs(initData, stats.next_cursor)
+      setStats(prev => prev && { ...prev, juzs: [...prev.juzs, ...data.juzs], next_cursor: data.next_cursor })
+    } catch (err) {
+      console.error(err)
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
   const completeJuz = async (juzId: number) => {
     if (!initData || completing || !stats) return
 
@@ -226,6 +242,15 @@ export default function Profile() {
                     </div>
                   ))}
                 </div>
+                {stats.next_cursor && (
+                  <button
+                    onClick={loadMore}
+                    disabled={loadingMore}
+                    className="w-full mt-3 py-2 text-sm font-medium text-emerald-700 disabled:opacity-50"
+                  >
+                    {loadingMore ? 'Загрузка...' : 'Показать ещё'}
+                  </button>
+                )}
               </motion.div>
             )}
           </>